@@ -0,0 +1,15 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def inline_thumbnails(settings):
+    """Миниатюры в тестах из tests/ считаются сразу: пул процессов
+    дописывал бы файлы во временный MEDIA_ROOT уже после его удаления."""
+    settings.POST_THUMBNAIL_WORKERS = 0
+
+
+@pytest.fixture(autouse=True)
+def strict_query_budgets(settings):
+    """Как StrictQueryBudgetRunner у manage.py test: ответ сверх бюджета
+    своего маршрута роняет тест."""
+    settings.QUERY_BUDGET_STRICT = True
@@ -0,0 +1,31 @@
+from django.urls import reverse
+
+
+def serialize_post(post):
+    return {
+        'id': post.pk,
+        'text': post.text,
+        'pub_date': post.pub_date.isoformat(),
+        'updated_at': post.updated_at.isoformat(),
+        'author': post.author.username,
+        'group': post.group.slug if post.group_id else None,
+        'image': post.image.url if post.image else None,
+        'thumbnail': post.thumbnail_url or None,
+        'comment_count': post.comment_count,
+        'last_commented_at': (
+            post.last_commented_at.isoformat()
+            if post.last_commented_at else None
+        ),
+        'url': reverse('posts:post_detail', args=(post.pk,)),
+    }
+
+
+def serialize_comment(comment):
+    return {
+        'id': comment.pk,
+        'post': comment.post_id,
+        'author': comment.author.username,
+        'text': comment.text,
+        'created': comment.created.isoformat(),
+        'updated_at': comment.updated_at.isoformat(),
+    }
@@ -0,0 +1,275 @@
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from api.views import CHANGES_PER_PAGE
+
+from posts.models import ChangeLog, Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+@override_settings(CACHE_SHARED=True)
+class ApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.posts = [
+            Post.objects.create(
+                author=cls.user, group=cls.group, text='Пост %s' % number
+            )
+            for number in range(12)
+        ]
+        cls.post = cls.posts[-1]
+        Comment.objects.create(post=cls.post, author=cls.user, text='Ок')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_feeds_pages(self):
+        """Ленты отдают JSON по курсорам, из одних и тех же постов."""
+        urls = (
+            reverse('api:post_list'),
+            reverse('api:group_posts', args=(self.group.slug,)),
+            reverse('api:profile_posts', args=(self.user.username,)),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                data = self.client.get(url).json()
+                self.assertEqual(len(data['results']), 10)
+                self.assertEqual(data['results'][0]['id'], self.post.pk)
+                self.assertEqual(data['results'][0]['group'], 'test-slug')
+                self.assertIsNone(data['previous'])
+                second = self.client.get(data['next']).json()
+                self.assertEqual(len(second['results']), 2)
+                self.assertIsNone(second['next'])
+
+    def test_post_and_comments(self):
+        data = self.client.get(
+            reverse('api:post_detail', args=(self.post.pk,))
+        ).json()
+        self.assertEqual(data['text'], self.post.text)
+        self.assertEqual(data['author'], 'auth')
+        comments = self.client.get(data['comments']).json()
+        self.assertEqual(comments['results'][0]['text'], 'Ок')
+
+    def test_unknown_objects(self):
+        urls = (
+            reverse('api:group_posts', args=('missing',)),
+            reverse('api:profile_posts', args=('missing',)),
+            reverse('api:post_detail', args=(0,)),
+            reverse('api:post_comments', args=(0,)),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_not_modified(self):
+        """Повтор с If-None-Match получает 304 за пару запросов к БД."""
+        url = reverse('api:group_posts', args=(self.group.slug,))
+        response = self.client.get(url)
+        self.assertIn('Last-Modified', response)
+        with CaptureQueriesContext(connection) as queries:
+            repeat = self.client.get(
+                url, HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(repeat.status_code, 304)
+        self.assertLessEqual(len(queries), 2)
+        repeat = self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(repeat.status_code, 304)
+
+    def test_last_modified_follows_changes(self):
+        """Удаление и комментарий сдвигают Last-Modified"""
+        group_feed = reverse('api:group_posts', args=(self.group.slug,))
+        detail = reverse('api:post_detail', args=(self.posts[1].pk,))
+        feed = reverse('api:post_list')
+        changes = (
+            ([group_feed], lambda: Post.objects.filter(
+                pk=self.posts[-1].pk
+            ).first().delete()),
+            ([detail, feed], lambda: Comment.objects.create(
+                post=self.posts[1], author=self.user, text='Ещё'
+            )),
+        )
+        for shift, (urls, change) in enumerate(changes, start=1):
+            last_modified = {
+                url: self.client.get(url)['Last-Modified'] for url in urls
+            }
+            # HTTP-дата с точностью до секунды: изменение — позже.
+            with mock.patch(
+                'posts.caching.time.time',
+                return_value=time.time() + 5 * shift
+            ):
+                change()
+            for url in urls:
+                with self.subTest(url=url):
+                    response = self.client.get(
+                        url, HTTP_IF_MODIFIED_SINCE=last_modified[url]
+                    )
+                    self.assertEqual(response.status_code, 200)
+
+    def test_etag_changes(self):
+        """ETag меняется при новом посте, правке, удалении и комментарии."""
+        feed = reverse('api:post_list')
+        comments = reverse('api:post_comments', args=(self.post.pk,))
+        changes = (
+            (feed, lambda: Post.objects.create(
+                author=self.user, text='Новый'
+            )),
+            (feed, lambda: Post.objects.filter(
+                pk=self.posts[0].pk
+            ).first().delete()),
+            (comments, lambda: Comment.objects.create(
+                post=self.post, author=self.user, text='Ещё'
+            )),
+        )
+        for url, change in changes:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                change()
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+        post = self.posts[1]
+        url = reverse('api:post_detail', args=(post.pk,))
+        etag = self.client.get(url)['ETag']
+        post.text = 'Правка'
+        post.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()['text'], 'Правка')
+
+
+class ChangesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=cls.reader, author=cls.user)
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.other = Group.objects.create(title='Другая', slug='other')
+        cls.post = Post.objects.create(
+            author=cls.user, group=cls.group, text='Пост'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.since = ChangeLog.objects.last_seq()
+
+    def changes(self, url, since=None):
+        return self.client.get(url, {
+            'since': self.since if since is None else since
+        }).json()
+
+    def test_delta_per_feed(self):
+        """Каждая лента отдаёт только свои изменения после номера."""
+        urls = {
+            reverse('api:post_changes'): True,
+            reverse('api:group_changes', args=('group',)): True,
+            reverse('api:group_changes', args=('other',)): False,
+            reverse('api:profile_changes', args=('auth',)): True,
+            reverse('api:profile_changes', args=('reader',)): False,
+        }
+        for url in urls:
+            with self.subTest(url=url):
+                data = self.changes(url)
+                self.assertEqual(data['results'], [])
+                self.assertEqual(data['since'], self.since)
+        Comment.objects.create(post=self.post, author=self.user, text='Ок')
+        fresh = Post.objects.create(
+            author=self.user, group=self.group, text='Новый'
+        )
+        for url, affected in urls.items():
+            with self.subTest(url=url):
+                data = self.changes(url)
+                ids = [post['id'] for post in data['results']]
+                self.assertEqual(
+                    ids, [self.post.pk, fresh.pk] if affected else []
+                )
+                if affected:
+                    self.assertEqual(data['results'][0]['comment_count'], 1)
+                self.assertIsNone(data['next'])
+                self.assertEqual(
+                    self.changes(url, data['since'])['results'], []
+                )
+
+    def test_moves_and_deletions(self):
+        """Перенесённый и удалённый пост приходят в deleted."""
+        post = Post.objects.create(
+            author=self.user, group=self.group, text='Переезд'
+        )
+        group_url = reverse('api:group_changes', args=('group',))
+        other_url = reverse('api:group_changes', args=('other',))
+        self.since = ChangeLog.objects.last_seq()
+        post.group = self.other
+        post.save()
+        self.assertEqual(self.changes(group_url)['deleted'], [post.pk])
+        self.assertEqual(self.changes(other_url)['results'][0]['id'], post.pk)
+        self.since = ChangeLog.objects.last_seq()
+        post_id = post.pk
+        post.delete()
+        data = self.changes(reverse('api:post_changes'))
+        self.assertEqual(data['deleted'], [post_id])
+        self.assertEqual(self.changes(other_url)['deleted'], [post_id])
+
+    def test_follow_changes(self):
+        url = reverse('api:follow_changes')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.force_login(self.reader)
+        Post.objects.create(author=self.reader, text='Свой')
+        fresh = Post.objects.create(author=self.user, text='Новый')
+        with self.assertNumQueries(5):
+            data = self.changes(url)
+        self.assertEqual(
+            [post['id'] for post in data['results']], [fresh.pk]
+        )
+        self.assertNotIn('reset', data)
+
+    def test_follow_set_change_resets(self):
+        """После отписки или подписки лента просит начать с since=0"""
+        url = reverse('api:follow_changes')
+        self.client.force_login(self.reader)
+        Follow.objects.filter(user=self.reader).delete()
+        data = self.changes(url)
+        self.assertTrue(data['reset'])
+        self.assertEqual(data['since'], 0)
+        self.assertEqual(self.changes(url, since=0)['results'], [])
+        self.since = ChangeLog.objects.last_seq()
+        self.assertNotIn('reset', self.changes(url))
+        Follow.objects.create(user=self.reader, author=self.user)
+        self.assertTrue(self.changes(url)['reset'])
+        data = self.changes(url, since=0)
+        self.assertEqual(
+            [post['id'] for post in data['results']], [self.post.pk]
+        )
+
+    def test_paging_and_bad_cursor(self):
+        posts = Post.objects.bulk_create(
+            Post(author=self.user, text=f'Пост {number}')
+            for number in range(CHANGES_PER_PAGE + 5)
+        )
+        ChangeLog.objects.record_created('post', (
+            (post.pk, post.pk, self.user.pk, None)
+            for post in Post.objects.filter(pk__gt=self.post.pk)
+        ))
+        url = reverse('api:post_changes')
+        with self.assertNumQueries(2):
+            data = self.changes(url)
+        self.assertEqual(len(data['results']), CHANGES_PER_PAGE)
+        data = self.client.get(data['next']).json()
+        self.assertEqual(len(data['results']), len(posts) - CHANGES_PER_PAGE)
+        self.assertIsNone(data['next'])
+        response = self.client.get(url, {'since': 'x'})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,22 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'api'
+
+urlpatterns = [
+    path('posts/', views.post_list, name='post_list'),
+    path('posts/changes/', views.post_changes, name='post_changes'),
+    path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    path('posts/<int:post_id>/comments/',
+         views.post_comments, name='post_comments'),
+    path('groups/<slug:slug>/posts/',
+         views.group_posts, name='group_posts'),
+    path('groups/<slug:slug>/posts/changes/',
+         views.group_changes, name='group_changes'),
+    path('profiles/<str:username>/posts/',
+         views.profile_posts, name='profile_posts'),
+    path('profiles/<str:username>/posts/changes/',
+         views.profile_changes, name='profile_changes'),
+    path('follow/changes/', views.follow_changes, name='follow_changes'),
+]
@@ -0,0 +1,242 @@
+"""Read-only JSON API лент.
+
+Ответы строятся из тех же querysets, что и HTML-ленты, с курсорной
+пагинацией. ETag собирается из поколений кеша затронутых областей, а
+Last-Modified — из времени их последнего изменения и самой свежей даты
+в выборке, поэтому повторный опрос без изменений получает 304, не
+выбирая страницу.
+
+Для опроса лент есть /changes/?since=<номер>: посты, изменённые после
+номера журнала ChangeLog, и id ушедших из ленты. Журнал выбирается по
+индексу ленты, так что опрос стоит пропорционально новой активности, а
+не размеру ленты.
+
+Удаления, правки и комментарии сдвигают метку изменения областей, так
+что и If-None-Match, и If-Modified-Since после них получают 200.
+"""
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views.decorators.http import require_safe
+
+from posts.caching import (
+    INDEX, author_scope, conditional, group_scope, latest, post_scope,
+    request_memo
+)
+from posts.models import ChangeLog, Comment, Follow, Group, Post, User
+from posts.paginator import CursorPaginator
+from posts.views import POSTS_PER_PAGE, get_page_obj
+
+from .serializers import serialize_comment, serialize_post
+
+COMMENTS_PER_PAGE = 50
+CHANGES_PER_PAGE = 100
+
+
+def _group(request, slug):
+    def find():
+        try:
+            return Group.objects.by_slug(slug)
+        except Group.DoesNotExist:
+            raise Http404
+    return request_memo(request, 'group', find)
+
+
+def _author(request, username):
+    return request_memo(request, 'author', lambda: get_object_or_404(
+        User.objects.only('pk'), username=username
+    ))
+
+
+def _post(request, post_id):
+    return request_memo(request, 'post', lambda: get_object_or_404(
+        Post.objects.for_feed(), pk=post_id
+    ))
+
+
+def _link(request, cursor):
+    if cursor is None:
+        return None
+    return request.build_absolute_uri('%s?cursor=%s' % (
+        request.path, cursor
+    ))
+
+
+def paginated_response(request, paginator, serialize):
+    page = get_page_obj(request, paginator)
+    return JsonResponse({
+        'results': [serialize(obj) for obj in page],
+        'next': _link(request, page.next_cursor),
+        'previous': _link(request, page.previous_cursor),
+    })
+
+
+def changes_response(request, changes, posts, reset=None):
+    """Посты posts, затронутые изменениями changes после номера since.
+
+    Пост, которого больше нет в posts (удалён или перенесён из
+    группы), попадает в deleted. since ответа — номер для следующего
+    опроса, next — ссылка, если изменений больше страницы. Если
+    reset(since) истинно, сама лента изменилась целиком: ответ с
+    reset просит клиента выбросить копию и начать заново с since=0.
+    """
+    try:
+        since = int(request.GET.get('since', 0))
+    except ValueError:
+        return HttpResponseBadRequest('since должен быть числом')
+    if since and reset is not None and reset(since):
+        return JsonResponse({
+            'results': [],
+            'deleted': [],
+            'reset': True,
+            'since': 0,
+            'next': request.build_absolute_uri(
+                '%s?since=0' % request.path
+            ),
+        })
+    rows = list(changes.since(since).values_list(
+        'pk', 'post'
+    )[:CHANGES_PER_PAGE + 1])
+    more = len(rows) > CHANGES_PER_PAGE
+    rows = rows[:CHANGES_PER_PAGE]
+    if rows:
+        since = rows[-1][0]
+    post_ids = list(dict.fromkeys(
+        post_id for _, post_id in rows if post_id
+    ))
+    found = posts.for_feed().in_bulk(post_ids)
+    return JsonResponse({
+        'results': [
+            serialize_post(found[pk]) for pk in post_ids if pk in found
+        ],
+        'deleted': [pk for pk in post_ids if pk not in found],
+        'since': since,
+        'next': request.build_absolute_uri(
+            '%s?since=%s' % (request.path, since)
+        ) if more else None,
+    })
+
+
+@require_safe
+def post_changes(request):
+    return changes_response(
+        request,
+        ChangeLog.objects.exclude(kind='follow'),
+        Post.objects.all()
+    )
+
+
+@require_safe
+def group_changes(request, slug):
+    group = _group(request, slug)
+    return changes_response(
+        request,
+        ChangeLog.objects.filter(group=group),
+        Post.objects.filter(group=group)
+    )
+
+
+@require_safe
+def profile_changes(request, username):
+    author = _author(request, username)
+    return changes_response(
+        request,
+        ChangeLog.objects.filter(author=author),
+        Post.objects.filter(author=author)
+    )
+
+
+@require_safe
+def follow_changes(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({'detail': 'Нужен вход'}, status=401)
+    authors = Follow.objects.filter(user=request.user).values('author')
+    # После подписки или отписки старые посты входят в ленту или уходят
+    # из неё без новых записей в журнале: нужна полная перезагрузка.
+    follows = ChangeLog.objects.filter(
+        kind='follow', object_id=request.user.pk
+    )
+    return changes_response(
+        request,
+        ChangeLog.objects.filter(author__in=authors),
+        Post.objects.filter(author__in=authors),
+        reset=lambda since: follows.filter(pk__gt=since).exists()
+    )
+
+
+@require_safe
+@conditional(
+    lambda request: [INDEX],
+    lambda request: latest(Post.objects.all(), 'updated_at')
+)
+def post_list(request):
+    return paginated_response(
+        request,
+        CursorPaginator(Post.objects.for_feed(), POSTS_PER_PAGE),
+        serialize_post
+    )
+
+
+@require_safe
+@conditional(
+    lambda request, slug: [group_scope(_group(request, slug).pk)],
+    lambda request, slug: latest(
+        Post.objects.filter(group=_group(request, slug)), 'pub_date'
+    )
+)
+def group_posts(request, slug):
+    posts = _group(request, slug).group_posts.for_feed()
+    return paginated_response(
+        request, CursorPaginator(posts, POSTS_PER_PAGE), serialize_post
+    )
+
+
+@require_safe
+@conditional(
+    lambda request, username: [author_scope(_author(request, username).pk)],
+    lambda request, username: latest(
+        Post.objects.filter(author=_author(request, username)), 'pub_date'
+    )
+)
+def profile_posts(request, username):
+    posts = Post.objects.filter(
+        author=_author(request, username)
+    ).for_feed()
+    return paginated_response(
+        request, CursorPaginator(posts, POSTS_PER_PAGE), serialize_post
+    )
+
+
+@require_safe
+@conditional(
+    lambda request, post_id: [post_scope(post_id)],
+    lambda request, post_id: _post(request, post_id).updated_at
+)
+def post_detail(request, post_id):
+    data = serialize_post(_post(request, post_id))
+    data['comments'] = request.build_absolute_uri(
+        reverse('api:post_comments', args=(post_id,))
+    )
+    return JsonResponse(data)
+
+
+@require_safe
+@conditional(
+    lambda request, post_id: [post_scope(post_id)],
+    lambda request, post_id: latest(
+        Comment.objects.filter(post_id=post_id), 'created'
+    )
+)
+def post_comments(request, post_id):
+    if not Post.objects.filter(pk=post_id).exists():
+        raise Http404
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        'author'
+    ).only('post', 'text', 'created', 'updated_at', 'author__username')
+    return paginated_response(
+        request,
+        CursorPaginator(
+            comments, COMMENTS_PER_PAGE, keys=('-created', '-pk')
+        ),
+        serialize_comment
+    )
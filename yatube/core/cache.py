@@ -0,0 +1,210 @@
+"""Кеш в файле SQLite, общий для всех процессов на одной машине.
+
+В отличие от LocMemCache, где у каждого воркера gunicorn своя холодная
+копия, здесь процессы видят одни и те же ключи, а incr атомарен между
+процессами, поэтому на нём можно держать счётчики поколений.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)'
+)
+ALIVE = '(expires IS NULL OR expires > ?)'
+CULL_EVERY = 100
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = location
+        self._local = threading.local()
+        self._writes = 0
+
+    @property
+    def connection(self):
+        # Соединение своё у каждого потока и каждого процесса после fork.
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(SCHEMA)
+            local.connection = connection
+            local.pid = os.getpid()
+        return local.connection
+
+    def _expires(self, timeout):
+        # get_backend_timeout уже возвращает абсолютное время истечения.
+        return self.get_backend_timeout(timeout)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        row = self.connection.execute(
+            'SELECT value FROM cache WHERE key = ? AND ' + ALIVE,
+            (key, time.time())
+        ).fetchone()
+        if row is None:
+            return default
+        return pickle.loads(row[0])
+
+    def get_many(self, keys, version=None):
+        keys = {self.make_key(key, version=version): key for key in keys}
+        for key in keys:
+            self.validate_key(key)
+        if not keys:
+            return {}
+        rows = self.connection.execute(
+            'SELECT key, value FROM cache WHERE key IN (%s) AND %s' % (
+                ', '.join('?' * len(keys)), ALIVE
+            ),
+            list(keys) + [time.time()]
+        )
+        return {keys[key]: pickle.loads(value) for key, value in rows}
+
+    def _write(self, key, value, timeout, only_missing=False):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires = self._expires(timeout)
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            if only_missing:
+                cursor = connection.execute(
+                    'UPDATE cache SET value = ?, expires = ? '
+                    'WHERE key = ? AND NOT ' + ALIVE,
+                    (data, expires, key, time.time())
+                )
+                if not cursor.rowcount:
+                    cursor = connection.execute(
+                        'INSERT OR IGNORE INTO cache VALUES (?, ?, ?)',
+                        (key, data, expires)
+                    )
+                written = bool(cursor.rowcount)
+            else:
+                connection.execute(
+                    'INSERT OR REPLACE INTO cache VALUES (?, ?, ?)',
+                    (key, data, expires)
+                )
+                written = True
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        self._maybe_cull()
+        return written
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._write(key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._write(key, value, timeout, only_missing=True)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self._expires(timeout)
+        rows = []
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            rows.append(
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires)
+            )
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache VALUES (?, ?, ?)', rows
+            )
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        self._maybe_cull()
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        cursor = self.connection.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? AND ' + ALIVE,
+            (self._expires(timeout), key, time.time())
+        )
+        return bool(cursor.rowcount)
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ? AND ' + ALIVE,
+                (key, time.time())
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            connection.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key)
+            )
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return value
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self.connection.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self.delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        row = self.connection.execute(
+            'SELECT 1 FROM cache WHERE key = ? AND ' + ALIVE,
+            (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def clear(self):
+        self.connection.execute('DELETE FROM cache')
+
+    def _maybe_cull(self):
+        self._writes += 1
+        if self._writes % CULL_EVERY:
+            return
+        connection = self.connection
+        connection.execute(
+            'DELETE FROM cache WHERE expires <= ?', (time.time(),)
+        )
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            self.clear()
+        else:
+            connection.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                'ORDER BY expires IS NULL, expires LIMIT ?)',
+                (count // self._cull_frequency,)
+            )
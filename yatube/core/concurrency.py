@@ -0,0 +1,51 @@
+"""Параллельный запуск независимых частей view.
+
+Аналог asyncio.gather для синхронных view: в Django 2.2 нет ASGI и
+sync_to_async, поэтому функции уходят в общий пул потоков VIEW_WORKERS,
+каждая на своём соединении с БД, а первая выполняется в потоке запроса.
+При VIEW_WORKERS = 0 все выполняются по очереди.
+
+Запросы из пула не видят незакоммиченной транзакции запроса и не
+попадают в счётчики PerfMiddleware и QueryBudgetMiddleware. На
+PostgreSQL держите CONN_MAX_AGE > 0, иначе каждая задача открывает
+новое соединение.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = None
+_executor_pid = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor, _executor_pid
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                settings.VIEW_WORKERS, thread_name_prefix='view'
+            )
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def _run(func):
+    try:
+        return func()
+    finally:
+        # Как после запроса: соединение потока закрывается по CONN_MAX_AGE.
+        close_old_connections()
+
+
+def gather(*funcs):
+    """Результаты funcs в их порядке; ошибка функции пробрасывается."""
+    if settings.VIEW_WORKERS <= 0 or len(funcs) < 2:
+        return [func() for func in funcs]
+    executor = get_executor()
+    futures = [executor.submit(_run, func) for func in funcs[1:]]
+    first = funcs[0]()
+    return [first] + [future.result() for future in futures]
@@ -0,0 +1,60 @@
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+
+def run_worker(backend, location, requests, keys, seed):
+    """Имитирует воркер: читает ключ, при промахе «рендерит» и кладёт."""
+    cache = import_string(backend)(
+        location, {'OPTIONS': {'MAX_ENTRIES': keys * 2}}
+    )
+    generator = random.Random(seed)
+    hits = 0
+    for _ in range(requests):
+        key = 'page:%d' % generator.randrange(keys)
+        if cache.get(key) is None:
+            cache.set(key, 'x' * 2048, 300)
+        else:
+            hits += 1
+    return hits
+
+
+class Command(BaseCommand):
+    help = 'Доля попаданий в кеш при нескольких процессах-воркерах'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--requests', type=int, default=2000,
+                            help='запросов на один воркер')
+        parser.add_argument('--keys', type=int, default=1000,
+                            help='число разных страниц')
+        parser.add_argument('--backend', action='append',
+                            choices=sorted(settings.CACHE_BACKENDS),
+                            help='по умолчанию все')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        total = workers * options['requests']
+        context = multiprocessing.get_context('fork')
+        for name in options['backend'] or sorted(settings.CACHE_BACKENDS):
+            with tempfile.TemporaryDirectory() as directory:
+                location = os.path.join(directory, 'cache')
+                tasks = [
+                    (settings.CACHE_BACKENDS[name], location,
+                     options['requests'], options['keys'], seed)
+                    for seed in range(workers)
+                ]
+                started = time.perf_counter()
+                with context.Pool(workers) as pool:
+                    hits = sum(pool.starmap(run_worker, tasks))
+                elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'{name:<8} воркеров: {workers}  попаданий: '
+                f'{hits / total:6.1%}  запросов/с: {total / elapsed:9.0f}'
+            )
@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core import perf
+
+
+class Command(BaseCommand):
+    help = 'Гистограммы времени ответа по view, собранные PerfMiddleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true',
+                            help='вывести как JSON')
+
+    def handle(self, *args, **options):
+        report = perf.histograms()
+        if not perf.is_shared():
+            self.stderr.write(
+                'Кеш гистограмм свой у каждого процесса, здесь только '
+                'замеры этой консоли: включите YATUBE_CACHE=sqlite'
+            )
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(
+            f'{"view":<28}{"замеров":>9}{"p50":>7}{"p95":>7}{"p99":>7}'
+            f'{"SQL":>7}{"SQL, мс":>9}'
+        )
+        for name, row in sorted(report.items()):
+            self.stdout.write(
+                f'{name:<28}{row["count"]:>9}{row["p50_ms"]:>7}'
+                f'{row["p95_ms"]:>7}{row["p99_ms"]:>7}'
+                f'{row["queries_avg"]:>7.1f}{row["db_ms_avg"]:>9.2f}'
+            )
@@ -0,0 +1,280 @@
+"""Замеры запросов: SQL, шаблоны, кеш и миниатюры.
+
+PerfMiddleware выбирает долю запросов PERF_SAMPLE_RATE и для каждой
+из них собирает число и время SQL-запросов, время рендеринга шаблонов,
+попадания и промахи кеша и время подготовки миниатюр (perf.timed).
+Итог уходит в заголовок Server-Timing, в лог yatube.perf строкой JSON
+и в гистограммы по view, которые лежат в отдельном кеше PERF_CACHE и
+не вытесняются записями лент. Со всех процессов их собирает только
+общий кеш (sqlite); с locmem каждый процесс видит свои гистограммы, и
+perf_report из новой консоли пуст. Запросы вне выборки платят только
+за одну проверку random().
+"""
+import json
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.template.backends.django import Template
+from django.urls import URLPattern, get_resolver
+
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+PERF_CACHE = 'perf'
+HISTOGRAM_TIMEOUT = 60 * 60 * 24 * 7
+
+logger = logging.getLogger('yatube.perf')
+
+_local = threading.local()
+_installed = False
+
+
+class Recorder:
+    def __init__(self):
+        self.queries = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.timings = defaultdict(float)
+
+
+def current():
+    return getattr(_local, 'recorder', None)
+
+
+@contextmanager
+def timed(name):
+    """Добавляет время блока к timings[name] текущего замера."""
+    recorder = current()
+    if recorder is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.timings[name] += time.perf_counter() - started
+
+
+def _db_wrapper(execute, sql, params, many, context):
+    recorder = current()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.queries += 1
+        recorder.timings['db'] += time.perf_counter() - started
+
+
+def _timed_render(render):
+    @wraps(render)
+    def wrapper(self, *args, **kwargs):
+        with timed('template'):
+            return render(self, *args, **kwargs)
+    return wrapper
+
+
+def _counted_get(get):
+    @wraps(get)
+    def wrapper(self, key, default=None, version=None):
+        value = get(self, key, default, version)
+        recorder = current()
+        if recorder is not None:
+            if value is default:
+                recorder.cache_misses += 1
+            else:
+                recorder.cache_hits += 1
+        return value
+    return wrapper
+
+
+def _counted_get_many(get_many):
+    @wraps(get_many)
+    def wrapper(self, keys, version=None):
+        recorder = current()
+        if recorder is None:
+            return get_many(self, keys, version)
+        keys = list(keys)
+        # Базовый get_many вызывает get, его промахи не считаем дважды.
+        _local.recorder = None
+        try:
+            found = get_many(self, keys, version)
+        finally:
+            _local.recorder = recorder
+        recorder.cache_hits += len(found)
+        recorder.cache_misses += len(keys) - len(found)
+        return found
+    return wrapper
+
+
+def install():
+    """Один раз оборачивает рендеринг шаблонов и чтение кеша."""
+    global _installed
+    if _installed:
+        return
+    Template.render = _timed_render(Template.render)
+    backends = {type(caches[alias]) for alias in settings.CACHES}
+    for backend in backends:
+        backend.get = _counted_get(backend.get)
+        backend.get_many = _counted_get_many(backend.get_many)
+    _installed = True
+
+
+def bucket(milliseconds):
+    for bound in BUCKETS_MS:
+        if milliseconds <= bound:
+            return str(bound)
+    return 'inf'
+
+
+def get_cache():
+    return caches[PERF_CACHE]
+
+
+def is_shared():
+    """Видны ли гистограммы других процессов."""
+    return settings.CACHES[PERF_CACHE]['BACKEND'] != (
+        'django.core.cache.backends.locmem.LocMemCache'
+    )
+
+
+def _incr(key, delta):
+    cache = get_cache()
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, HISTOGRAM_TIMEOUT):
+            cache.incr(key, delta)
+
+
+def record_histogram(view_name, recorder, total):
+    prefix = 'perf:%s:' % view_name
+    _incr(prefix + 'count', 1)
+    _incr(prefix + 'bucket:' + bucket(total * 1000), 1)
+    _incr(prefix + 'queries', recorder.queries)
+    _incr(prefix + 'db_us', int(recorder.timings['db'] * 1e6))
+
+
+def route_names(patterns=None, namespace=None):
+    """Имена всех маршрутов вида 'posts:index'."""
+    if patterns is None:
+        patterns = get_resolver().url_patterns
+    names = []
+    for pattern in patterns:
+        if isinstance(pattern, URLPattern):
+            if pattern.name:
+                names.append(
+                    '%s:%s' % (namespace, pattern.name)
+                    if namespace else pattern.name
+                )
+            continue
+        inner = pattern.namespace
+        if namespace and inner:
+            inner = '%s:%s' % (namespace, inner)
+        names.extend(route_names(pattern.url_patterns, inner or namespace))
+    return names
+
+
+def percentile(buckets, count, fraction):
+    seen = 0
+    for bound in BUCKETS_MS + ('inf',):
+        seen += buckets.get(str(bound), 0)
+        if seen >= count * fraction:
+            return str(bound)
+    return 'inf'
+
+
+def histograms():
+    """Сводка по view: число замеров, перцентили по корзинам, SQL."""
+    cache = get_cache()
+    counts = cache.get_many(
+        ['perf:%s:count' % name for name in route_names()]
+    )
+    report = {}
+    for key, count in counts.items():
+        name = key[len('perf:'):-len(':count')]
+        prefix = 'perf:%s:' % name
+        bucket_keys = [
+            prefix + 'bucket:%s' % bound for bound in BUCKETS_MS + ('inf',)
+        ]
+        values = cache.get_many(
+            bucket_keys + [prefix + 'queries', prefix + 'db_us']
+        )
+        buckets = {
+            key.rsplit(':', 1)[1]: values[key]
+            for key in bucket_keys if key in values
+        }
+        report[name] = {
+            'count': count,
+            'buckets_ms': buckets,
+            'p50_ms': percentile(buckets, count, 0.5),
+            'p95_ms': percentile(buckets, count, 0.95),
+            'p99_ms': percentile(buckets, count, 0.99),
+            'queries_avg': values.get(prefix + 'queries', 0) / count,
+            'db_ms_avg': values.get(prefix + 'db_us', 0) / count / 1000,
+        }
+    return report
+
+
+def server_timing(recorder, total):
+    timings = recorder.timings
+    parts = [
+        'db;dur=%.1f;desc="%d queries"' % (
+            timings['db'] * 1000, recorder.queries
+        ),
+        'template;dur=%.1f' % (timings['template'] * 1000),
+        'cache;desc="%d hits, %d misses"' % (
+            recorder.cache_hits, recorder.cache_misses
+        ),
+    ]
+    if 'thumbnail' in timings:
+        parts.append('thumbnail;dur=%.1f' % (timings['thumbnail'] * 1000))
+    parts.append('total;dur=%.1f' % (total * 1000))
+    return ', '.join(parts)
+
+
+class PerfMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install()
+
+    def __call__(self, request):
+        if random.random() >= settings.PERF_SAMPLE_RATE:
+            return self.get_response(request)
+        recorder = _local.recorder = Recorder()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(_db_wrapper)
+                    )
+                response = self.get_response(request)
+        finally:
+            _local.recorder = None
+        total = time.perf_counter() - started
+        match = request.resolver_match
+        view_name = match.view_name if match else 'unresolved'
+        response['Server-Timing'] = server_timing(recorder, total)
+        logger.info(json.dumps({
+            'view': view_name,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'queries': recorder.queries,
+            'db_ms': round(recorder.timings['db'] * 1000, 1),
+            'template_ms': round(recorder.timings['template'] * 1000, 1),
+            'thumbnail_ms': round(recorder.timings['thumbnail'] * 1000, 1),
+            'cache_hits': recorder.cache_hits,
+            'cache_misses': recorder.cache_misses,
+        }))
+        if match:
+            record_histogram(view_name, recorder, total)
+        return response
@@ -0,0 +1,95 @@
+"""Бюджет SQL-запросов на маршрут.
+
+QUERY_BUDGETS задаёт, сколько запросов может сделать view с данным
+именем маршрута вместе с сессией и пользователем. QueryBudgetMiddleware
+считает запросы каждого ответа; при превышении пишет в лог
+yatube.queries отпечатки SQL, самые частые первыми, так что N+1 видно
+по повторам. С QUERY_BUDGET_STRICT вместо этого бросается
+QueryBudgetExceeded, и тест, сделавший запрос, падает.
+
+У каждого маршрута posts и api должен быть бюджет либо место в
+QUERY_BUDGET_EXEMPT — для потоковых ответов, чьи запросы идут уже после
+middleware. Строгий режим включают StrictQueryBudgetRunner
+(manage.py test) и фикстура в conftest.py (py.test).
+"""
+import logging
+import re
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.test.runner import DiscoverRunner
+
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+\b')
+SPACE_RE = re.compile(r'\s+')
+TOP_FINGERPRINTS = 5
+
+logger = logging.getLogger('yatube.queries')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def fingerprint(sql):
+    """SQL без значений: одинаковые запросы с разными параметрами
+    дают один отпечаток."""
+    sql = SPACE_RE.sub(' ', sql.strip())
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    sql = STRING_RE.sub('?', sql)
+    return NUMBER_RE.sub('?', sql)
+
+
+def describe(view_name, budget, statements):
+    fingerprints = Counter()
+    for sql, count in statements.items():
+        fingerprints[fingerprint(sql)] += count
+    lines = [
+        '%s: %d SQL-запросов при бюджете %d' % (
+            view_name, sum(statements.values()), budget
+        )
+    ]
+    lines.extend(
+        '%5d x %s' % (count, sql)
+        for sql, count in fingerprints.most_common(TOP_FINGERPRINTS)
+    )
+    return '\n'.join(lines)
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        statements = Counter()
+
+        def count(execute, sql, params, many, context):
+            statements[sql] += 1
+            return execute(sql, params, many, context)
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count))
+            response = self.get_response(request)
+        match = request.resolver_match
+        if match is None:
+            return response
+        budget = settings.QUERY_BUDGETS.get(match.view_name)
+        if budget is None or sum(statements.values()) <= budget:
+            return response
+        message = describe(match.view_name, budget, statements)
+        if settings.QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+        return response
+
+
+class StrictQueryBudgetRunner(DiscoverRunner):
+    """Тесты падают на любом ответе сверх бюджета его маршрута."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.QUERY_BUDGET_STRICT = True
@@ -1,4 +1,24 @@
-from django.test import TestCase
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from . import perf
+from .concurrency import gather
+from .cache import SQLiteCache
+from .querybudget import QueryBudgetExceeded, fingerprint
+
+User = get_user_model()
 
 
 class ViewTestClass(TestCase):
@@ -6,3 +26,179 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, 404)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+def increment(location, times):
+    cache = SQLiteCache(location, {})
+    for _ in range(times):
+        cache.incr('counter')
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.location, {})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_basic_operations(self):
+        """set, add, get_many, delete и clear работают как в Django."""
+        self.cache.set('key', {'a': 1})
+        self.assertEqual(self.cache.get('key'), {'a': 1})
+        self.assertFalse(self.cache.add('key', 'other'))
+        self.assertTrue(self.cache.add('new', 'value'))
+        self.assertEqual(
+            self.cache.get_many(['key', 'new', 'missing']),
+            {'key': {'a': 1}, 'new': 'value'}
+        )
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.clear()
+        self.assertFalse(self.cache.has_key('new'))
+
+    def test_expiry(self):
+        """Просроченный ключ не читается и может быть добавлен заново."""
+        self.cache.set('key', 'value', 0.05)
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 'again'))
+        self.assertEqual(self.cache.get('key'), 'again')
+
+    def test_incr_is_shared_between_processes(self):
+        """incr атомарен для нескольких процессов с одним файлом."""
+        self.cache.set('counter', 0, None)
+        context = multiprocessing.get_context('fork')
+        workers = [
+            context.Process(target=increment, args=(self.location, 50))
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+
+@override_settings(PERF_SAMPLE_RATE=1)
+class PerfMiddlewareTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        perf.get_cache().clear()
+
+    def test_server_timing_and_log(self):
+        """Замер попадает в Server-Timing и в лог строкой JSON"""
+        with self.assertLogs('yatube.perf', 'INFO') as logs:
+            response = self.client.get(reverse('posts:index'))
+        self.assertIn('template;dur=', response['Server-Timing'])
+        self.assertIn('total;dur=', response['Server-Timing'])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'posts:index')
+        self.assertEqual(record['queries'], 1)
+        self.assertIn(
+            'db;dur=%.1f;desc="1 queries"' % record['db_ms'],
+            response['Server-Timing']
+        )
+        self.assertGreater(record['cache_misses'], 0)
+        with self.assertLogs('yatube.perf', 'INFO') as logs:
+            self.client.get(reverse('posts:index'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['queries'], 0)
+        self.assertGreater(record['cache_hits'], 0)
+
+    def test_histograms(self):
+        with self.assertLogs('yatube.perf', 'INFO'):
+            for _ in range(3):
+                self.client.get(reverse('posts:index'))
+            self.client.get(reverse('about:tech'))
+        report = perf.histograms()
+        self.assertEqual(report['posts:index']['count'], 3)
+        self.assertEqual(
+            sum(report['posts:index']['buckets_ms'].values()), 3
+        )
+        self.assertEqual(report['about:tech']['count'], 1)
+        cache.clear()
+        self.assertEqual(perf.histograms(), report)
+        out, err = StringIO(), StringIO()
+        call_command('perf_report', stdout=out, stderr=err)
+        self.assertIn('posts:index', out.getvalue())
+        self.assertIn('YATUBE_CACHE=sqlite', err.getvalue())
+
+    def test_report_for_staff_only(self):
+        url = reverse('perf_report')
+        with self.assertLogs('yatube.perf', 'INFO'):
+            self.assertEqual(self.client.get(url).status_code, 302)
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        with self.assertLogs('yatube.perf', 'INFO'):
+            response = self.client.get(url)
+        self.assertIn('perf_report', response.json())
+
+    @override_settings(PERF_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(perf.histograms(), {})
+
+
+class QueryBudgetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_fingerprint(self):
+        """Отпечаток не зависит от значений и длины списка IN"""
+        self.assertEqual(
+            fingerprint("SELECT  *\n FROM t WHERE id IN (%s, %s) "
+                        "AND name = 'x' LIMIT 21"),
+            'SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?'
+        )
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s)'),
+            'SELECT * FROM t WHERE id IN (...)'
+        )
+
+    @override_settings(QUERY_BUDGETS={'posts:index': 0})
+    def test_strict_mode_fails(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'posts:index'):
+            self.client.get(reverse('posts:index'))
+
+    @override_settings(
+        QUERY_BUDGETS={'posts:index': 0}, QUERY_BUDGET_STRICT=False
+    )
+    def test_warning_with_fingerprints(self):
+        with self.assertLogs('yatube.queries', 'WARNING') as logs:
+            response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('1 SQL-запросов при бюджете 0', logs.output[0])
+        self.assertIn('1 x SELECT', logs.output[0])
+
+
+class GatherTest(SimpleTestCase):
+    def test_sequential_without_workers(self):
+        with override_settings(VIEW_WORKERS=0):
+            self.assertEqual(
+                gather(threading.get_ident, threading.get_ident),
+                [threading.get_ident()] * 2
+            )
+
+    @override_settings(VIEW_WORKERS=2)
+    def test_runs_concurrently_in_order(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def task(value):
+            # Обе задачи дойдут до барьера, только если идут одновременно.
+            barrier.wait()
+            return value
+
+        self.assertEqual(gather(lambda: task(1), lambda: task(2)), [1, 2])
+
+    @override_settings(VIEW_WORKERS=2)
+    def test_error_is_raised(self):
+        def fail():
+            raise ValueError('ошибка')
+
+        with self.assertRaisesMessage(ValueError, 'ошибка'):
+            gather(lambda: 1, fail)
@@ -0,0 +1,120 @@
+"""Архив данных пользователя, который собирается по мере отдачи.
+
+zipfile пишет в Buffer, а генератор сразу отдаёт накопленные байты
+клиенту. Строки и файлы читаются по одной порции, поэтому память не
+растёт с объёмом постов, комментариев и картинок.
+"""
+import json
+import time
+import zipfile
+
+from .bulk import post_row
+
+CHUNK_SIZE = 64 * 1024
+ITERATOR_CHUNK_SIZE = 500
+
+
+class Buffer:
+    """Файл только на запись: zipfile пишет, генератор забирает."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def json_lines(rows):
+    for row in rows:
+        yield (json.dumps(row, ensure_ascii=False) + '\n').encode()
+
+
+def file_chunks(field):
+    with field.storage.open(field.name) as file:
+        yield from file.chunks(CHUNK_SIZE)
+
+
+def profile_row(user):
+    return {
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'email': user.email,
+        'date_joined': user.date_joined.isoformat(),
+    }
+
+
+def comment_row(comment):
+    return {
+        'id': comment.pk,
+        'post': comment.post_id,
+        'text': comment.text,
+        'created': comment.created.isoformat(),
+    }
+
+
+def entries(user):
+    """(имя в архиве, поток байтов, сжимать ли) для всех данных user."""
+    yield 'profile.json', json_lines([profile_row(user)]), True
+    posts = user.posts.select_related('author', 'group').only(
+        'text', 'pub_date', 'image', 'author__username', 'group__slug'
+    ).order_by('pk')
+    yield 'posts.jsonl', json_lines(
+        post_row(post)
+        for post in posts.iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    ), True
+    comments = user.comments.only(
+        'post', 'text', 'created'
+    ).order_by('pk')
+    yield 'comments.jsonl', json_lines(
+        comment_row(comment)
+        for comment in comments.iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    ), True
+    yield 'following.jsonl', json_lines(
+        {'author': username}
+        for username in user.follower.values_list(
+            'author__username', flat=True
+        ).order_by('pk').iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    ), True
+    yield 'followers.jsonl', json_lines(
+        {'user': username}
+        for username in user.following.values_list(
+            'user__username', flat=True
+        ).order_by('pk').iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+    ), True
+    images = user.posts.exclude(image='').only('image').order_by('pk')
+    for post in images.iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+        if post.image.storage.exists(post.image.name):
+            # Картинки уже сжаты: кладём как есть.
+            yield post.image.name, file_chunks(post.image), False
+
+
+def _chunks(user):
+    buffer = Buffer()
+    date_time = time.localtime()[:6]
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, chunks, compress in entries(user):
+            info = zipfile.ZipInfo(name, date_time)
+            info.compress_type = (
+                zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED
+            )
+            with archive.open(info, 'w', force_zip64=True) as file:
+                for chunk in chunks:
+                    file.write(chunk)
+                    yield buffer.take()
+            yield buffer.take()
+    yield buffer.take()
+
+
+def stream(user):
+    """Отдаёт zip-архив с данными user кусками байтов."""
+    return (data for data in _chunks(user) if data)
@@ -0,0 +1,39 @@
+"""Помощники массовой выгрузки и загрузки постов."""
+import itertools
+from contextlib import contextmanager
+
+FIELDS = ('id', 'text', 'pub_date', 'author', 'group', 'image')
+
+
+def post_row(post):
+    return {
+        'id': post.pk,
+        'text': post.text,
+        'pub_date': post.pub_date.isoformat(),
+        'author': post.author.username,
+        'group': post.group.slug if post.group_id else '',
+        # Картинка выгружается ссылкой: путем в хранилище, без файла.
+        'image': post.image.name or '',
+    }
+
+
+def batches(iterable, size):
+    """Режет поток на списки по size, не читая его целиком."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+@contextmanager
+def explicit_dates(*fields):
+    """Временно отключает auto_now_add, чтобы bulk_create сохранил даты."""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
@@ -0,0 +1,216 @@
+"""Ключи кеша лент на счётчиках поколений.
+
+Каждая область (главная, группа, автор, пост, пользователи, рейтинг)
+хранит в кеше счётчик поколения. Изменение данных увеличивает счётчик,
+и все ключи со старым поколением перестают совпадать, поэтому TTL
+можно держать длинным, если кеш общий для всех процессов; с locmem
+FEED_CACHE_TIMEOUT по умолчанию короткий.
+"""
+import hashlib
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+FEED_CACHE_TIMEOUT = settings.FEED_CACHE_TIMEOUT
+
+INDEX = 'index'
+GROUPS = 'groups'
+USERS = 'users'
+HOT = 'hot'
+
+
+def group_scope(group_id):
+    return 'group:%s' % group_id
+
+
+def author_scope(author_id):
+    return 'author:%s' % author_id
+
+
+def post_scope(post_id):
+    return 'post:%s' % post_id
+
+
+def post_scopes(post, *group_ids):
+    """Области, которые затрагивает изменение поста."""
+    scopes = [INDEX, author_scope(post.author_id), post_scope(post.pk)]
+    for group_id in {post.group_id, *group_ids}:
+        if group_id:
+            scopes.append(group_scope(group_id))
+    return scopes
+
+
+def _generation_key(scope):
+    return 'generation:%s' % scope
+
+
+def get_generation(scope):
+    key = _generation_key(scope)
+    generation = cache.get(key)
+    if generation is None:
+        # Начинаем с текущего времени, а не с единицы: после вытеснения
+        # счётчика из кеша старые ключи не должны совпасть с новыми.
+        cache.add(key, time.time_ns(), None)
+        generation = cache.get(key)
+    return generation
+
+
+def _changed_key(scope):
+    return 'changed:%s' % scope
+
+
+def bump_generation(*scopes):
+    """Сдвигает поколения областей сейчас и ещё раз после коммита.
+
+    До коммита другие запросы читают старые строки и могут положить
+    страницу под уже новое поколение; второй сдвиг после коммита
+    делает такие страницы недостижимыми.
+    """
+    _bump(scopes)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _bump(scopes))
+
+
+def _bump(scopes):
+    for scope in scopes:
+        key = _generation_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), None)
+    now = time.time()
+    cache.set_many({_changed_key(scope): now for scope in scopes}, None)
+
+
+def changed_at(scopes):
+    """Время последнего изменения областей (и USERS) для Last-Modified."""
+    keys = [_changed_key(scope) for scope in tuple(scopes) + (USERS,)]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        # Метка вытеснена из кеша: считаем, что область только что
+        # изменилась, иначе можно ответить 304 на устаревшую страницу.
+        now = time.time()
+        cache.set_many({key: now for key in missing}, None)
+        found.update(dict.fromkeys(missing, now))
+    return datetime.fromtimestamp(max(found.values()), timezone.utc)
+
+
+def scopes_digest(scopes, *extra):
+    """Хеш поколений областей (и USERS) вместе с extra."""
+    parts = [
+        '%s-%s' % (scope, get_generation(scope))
+        for scope in tuple(scopes) + (USERS,)
+    ]
+    parts.extend(str(part) for part in extra)
+    return hashlib.md5(':'.join(parts).encode()).hexdigest()
+
+
+def feed_cache_key(request, *scopes):
+    """Ключ страницы ленты: поколения, позиция и тип зрителя."""
+    return 'feed:%s' % scopes_digest(
+        scopes,
+        'page=%s' % request.GET.get('page', ''),
+        'cursor=%s' % request.GET.get('cursor', ''),
+        'auth' if request.user.is_authenticated else 'anon',
+    )
+
+
+def request_memo(request, name, func):
+    """func() один раз за запрос: общий для ETag, даты и самой view."""
+    memo = request.__dict__.setdefault('_memo', {})
+    if name not in memo:
+        memo[name] = func()
+    return memo[name]
+
+
+def latest(queryset, field):
+    return queryset.order_by().aggregate(latest=Max(field))['latest']
+
+
+def local_window():
+    """Начало текущего окна FEED_CACHE_TIMEOUT.
+
+    Без общего кеша поколения и метки изменений свои у каждого процесса
+    и не видят записей в других воркерах; окно ограничивает, как долго
+    такой процесс может отвечать 304 на изменившуюся страницу.
+    """
+    timeout = settings.FEED_CACHE_TIMEOUT
+    return int(time.time() // timeout * timeout)
+
+
+def _not_before_window(value):
+    """value, но не раньше начала окна, если кеш свой у процесса."""
+    if value is None or settings.CACHE_SHARED:
+        return value
+    return max(value, datetime.fromtimestamp(local_window(), timezone.utc))
+
+
+def _etag_extra(request, per_user):
+    extra = [request.get_full_path()]
+    if not settings.CACHE_SHARED:
+        extra.append('window=%d' % local_window())
+    if per_user and request.user.is_authenticated:
+        extra.extend((request.user.pk, request.META.get('CSRF_COOKIE')))
+    elif per_user:
+        extra.append('anon')
+    return extra
+
+
+def conditional(scopes, last_modified=None, per_user=False):
+    """Условный GET: ETag по поколениям областей, Last-Modified по дате.
+
+    scopes и last_modified получают аргументы view; Last-Modified —
+    позднейшее из времени последнего изменения областей и даты
+    last_modified. С per_user страница
+    своя у каждого пользователя: он и его CSRF-секрет входят в ETag
+    (после повторного входа секрет новый, и формы со старым токеном
+    не должны получить 304), Last-Modified отдаётся только анонимам,
+    а Cache-Control и Vary: Cookie разрешают общим кешам хранить
+    только анонимные ответы. Без общего кеша ETag и Last-Modified
+    сдвигаются и с каждым окном local_window.
+    """
+    def etag(request, *args, **kwargs):
+        return scopes_digest(
+            scopes(request, *args, **kwargs), *_etag_extra(request, per_user)
+        )
+
+    def modified(request, *args, **kwargs):
+        if per_user and request.user.is_authenticated:
+            return None
+        value = changed_at(scopes(request, *args, **kwargs))
+        if last_modified is not None:
+            # Дата из выборки не сдвигается при удалениях и обновлениях
+            # через update(), метка изменений областей — сдвигается.
+            latest_date = last_modified(request, *args, **kwargs)
+            if latest_date is not None:
+                value = max(value, latest_date)
+        return _not_before_window(value)
+
+    def decorator(view):
+        conditional_view = condition(
+            etag_func=etag, last_modified_func=modified
+        )(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            private = per_user and request.user.is_authenticated
+            if per_user:
+                patch_vary_headers(response, ('Cookie',))
+            patch_cache_control(
+                response,
+                max_age=0,
+                must_revalidate=True,
+                **{'private' if private else 'public': True}
+            )
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,121 @@
+"""Уведомления «N новых постов» для открытых лент (Server-Sent Events).
+
+Новый пост после коммита публикуется в каналы своей ленты: общей,
+группы и автора (по ним слушает лента подписок). Подписчики в этом же
+процессе просыпаются сразу. Посты из других процессов ловит опрос
+номера журнала ChangeLog раз в POST_EVENTS_POLL_INTERVAL секунд: пока
+номер не сдвинулся, опрос стоит одного запроса по индексу.
+
+Поток синхронный и занимает поток сервера, поэтому живёт не дольше
+POST_EVENTS_LIFETIME секунд; браузер сам переподключается по retry.
+"""
+import json
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import ChangeLog
+
+INDEX = 'index'
+RETRY_MS = 5000
+
+
+def group_channel(group_id):
+    return 'group:%s' % group_id
+
+
+def author_channel(author_id):
+    return 'author:%s' % author_id
+
+
+class Subscription:
+    def __init__(self, channels):
+        self.channels = frozenset(channels)
+        self.event = threading.Event()
+
+    def wait(self, timeout):
+        """Ждёт публикации в свои каналы; False — по таймауту."""
+        notified = self.event.wait(timeout)
+        self.event.clear()
+        return notified
+
+
+class Broker:
+    """Pub/sub внутри процесса: публикация будит подписчиков каналов."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.channels = defaultdict(set)
+
+    def subscribe(self, channels):
+        subscription = Subscription(channels)
+        with self.lock:
+            for channel in subscription.channels:
+                self.channels[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                self.channels[channel].discard(subscription)
+                if not self.channels[channel]:
+                    del self.channels[channel]
+
+    def publish(self, channels):
+        with self.lock:
+            subscriptions = set().union(*(
+                self.channels.get(channel, ()) for channel in channels
+            ))
+        for subscription in subscriptions:
+            subscription.event.set()
+
+
+broker = Broker()
+
+
+def announce(post):
+    """Публикует новый пост, когда он станет виден другим соединениям."""
+    channels = [INDEX, author_channel(post.author_id)]
+    if post.group_id:
+        channels.append(group_channel(post.group_id))
+    transaction.on_commit(lambda: broker.publish(channels))
+
+
+def message(event, data):
+    return 'event: %s\ndata: %s\n\n' % (
+        event, json.dumps(data, ensure_ascii=False)
+    )
+
+
+def stream(posts, channels, after, poll_interval=None, lifetime=None):
+    """Отдаёт события «new» с числом постов posts новее pk after.
+
+    Событие уходит, только когда число изменилось; в паузах — пустой
+    комментарий, чтобы прокси не закрыли соединение.
+    """
+    poll_interval = poll_interval or settings.POST_EVENTS_POLL_INTERVAL
+    lifetime = lifetime or settings.POST_EVENTS_LIFETIME
+    subscription = broker.subscribe(channels)
+    try:
+        yield 'retry: %d\n\n' % RETRY_MS
+        deadline = time.monotonic() + lifetime
+        seq = ChangeLog.objects.last_seq()
+        count = posts.filter(pk__gt=after).count()
+        if count:
+            yield message('new', {'count': count})
+        while time.monotonic() < deadline:
+            if not subscription.wait(poll_interval):
+                current = ChangeLog.objects.last_seq()
+                if current == seq:
+                    yield ': ping\n\n'
+                    continue
+                seq = current
+            fresh = posts.filter(pk__gt=after).count()
+            if fresh != count:
+                count = fresh
+                yield message('new', {'count': count})
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,217 @@
+import json
+import random
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from posts.models import AuthorStats, Follow, Group, Post
+
+ROUTES = (
+    'posts:index',
+    'posts:follow_index',
+    'posts:profile',
+    'posts:post_detail',
+    'posts:group_posts',
+    'posts:group_index',
+)
+INDEX_PAGES = 5
+HOST = 'localhost'
+
+
+def sample(queryset, count, rng):
+    """count случайных объектов без ORDER BY RANDOM() по всей таблице."""
+    last = queryset.order_by('-pk').values_list('pk', flat=True).first()
+    if last is None:
+        return []
+    found = []
+    for _ in range(count * 2):
+        obj = queryset.filter(pk__gte=rng.randint(1, last)).first()
+        if obj is not None:
+            found.append(obj)
+        if len(found) == count:
+            break
+    return found
+
+
+def percentiles(values):
+    if len(values) < 2:
+        return values * 3 if values else [0, 0, 0]
+    cuts = statistics.quantiles(values, n=100)
+    return [cuts[49], cuts[94], cuts[98]]
+
+
+class Command(BaseCommand):
+    help = (
+        'Гоняет страницы posts через тестовый клиент и печатает '
+        'p50/p95/p99, SQL-запросы и память на view'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help='запросов на view')
+        parser.add_argument('--warmup', type=int, default=20)
+        parser.add_argument('--memory-requests', type=int, default=20,
+                            help='запросов на view под tracemalloc')
+        parser.add_argument('--route', action='append', choices=ROUTES,
+                            help='по умолчанию все')
+        parser.add_argument('--pool', type=int, default=100,
+                            help='разных авторов, постов и групп')
+        parser.add_argument('--cold', action='store_true',
+                            help='очищать кеш перед каждым запросом')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--view-workers', type=int,
+                            help='VIEW_WORKERS на время замера, чтобы '
+                                 'сравнить с последовательным путём')
+        parser.add_argument('--json', help='сохранить результат в файл')
+        parser.add_argument('--baseline',
+                            help='сравнить с сохранённым --json')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='допустимый рост p95, доля')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.cold = options['cold']
+        self.targets = self.prepare(options['pool'])
+        workers = options['view_workers']
+        if workers is None:
+            workers = settings.VIEW_WORKERS
+        results = {}
+        with override_settings(VIEW_WORKERS=workers):
+            for route in options['route'] or ROUTES:
+                if not self.targets[route]:
+                    self.stderr.write(f'{route}: нет данных, пропускаю')
+                    continue
+                for _ in range(options['warmup']):
+                    self.request(route)
+                results[route] = self.measure(
+                    route, options['requests'], options['memory_requests']
+                )
+        self.report(results)
+        if options['json']:
+            with open(options['json'], 'w') as file:
+                json.dump(results, file, indent=2)
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['tolerance'])
+
+    def prepare(self, pool):
+        """Заранее выбирает адреса, чтобы их поиск не попал в замеры."""
+        rng = self.random
+        anonymous = Client(SERVER_NAME=HOST)
+        readers = []
+        for follow in sample(Follow.objects.select_related('user'),
+                             min(pool, 10), rng):
+            client = Client(SERVER_NAME=HOST)
+            client.force_login(follow.user)
+            readers.append(client)
+        authors = sample(
+            AuthorStats.objects.filter(posts_count__gt=0).select_related(
+                'user'
+            ),
+            pool, rng
+        )
+        return {
+            'posts:index': [
+                (anonymous, reverse('posts:index') + f'?page={page}')
+                for page in range(1, INDEX_PAGES + 1)
+            ],
+            'posts:follow_index': [
+                (client, reverse('posts:follow_index'))
+                for client in readers
+            ],
+            'posts:profile': [
+                (anonymous, reverse('posts:profile',
+                                    args=(stats.user.username,)))
+                for stats in authors
+            ],
+            'posts:post_detail': [
+                (anonymous, reverse('posts:post_detail', args=(post.pk,)))
+                for post in sample(Post.objects.only('pk'), pool, rng)
+            ],
+            'posts:group_posts': [
+                (anonymous, reverse('posts:group_posts', args=(group.slug,)))
+                for group in sample(Group.objects.all(), pool, rng)
+            ],
+            'posts:group_index': [(anonymous, reverse('posts:group_index'))],
+        }
+
+    def request(self, route):
+        client, url = self.random.choice(self.targets[route])
+        if self.cold:
+            cache.clear()
+        response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError(f'{url}: ответ {response.status_code}')
+        return response
+
+    def measure(self, route, requests, memory_requests):
+        latencies = []
+        queries = []
+        for _ in range(requests):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                self.request(route)
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(len(captured))
+        peaks = []
+        tracemalloc.start()
+        try:
+            for _ in range(memory_requests):
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                self.request(route)
+                peaks.append(
+                    (tracemalloc.get_traced_memory()[1] - before) / 1024
+                )
+        finally:
+            tracemalloc.stop()
+        p50, p95, p99 = percentiles(latencies)
+        return {
+            'requests': requests,
+            'p50_ms': round(p50, 2),
+            'p95_ms': round(p95, 2),
+            'p99_ms': round(p99, 2),
+            'queries_avg': round(statistics.mean(queries), 2),
+            'queries_max': max(queries),
+            'memory_peak_kib': round(max(peaks), 1) if peaks else 0,
+        }
+
+    def report(self, results):
+        self.stdout.write(
+            f'{"view":<20}{"p50":>8}{"p95":>8}{"p99":>8}'
+            f'{"SQL":>6}{"SQL max":>8}{"КиБ":>9}'
+        )
+        for route, row in results.items():
+            self.stdout.write(
+                f'{route:<20}{row["p50_ms"]:>8.1f}{row["p95_ms"]:>8.1f}'
+                f'{row["p99_ms"]:>8.1f}{row["queries_avg"]:>6.1f}'
+                f'{row["queries_max"]:>8}{row["memory_peak_kib"]:>9.0f}'
+            )
+
+    def compare(self, results, path, tolerance):
+        with open(path) as file:
+            baseline = json.load(file)
+        regressions = []
+        for route, row in results.items():
+            before = baseline.get(route)
+            if before is None:
+                continue
+            if row['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                regressions.append(
+                    f'{route}: p95 {before["p95_ms"]} -> {row["p95_ms"]} мс'
+                )
+            if row['queries_max'] > before['queries_max']:
+                regressions.append(
+                    f'{route}: запросов {before["queries_max"]} -> '
+                    f'{row["queries_max"]}'
+                )
+        if regressions:
+            raise CommandError('Регрессии:\n' + '\n'.join(regressions))
+        self.stdout.write('Регрессий нет')
@@ -0,0 +1,57 @@
+import csv
+import json
+
+from django.core.management.base import BaseCommand
+
+from posts.bulk import FIELDS, post_row
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Выгружает посты в JSON Lines или CSV потоком, в постоянной памяти'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', nargs='?', default='-',
+                            help='файл, по умолчанию stdout')
+        parser.add_argument('--format', choices=('jsonl', 'csv'),
+                            help='по умолчанию по расширению файла')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--author', help='только посты автора')
+        parser.add_argument('--group', help='только посты группы (slug)')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        file_format = options['format'] or (
+            'csv' if output.endswith('.csv') else 'jsonl'
+        )
+        posts = Post.objects.select_related('author', 'group').only(
+            'text', 'pub_date', 'image', 'author__username', 'group__slug'
+        ).order_by('pk')
+        if options['author']:
+            posts = posts.filter(author__username=options['author'])
+        if options['group']:
+            posts = posts.filter(group__slug=options['group'])
+        rows = (
+            post_row(post)
+            for post in posts.iterator(chunk_size=options['chunk_size'])
+        )
+        if output == '-':
+            count = self.write(rows, self.stdout, file_format)
+        else:
+            with open(output, 'w', encoding='utf-8', newline='') as file:
+                count = self.write(rows, file, file_format)
+        self.stderr.write(f'Выгружено постов: {count}')
+
+    def write(self, rows, file, file_format):
+        count = 0
+        if file_format == 'csv':
+            writer = csv.DictWriter(file, FIELDS)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        else:
+            for row in rows:
+                file.write(json.dumps(row, ensure_ascii=False) + '\n')
+                count += 1
+        return count
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Готовит миниатюры для постов с картинкой, у которых их ещё нет'
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').filter(thumbnail='')
+        count = 0
+        for post in posts.iterator():
+            thumbnails.schedule(post)
+            count += 1
+        thumbnails.wait()
+        self.stdout.write(f'Миниатюр поставлено в очередь: {count}')
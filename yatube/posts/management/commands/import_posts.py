@@ -0,0 +1,199 @@
+import csv
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts import search, timeline
+from posts.bulk import batches, explicit_dates
+from posts.caching import (
+    GROUPS, INDEX, author_scope, bump_generation, group_scope
+)
+from posts.models import (
+    AuthorStats, ChangeLog, Follow, Group, GroupStats, Post, User
+)
+
+MAX_REPORTED_ERRORS = 20
+TEXT_FIELDS = ('author', 'group', 'text', 'pub_date', 'image')
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает посты из JSON Lines или CSV (формат export_posts) '
+        'пачками через bulk_create, в постоянной памяти'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='файл .jsonl или .csv')
+        parser.add_argument('--format', choices=('jsonl', 'csv'),
+                            help='по умолчанию по расширению файла')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--create-missing', action='store_true',
+                            help='создавать неизвестных авторов и группы')
+        parser.add_argument('--no-search', action='store_true',
+                            help='не индексировать посты для поиска')
+
+    def handle(self, *args, **options):
+        path = options['input']
+        file_format = options['format'] or (
+            'csv' if path.endswith('.csv') else 'jsonl'
+        )
+        self.create_missing = options['create_missing']
+        self.authors = {}
+        self.groups = {}
+        self.errors = 0
+        last_pk = Post.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        ).first() or 0
+        author_ids = set()
+        group_ids = set()
+        imported = 0
+        # Пачки коммитятся по одной: если загрузка оборвалась, счётчики,
+        # ленты и поиск всё равно догоняют уже записанные посты.
+        try:
+            with open(path, encoding='utf-8', newline='') as file:
+                rows = self.read(file, file_format)
+                with explicit_dates(Post._meta.get_field('pub_date')):
+                    for batch in batches(rows, options['batch_size']):
+                        posts = self.build(batch)
+                        with transaction.atomic():
+                            Post.objects.bulk_create(posts)
+                        imported += len(posts)
+                        author_ids.update(post.author_id for post in posts)
+                        group_ids.update(
+                            post.group_id for post in posts if post.group_id
+                        )
+        finally:
+            self.refresh(
+                last_pk, author_ids, group_ids, options['no_search']
+            )
+        self.stdout.write(
+            f'Загружено постов: {imported}, пропущено строк: {self.errors}'
+        )
+
+    def read(self, file, file_format):
+        """Отдаёт (номер строки, словарь) по одной строке файла."""
+        if file_format == 'csv':
+            # Заголовок — первая строка, данные начинаются со второй.
+            yield from enumerate(csv.DictReader(file), start=2)
+            return
+        for number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                self.error(number, 'не JSON')
+                continue
+            if not isinstance(row, dict):
+                self.error(number, 'не объект JSON')
+            elif any(
+                not isinstance(row.get(field), (str, type(None)))
+                for field in TEXT_FIELDS
+            ):
+                self.error(number, 'поля должны быть строками')
+            else:
+                yield number, row
+
+    def error(self, number, message):
+        self.errors += 1
+        if self.errors <= MAX_REPORTED_ERRORS:
+            self.stderr.write(f'строка {number}: {message}')
+
+    def build(self, batch):
+        self.resolve(
+            self.authors, User, 'username',
+            {row.get('author') or '' for _, row in batch}
+        )
+        self.resolve(
+            self.groups, Group, 'slug',
+            {row.get('group') or '' for _, row in batch} - {''}
+        )
+        posts = (self.post(number, row) for number, row in batch)
+        return [post for post in posts if post is not None]
+
+    def post(self, number, row):
+        author_id = self.authors.get(row.get('author') or '')
+        if author_id is None:
+            return self.error(number, f'нет автора {row.get("author")!r}')
+        group_id = None
+        if row.get('group'):
+            group_id = self.groups.get(row['group'])
+            if group_id is None:
+                return self.error(number, f'нет группы {row["group"]!r}')
+        if not row.get('text'):
+            return self.error(number, 'пустой текст')
+        pub_date = timezone.now()
+        if row.get('pub_date'):
+            try:
+                pub_date = parse_datetime(row['pub_date'])
+            except ValueError:
+                pub_date = None
+            if pub_date is None:
+                return self.error(number, 'неверная дата')
+            if timezone.is_naive(pub_date):
+                pub_date = timezone.make_aware(pub_date)
+        return Post(
+            author_id=author_id,
+            group_id=group_id,
+            text=row['text'],
+            pub_date=pub_date,
+            image=row.get('image') or '',
+        )
+
+    def resolve(self, known, model, field, values):
+        """Дополняет кеш known значениями values одним запросом."""
+        missing = {value for value in values if value and value not in known}
+        if not missing:
+            return
+        known.update(model.objects.filter(
+            **{field + '__in': missing}
+        ).values_list(field, 'pk'))
+        missing -= set(known)
+        if not (missing and self.create_missing):
+            return
+        for value in missing:
+            # Строки с такими значениями станут ошибками «нет автора/группы».
+            try:
+                model._meta.get_field(field).run_validators(value)
+            except ValidationError as error:
+                self.stderr.write(f'{value!r} не создан: {error.messages[0]}')
+                continue
+            if model is User:
+                obj = User.objects.create_user(username=value)
+            else:
+                obj = Group.objects.create(slug=value, title=value)
+            known[value] = obj.pk
+
+    def refresh(self, last_pk, author_ids, group_ids, no_search):
+        """bulk_create не шлёт сигналов: обновляет то, что делают они."""
+        for author_id in author_ids:
+            AuthorStats.objects.recount(author_id)
+        for group_id in group_ids:
+            GroupStats.objects.recount(group_id)
+        follows = Follow.objects.filter(
+            author__in=author_ids
+        ).values_list('user_id', 'author_id')
+        for user_id, author_id in follows.iterator():
+            timeline.backfill(user_id, author_id)
+        ChangeLog.objects.record_created(
+            'post',
+            Post.objects.filter(pk__gt=last_pk).order_by('pk').values_list(
+                'pk', 'pk', 'author', 'group'
+            ).iterator()
+        )
+        if not no_search:
+            for post in Post.objects.filter(pk__gt=last_pk).iterator():
+                search.index_object(post)
+        bump_generation(
+            INDEX, GROUPS,
+            *(author_scope(author_id) for author_id in author_ids),
+            *(group_scope(group_id) for group_id in group_ids)
+        )
+        if Post.objects.filter(pk__gt=last_pk).exclude(image='').exists():
+            self.stdout.write(
+                'Для картинок запустите python3 manage.py generate_thumbnails'
+            )
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import search
+from posts.models import Comment, Group, Post
+
+
+class Command(BaseCommand):
+    help = 'Заново строит поисковый индекс, например после смены YATUBE_SEARCH'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since', type=int, metavar='SEQ',
+            help='только посты и комментарии, изменённые после номера SEQ '
+                 'журнала изменений'
+        )
+
+    def handle(self, *args, **options):
+        if options['since'] is not None:
+            with transaction.atomic():
+                processed, seq = search.sync(options['since'])
+            self.stdout.write(
+                f'Обработано изменений: {processed}, последний номер: {seq}'
+            )
+            return
+        with transaction.atomic():
+            search.rebuild(
+                search.get_index(),
+                Post.objects.all(),
+                Group.objects.all(),
+                Comment.objects.all(),
+            )
+        self.stdout.write('Поисковый индекс перестроен')
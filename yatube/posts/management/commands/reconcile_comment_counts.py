@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from posts.caching import bump_generation, post_scopes
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет comment_count и last_commented_at постов с комментариями '
+        'и исправляет расхождения'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fixed = Post.objects.reconcile_comments(options['batch_size'])
+        for post in fixed:
+            bump_generation(*post_scopes(post))
+        self.stdout.write(f'Исправлено постов: {len(fixed)}')
@@ -0,0 +1,299 @@
+import datetime as dt
+import itertools
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from faker import Faker
+
+from posts import ranking, search, timeline
+from posts.bulk import batches, explicit_dates
+from posts.models import (
+    AuthorStats, ChangeLog, Comment, Follow, Group, GroupStats, Post,
+    TimelineEntry, User
+)
+
+ZIPF_EXPONENT = 1.1
+TEXTS = 2000
+VIRAL_POSTS = 100
+
+
+def zipf_weights(count):
+    """Накопленные веса: k-й по популярности встречается как 1/k^s."""
+    return list(itertools.accumulate(
+        1 / (rank ** ZIPF_EXPONENT) for rank in range(1, count + 1)
+    ))
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими данными для benchmark_views: '
+        'авторы и подписки распределены по степенному закону'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--comments', type=int, default=100000)
+        parser.add_argument('--follows', type=int, default=20,
+                            help='подписок на пользователя в среднем')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='bench')
+        parser.add_argument('--no-search', action='store_true',
+                            help='не перестраивать поисковый индекс')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.faker = Faker('ru_RU')
+        self.faker.seed_instance(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = options['prefix']
+        self.texts = [self.faker.paragraph() for _ in range(TEXTS)]
+
+        # Даты ставим сами, а не временем вставки.
+        with explicit_dates(Post._meta.get_field('pub_date'),
+                            Comment._meta.get_field('created')):
+            user_ids = self.step('Пользователи', self.seed_users,
+                                 options['users'])
+            group_ids = self.step('Группы', self.seed_groups,
+                                  options['groups'])
+            self.step('Посты', self.seed_posts, options['posts'],
+                      user_ids, group_ids)
+            self.step('Подписки', self.seed_follows, options['follows'],
+                      user_ids)
+            self.step('Комментарии', self.seed_comments,
+                      options['comments'], user_ids)
+        self.step('Счётчики авторов', self.fill_stats)
+        self.step('Счётчики групп', self.fill_group_stats)
+        self.step('Счётчики комментариев', self.fill_comment_counts)
+        self.step('Ленты подписок', self.fill_timelines)
+        self.step('Журнал изменений', self.fill_changes)
+        # После журнала: позиция пересчёта встаёт на его конец, и первый
+        # запуск update_hot_ranks не пересчитывает всю таблицу.
+        self.step('Рейтинг', ranking.update_ranks, True, self.batch_size)
+        if not options['no_search']:
+            self.step('Поисковый индекс', self.fill_search)
+        cache.clear()
+
+    def step(self, title, func, *args):
+        started = time.perf_counter()
+        with transaction.atomic():
+            result = func(*args)
+        seconds = time.perf_counter() - started
+        self.stdout.write(f'{title}: {seconds:.1f} с')
+        return result
+
+    def date(self):
+        return timezone.now() - dt.timedelta(
+            seconds=self.random.random() * 365 * 24 * 60 * 60
+        )
+
+    def seed_users(self, count):
+        password = make_password(self.prefix)
+        users = (
+            User(
+                username=f'{self.prefix}{number}',
+                first_name=self.faker.first_name(),
+                last_name=self.faker.last_name(),
+                password=password,
+            )
+            for number in range(count)
+        )
+        for batch in batches(users, self.batch_size):
+            User.objects.bulk_create(batch, ignore_conflicts=True)
+        user_ids = list(User.objects.filter(
+            username__startswith=self.prefix
+        ).values_list('pk', flat=True))
+        # Популярность не должна зависеть от порядка регистрации.
+        self.random.shuffle(user_ids)
+        return user_ids
+
+    def seed_groups(self, count):
+        groups = (
+            Group(
+                title=self.faker.sentence(nb_words=3)[:200],
+                slug=f'{self.prefix}-{number}',
+                description=self.random.choice(self.texts),
+            )
+            for number in range(count)
+        )
+        for batch in batches(groups, self.batch_size):
+            Group.objects.bulk_create(batch, ignore_conflicts=True)
+        return list(Group.objects.filter(
+            slug__startswith=self.prefix + '-'
+        ).values_list('pk', flat=True))
+
+    def seed_posts(self, count, user_ids, group_ids):
+        weights = zipf_weights(len(user_ids))
+        for batch in batches(range(count), self.batch_size):
+            authors = self.random.choices(
+                user_ids, cum_weights=weights, k=len(batch)
+            )
+            Post.objects.bulk_create(
+                Post(
+                    author_id=author_id,
+                    group_id=(
+                        self.random.choice(group_ids)
+                        if group_ids and self.random.random() < 0.7
+                        else None
+                    ),
+                    text=self.random.choice(self.texts),
+                    pub_date=self.date(),
+                )
+                for author_id in authors
+            )
+
+    def seed_follows(self, average, user_ids):
+        weights = zipf_weights(len(user_ids))
+        follows = (
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in set(self.random.choices(
+                user_ids,
+                cum_weights=weights,
+                k=self.random.randint(0, 2 * average)
+            )) - {user_id}
+        )
+        for batch in batches(follows, self.batch_size):
+            Follow.objects.bulk_create(batch, ignore_conflicts=True)
+
+    def seed_comments(self, count, user_ids):
+        post_ids = list(Post.objects.values_list('pk', flat=True))
+        if not post_ids:
+            return
+        viral = self.random.sample(post_ids, min(VIRAL_POSTS, len(post_ids)))
+        for batch in batches(range(count), self.batch_size):
+            Comment.objects.bulk_create(
+                Comment(
+                    post_id=self.random.choice(
+                        viral if self.random.random() < 0.3 else post_ids
+                    ),
+                    author_id=self.random.choice(user_ids),
+                    text=self.faker.sentence(),
+                    created=self.date(),
+                )
+                for _ in batch
+            )
+
+    def fill_stats(self):
+        def counts(queryset, field):
+            return dict(queryset.order_by().values_list(field).annotate(
+                count=Count('pk')
+            ))
+
+        posts = counts(Post.objects, 'author')
+        comments = counts(Comment.objects, 'author')
+        followers = counts(Follow.objects, 'author')
+        following = counts(Follow.objects, 'user')
+        AuthorStats.objects.all().delete()
+        stats = (
+            AuthorStats(
+                user_id=user_id,
+                posts_count=posts.get(user_id, 0),
+                comments_count=comments.get(user_id, 0),
+                followers_count=followers.get(user_id, 0),
+                following_count=following.get(user_id, 0),
+                pulled=(
+                    followers.get(user_id, 0)
+                    > timeline.FANOUT_FOLLOWERS_LIMIT
+                ),
+            )
+            for user_id in User.objects.values_list(
+                'pk', flat=True
+            ).iterator()
+        )
+        for batch in batches(stats, self.batch_size):
+            AuthorStats.objects.bulk_create(batch)
+
+    def fill_group_stats(self):
+        rows = Post.objects.filter(group__isnull=False).values_list(
+            'group'
+        ).annotate(
+            Count('pk'), Count('author', distinct=True), Max('pub_date')
+        ).order_by()
+        stats = {
+            group_id: {
+                'posts_count': posts,
+                'authors_count': authors,
+                'last_post_at': last,
+            }
+            for group_id, posts, authors, last in rows
+        }
+        GroupStats.objects.all().delete()
+        group_stats = (
+            GroupStats(group_id=group_id, **stats.get(group_id, {}))
+            for group_id in Group.objects.values_list('pk', flat=True)
+        )
+        for batch in batches(group_stats, self.batch_size):
+            GroupStats.objects.bulk_create(batch)
+
+    def fill_comment_counts(self):
+        comments = Comment.objects.filter(
+            post=OuterRef('pk')
+        ).order_by().values('post')
+        Post.objects.update(
+            comment_count=Coalesce(Subquery(
+                comments.annotate(count=Count('pk')).values('count')
+            ), 0),
+            last_commented_at=Subquery(
+                comments.annotate(last=Max('created')).values('last')
+            ),
+        )
+
+    def fill_timelines(self):
+        """Как timeline.backfill, но одной выборкой постов на автора."""
+        TimelineEntry.objects.all().delete()
+        authors = AuthorStats.objects.filter(
+            followers_count__gt=0, pulled=False
+        ).values_list('user_id', flat=True)
+        for author_id in authors.iterator():
+            posts = list(Post.objects.filter(author=author_id).order_by(
+                '-pub_date', '-pk'
+            ).values_list('pk', 'pub_date')[:timeline.BACKFILL_POSTS])
+            followers = Follow.objects.filter(
+                author=author_id
+            ).values_list('user_id', flat=True)
+            entries = (
+                TimelineEntry(
+                    user_id=user_id,
+                    post_id=post_id,
+                    author_id=author_id,
+                    pub_date=pub_date
+                )
+                for user_id in followers.iterator()
+                for post_id, pub_date in posts
+            )
+            for batch in batches(entries, self.batch_size):
+                TimelineEntry.objects.bulk_create(batch)
+
+    def fill_changes(self):
+        changes = (
+            ('post', Post, ('pk', 'pk', 'author', 'group')),
+            ('comment', Comment,
+             ('pk', 'post', 'post__author', 'post__group')),
+        )
+        for kind, model, fields in changes:
+            logged = ChangeLog.objects.filter(kind=kind).values('object_id')
+            ChangeLog.objects.record_created(
+                kind,
+                model.objects.exclude(pk__in=logged).order_by(
+                    'pk'
+                ).values_list(*fields).iterator(),
+                self.batch_size
+            )
+
+    def fill_search(self):
+        search.rebuild(
+            search.get_index(),
+            Post.objects.all(),
+            Group.objects.all(),
+            Comment.objects.all(),
+        )
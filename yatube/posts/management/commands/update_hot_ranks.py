@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from posts import ranking
+from posts.caching import HOT, bump_generation
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает рейтинг ленты «Популярное» для постов с новыми '
+        'и удалёнными комментариями по журналу изменений; запускайте по '
+        'расписанию, например раз в 5 минут'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='пересчитать все посты, например после '
+                                 'смены формулы или подписок')
+        parser.add_argument('--batch-size', type=int,
+                            default=ranking.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        updated = ranking.update_ranks(
+            full=options['full'], batch_size=options['batch_size']
+        )
+        if updated:
+            bump_generation(HOT)
+        self.stdout.write(f'Пересчитано рейтингов: {updated}')
@@ -0,0 +1,59 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_author_stats(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    sources = (
+        ('posts_count', apps.get_model('posts', 'Post'), 'author'),
+        ('comments_count', apps.get_model('posts', 'Comment'), 'author'),
+        ('followers_count', apps.get_model('posts', 'Follow'), 'author'),
+        ('following_count', apps.get_model('posts', 'Follow'), 'user'),
+    )
+    stats = {pk: {} for pk in User.objects.values_list('pk', flat=True)}
+    for field, model, column in sources:
+        rows = model.objects.values_list(column).annotate(
+            models.Count('pk')).order_by()
+        for user_id, count in rows:
+            stats[user_id][field] = count
+    AuthorStats.objects.bulk_create(
+        [
+            AuthorStats(user_id=pk, **counters)
+            for pk, counters in stats.items()
+        ],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0008_auto_20220221_0037'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='пользователь')),
+                ('posts_count', models.IntegerField(default=0, verbose_name='постов')),
+                ('comments_count', models.IntegerField(default=0, verbose_name='комментариев')),
+                ('followers_count', models.IntegerField(default=0, verbose_name='подписчиков')),
+                ('following_count', models.IntegerField(default=0, verbose_name='подписок')),
+            ],
+            options={
+                'verbose_name': 'статистика автора',
+                'verbose_name_plural': 'статистика авторов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='user'),
+        ),
+        migrations.RunPython(fill_author_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,141 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:16
+
+import re
+import sqlite3
+from collections import Counter
+from itertools import islice
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Копия posts.search на момент миграции: код приложения может
+# измениться, а миграция должна заполнить индекс так, как тогда.
+FTS_TABLE = 'posts_search'
+KINDS = ('post', 'group', 'comment')
+MAX_TERM_LENGTH = 64
+MIN_STEM_LENGTH = 3
+BATCH_SIZE = 500
+
+WORD_RE = re.compile(r'\w+')
+CYRILLIC_RE = re.compile(r'[а-я]+')
+REFLEXIVE = ('ся', 'сь')
+ENDINGS = sorted((
+    'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ая', 'яя', 'ое', 'ее',
+    'ые', 'ие', 'ый', 'ий', 'ой', 'ей', 'ую', 'юю', 'ых', 'их', 'ым', 'им',
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ям', 'ам', 'ом',
+    'ем', 'ах', 'ях', 'ов', 'ев', 'ия', 'ию', 'ии', 'ь', 'а', 'я', 'о',
+    'е', 'и', 'ы', 'у', 'ю', 'й',
+    'ешь', 'ете', 'ует', 'ють', 'ить', 'ать', 'ять', 'еть', 'ыть', 'ть',
+    'ет', 'ют', 'ут', 'ит', 'ат', 'ят', 'ила', 'ило', 'или', 'ала', 'ало',
+    'али', 'ил', 'ал', 'ел', 'ла', 'ло', 'ли',
+), key=len, reverse=True)
+
+
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    if not CYRILLIC_RE.fullmatch(word):
+        return word[:MAX_TERM_LENGTH]
+    for suffix in REFLEXIVE:
+        if word.endswith(suffix) and len(word) - 2 > MIN_STEM_LENGTH:
+            word = word[:-2]
+            break
+    for ending in ENDINGS:
+        if word.endswith(ending) and (
+            len(word) - len(ending) >= MIN_STEM_LENGTH
+        ):
+            word = word[:-len(ending)]
+            break
+    return word[:MAX_TERM_LENGTH]
+
+
+def fts5_available():
+    try:
+        sqlite3.connect(':memory:').execute(
+            'CREATE VIRTUAL TABLE test USING fts5(body)'
+        )
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+def documents(apps):
+    """(номер документа, основы) всех постов, групп и комментариев."""
+    for kind, model in zip(KINDS, ('Post', 'Group', 'Comment')):
+        queryset = apps.get_model('posts', model).objects.all()
+        for obj in queryset.iterator():
+            if kind == 'group':
+                text = '%s %s' % (obj.title, obj.description)
+            else:
+                text = obj.text
+            terms = [stem(word) for word in WORD_RE.findall(text or '')]
+            yield obj.pk * len(KINDS) + KINDS.index(kind), terms
+
+
+def create_search_index(apps, schema_editor):
+    fts5 = (
+        schema_editor.connection.vendor == 'sqlite' and fts5_available()
+    )
+    if fts5:
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE %s USING fts5(body)' % FTS_TABLE
+        )
+    backend = settings.SEARCH_BACKEND
+    if backend == 'fts5' or (backend == 'auto' and fts5):
+        with schema_editor.connection.cursor() as cursor:
+            for document, terms in documents(apps):
+                if terms:
+                    cursor.execute(
+                        'INSERT INTO %s (rowid, body) VALUES (%%s, %%s)'
+                        % FTS_TABLE,
+                        [document, ' '.join(terms)]
+                    )
+        return
+    SearchTerm = apps.get_model('posts', 'SearchTerm')
+    rows = (
+        SearchTerm(term=term, document=document, frequency=count)
+        for document, terms in documents(apps)
+        for term, count in Counter(terms).items()
+    )
+    # bulk_create собрал бы весь генератор в список, пишем пачками.
+    while True:
+        batch = list(islice(rows, BATCH_SIZE))
+        if not batch:
+            return
+        SearchTerm.objects.bulk_create(batch)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS %s' % FTS_TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, verbose_name='основа слова')),
+                ('document', models.BigIntegerField(verbose_name='документ')),
+                ('frequency', models.PositiveIntegerField(verbose_name='число вхождений')),
+            ],
+            options={
+                'verbose_name': 'терм поиска',
+                'verbose_name_plural': 'термы поиска',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='searchterm',
+            index=models.Index(fields=['document'], name='search_document'),
+        ),
+        migrations.AddConstraint(
+            model_name='searchterm',
+            constraint=models.UniqueConstraint(fields=('term', 'document'), name='search_term_document'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_post_comment_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostRank',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rank', serialize=False, to='posts.Post', verbose_name='пост')),
+                ('score', models.FloatField(verbose_name='рейтинг')),
+                ('computed_at', models.DateTimeField(blank=True, help_text='Пусто, пока рейтинг не пересчитала задача', null=True, verbose_name='пересчитан')),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='posts.Group', verbose_name='группа поста')),
+            ],
+            options={
+                'verbose_name': 'рейтинг поста',
+                'verbose_name_plural': 'рейтинги постов',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='postrank',
+            index=models.Index(fields=['-score', '-post'], name='rank_score'),
+        ),
+        migrations.AddIndex(
+            model_name='postrank',
+            index=models.Index(fields=['group', '-score', '-post'], name='rank_group_score'),
+        ),
+        migrations.AddIndex(
+            model_name='postrank',
+            index=models.Index(fields=['computed_at'], name='rank_computed_at'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_group_stats(apps, schema_editor):
+    Group = apps.get_model('posts', 'Group')
+    GroupStats = apps.get_model('posts', 'GroupStats')
+    Post = apps.get_model('posts', 'Post')
+    rows = Post.objects.filter(group__isnull=False).values_list(
+        'group'
+    ).annotate(
+        models.Count('pk'),
+        models.Count('author', distinct=True),
+        models.Max('pub_date'),
+    ).order_by()
+    stats = {
+        group_id: {
+            'posts_count': posts,
+            'authors_count': authors,
+            'last_post_at': last,
+        }
+        for group_id, posts, authors, last in rows
+    }
+    GroupStats.objects.bulk_create(
+        [
+            GroupStats(group_id=pk, **stats.get(pk, {}))
+            for pk in Group.objects.values_list('pk', flat=True)
+        ],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_postrank'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GroupStats',
+            fields=[
+                ('group', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='posts.Group', verbose_name='группа')),
+                ('posts_count', models.IntegerField(default=0, verbose_name='постов')),
+                ('authors_count', models.IntegerField(default=0, verbose_name='авторов')),
+                ('last_post_at', models.DateTimeField(blank=True, null=True, verbose_name='последний пост')),
+            ],
+            options={
+                'verbose_name': 'статистика группы',
+                'verbose_name_plural': 'статистика групп',
+            },
+        ),
+        migrations.RunPython(fill_group_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:51
+
+from itertools import islice
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+def fill_changes(apps, schema_editor):
+    ChangeLog = apps.get_model('posts', 'ChangeLog')
+    Comment = apps.get_model('posts', 'Comment')
+    Post = apps.get_model('posts', 'Post')
+    Post.objects.update(updated_at=models.F('pub_date'))
+    Comment.objects.update(updated_at=models.F('created'))
+    for kind, model in (('post', Post), ('comment', Comment)):
+        rows = (
+            ChangeLog(kind=kind, object_id=pk)
+            for pk in model.objects.order_by('pk').values_list(
+                'pk', flat=True
+            ).iterator()
+        )
+        # bulk_create собрал бы весь генератор в список, пишем пачками.
+        while True:
+            batch = list(islice(rows, BATCH_SIZE))
+            if not batch:
+                break
+            ChangeLog.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_groupstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('post', 'пост'), ('comment', 'комментарий')], max_length=16, verbose_name='тип объекта')),
+                ('object_id', models.PositiveIntegerField(verbose_name='id объекта')),
+                ('deleted', models.BooleanField(default=False, verbose_name='удалён')),
+                ('changed_at', models.DateTimeField(auto_now=True, verbose_name='изменён')),
+            ],
+            options={
+                'verbose_name': 'изменение',
+                'verbose_name_plural': 'журнал изменений',
+            },
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='дата изменения'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Дата изменения поста'),
+        ),
+        migrations.AddConstraint(
+            model_name='changelog',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='changelog_object'),
+        ),
+        migrations.RunPython(fill_changes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_posts(apps, schema_editor):
+    ChangeLog = apps.get_model('posts', 'ChangeLog')
+    Comment = apps.get_model('posts', 'Comment')
+    Post = apps.get_model('posts', 'Post')
+    posts = Post.objects.filter(pk=models.OuterRef('object_id'))
+    ChangeLog.objects.filter(kind='post').update(
+        post=models.F('object_id'),
+        author=models.Subquery(posts.values('author')[:1]),
+        group=models.Subquery(posts.values('group')[:1]),
+    )
+    comments = Comment.objects.filter(pk=models.OuterRef('object_id'))
+    ChangeLog.objects.filter(kind='comment').update(
+        post=models.Subquery(comments.values('post')[:1]),
+        author=models.Subquery(comments.values('post__author')[:1]),
+        group=models.Subquery(comments.values('post__group')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0017_changelog'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='changelog',
+            name='changelog_object',
+        ),
+        migrations.AddField(
+            model_name='changelog',
+            name='author',
+            field=models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='автор поста'),
+        ),
+        migrations.AddField(
+            model_name='changelog',
+            name='group',
+            field=models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='posts.Group', verbose_name='группа поста'),
+        ),
+        migrations.AddField(
+            model_name='changelog',
+            name='post',
+            field=models.ForeignKey(db_constraint=False, db_index=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='posts.Post', verbose_name='пост'),
+        ),
+        migrations.AddIndex(
+            model_name='changelog',
+            index=models.Index(fields=['kind', 'object_id'], name='changelog_object'),
+        ),
+        migrations.AddIndex(
+            model_name='changelog',
+            index=models.Index(fields=['author', 'id'], name='changelog_author'),
+        ),
+        migrations.AddIndex(
+            model_name='changelog',
+            index=models.Index(fields=['group', 'id'], name='changelog_group'),
+        ),
+        migrations.RunPython(fill_posts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:10
+
+from django.db import migrations, models
+
+FANOUT_FOLLOWERS_LIMIT = 1000
+
+
+def fill_pulled(apps, schema_editor):
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    AuthorStats.objects.filter(
+        followers_count__gt=FANOUT_FOLLOWERS_LIMIT
+    ).update(pulled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_changelog_feeds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='authorstats',
+            name='pulled',
+            field=models.BooleanField(default=False, help_text='Посты не раскладываются подписчикам; переключает timeline.update_mode', verbose_name='лента читает посты напрямую'),
+        ),
+        migrations.RunPython(fill_pulled, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_authorstats_pulled'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='postrank',
+            name='rank_computed_at',
+        ),
+        migrations.AddField(
+            model_name='postrank',
+            name='seq',
+            field=models.PositiveIntegerField(blank=True, help_text='Последний номер ChangeLog, учтённый при пересчёте', null=True, verbose_name='номер журнала'),
+        ),
+        migrations.AddIndex(
+            model_name='postrank',
+            index=models.Index(fields=['seq'], name='rank_seq'),
+        ),
+    ]
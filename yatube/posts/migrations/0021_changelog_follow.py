@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0020_postrank_seq'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='changelog',
+            name='kind',
+            field=models.CharField(choices=[('post', 'пост'), ('comment', 'комментарий'), ('follow', 'подписки')], max_length=16, verbose_name='тип объекта'),
+        ),
+    ]
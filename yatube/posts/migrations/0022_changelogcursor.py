@@ -0,0 +1,47 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:33
+
+from django.db import migrations, models
+from django.db.models import Max
+
+RANKS_CURSOR = 'hot_ranks'
+
+
+def move_ranks_position(apps, schema_editor):
+    PostRank = apps.get_model('posts', 'PostRank')
+    ChangeLogCursor = apps.get_model('posts', 'ChangeLogCursor')
+    seq = PostRank.objects.aggregate(seq=Max('seq'))['seq']
+    if seq:
+        ChangeLogCursor.objects.create(name=RANKS_CURSOR, seq=seq)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_changelog_follow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogCursor',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True, verbose_name='обработчик')),
+                ('seq', models.PositiveIntegerField(default=0, verbose_name='номер журнала')),
+            ],
+            options={
+                'verbose_name': 'позиция в журнале',
+                'verbose_name_plural': 'позиции в журнале',
+            },
+        ),
+        migrations.RunPython(
+            move_ranks_position, migrations.RunPython.noop
+        ),
+        migrations.RemoveIndex(
+            model_name='postrank',
+            name='rank_seq',
+        ),
+        migrations.RemoveField(
+            model_name='postrank',
+            name='seq',
+        ),
+    ]
@@ -1,9 +1,48 @@
-from django.db import models
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Count, Max, Subquery, Value
+from django.db.models.functions import Coalesce
 
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.utils import timezone
+
+from .bulk import batches
 
 User = get_user_model()
 
+GROUP_CACHE_TIMEOUT = 24 * 60 * 60
+# Больше любого номера журнала изменений.
+LAST_SEQ = 2 ** 63 - 1
+
+
+def group_slug_key(slug):
+    # В URL может прийти что угодно, а memcached примет только ASCII.
+    return 'group-slug:%s' % hashlib.md5(slug.encode()).hexdigest()
+
+
+class GroupManager(models.Manager):
+    def by_slug(self, slug):
+        """Группа по slug из кеша; запись сбрасывает сигнал при
+        сохранении или удалении группы.
+
+        Сигнал чистит только кеш своего процесса, поэтому без общего
+        кеша запись живёт FEED_CACHE_TIMEOUT, а не сутки.
+        """
+        key = group_slug_key(slug)
+        group = cache.get(key)
+        if group is None:
+            group = self.get(slug=slug)
+            cache.set(key, group, (
+                GROUP_CACHE_TIMEOUT if settings.CACHE_SHARED
+                else settings.FEED_CACHE_TIMEOUT
+            ))
+        return group
+
 
 class Group(models.Model):
     title = models.CharField(max_length=200,
@@ -15,14 +54,71 @@ class Group(models.Model):
                             help_text='Максимальная длина 100 символов')
     description = models.TextField(verbose_name='Описание группы')
 
+    objects = GroupManager()
+
     def __str__(self):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    FEED_FIELDS = (
+        'text',
+        'pub_date',
+        'updated_at',
+        'image',
+        'thumbnail',
+        'author__username',
+        'author__first_name',
+        'author__last_name',
+        'group__slug',
+        'group__title',
+        'comment_count',
+        'last_commented_at',
+    )
+
+    def for_feed(self):
+        """Только то, что нужно карточке поста, одним запросом."""
+        return self.select_related('author', 'group').only(*self.FEED_FIELDS)
+
+    def reconcile_comments(self, batch_size=1000):
+        """Сверяет счётчики комментариев с таблицей Comment пачками
+        по pk и возвращает исправленные посты."""
+        fixed = []
+        last_pk = 0
+        while True:
+            posts = list(self.filter(pk__gt=last_pk).order_by('pk').only(
+                'author', 'group', 'comment_count', 'last_commented_at'
+            )[:batch_size])
+            if not posts:
+                return fixed
+            last_pk = posts[-1].pk
+            totals = {
+                post_id: (count, last)
+                for post_id, count, last in Comment.objects.filter(
+                    post__in=[post.pk for post in posts]
+                ).order_by().values_list('post').annotate(
+                    Count('pk'), Max('created')
+                )
+            }
+            drifted = []
+            for post in posts:
+                actual = totals.get(post.pk, (0, None))
+                if (post.comment_count, post.last_commented_at) != actual:
+                    post.comment_count, post.last_commented_at = actual
+                    drifted.append(post)
+            self.model.objects.bulk_update(
+                drifted, ['comment_count', 'last_commented_at']
+            )
+            fixed.extend(drifted)
+
+
 class Post(models.Model):
     text = models.TextField(verbose_name='Текст поста')
     pub_date = models.DateTimeField(auto_now_add=True,
                                     verbose_name='Дата публикации поста')
+    updated_at = models.DateTimeField(auto_now=True,
+                                      db_index=True,
+                                      verbose_name='Дата изменения поста')
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -45,12 +141,66 @@ class Post(models.Model):
         blank=True,
         help_text='Поддерживаются только форматы картинки'
     )
+    thumbnail = models.CharField(
+        'миниатюра',
+        max_length=255,
+        blank=True,
+        editable=False,
+        help_text='Готовится в фоне после загрузки картинки'
+    )
+    comment_count = models.PositiveIntegerField(
+        'комментариев',
+        default=0,
+        editable=False
+    )
+    last_commented_at = models.DateTimeField(
+        'последний комментарий',
+        null=True,
+        blank=True,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
+
+    # Эти поля ведут сигналы и фоновые задачи отдельными UPDATE; правка
+    # формой или в админке не должна затирать их значениями, которые
+    # экземпляр прочитал до правки.
+    DERIVED_FIELDS = ('thumbnail', 'comment_count', 'last_commented_at')
 
     def __str__(self):
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        if not (self._state.adding or args or kwargs.get('force_insert')
+                or kwargs.get('update_fields') is not None):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.DERIVED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    @property
+    def thumbnail_url(self):
+        if not self.thumbnail:
+            return ''
+        return default_storage.url(self.thumbnail)
+
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='post_pub_date_id'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date'
+            ),
+        ]
 
 
 class Comment(models.Model):
@@ -71,12 +221,21 @@ class Comment(models.Model):
     text = models.TextField(verbose_name='текст комментария')
     created = models.DateTimeField(auto_now_add=True,
                                    verbose_name='дата создания')
+    updated_at = models.DateTimeField(auto_now=True,
+                                      db_index=True,
+                                      verbose_name='дата изменения')
 
     def __str__(self):
         return self.text
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(
+                fields=['post', '-created', '-id'],
+                name='comment_post_created'
+            ),
+        ]
 
 
 class Follow(models.Model):
@@ -99,3 +258,365 @@ class Follow(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['user', 'author'], name='user')
         ]
+        indexes = [
+            models.Index(fields=['author', 'user'], name='follow_author_user'),
+        ]
+
+
+class AuthorStatsManager(models.Manager):
+    def for_user(self, user):
+        """Счётчики автора; без строки пересчитывает их один раз."""
+        try:
+            return user.stats
+        except AuthorStats.DoesNotExist:
+            return self.recount(user.pk)
+
+    def recount(self, user_id):
+        stats, _ = self.update_or_create(
+            user_id=user_id,
+            defaults={
+                'posts_count': Post.objects.filter(author=user_id).count(),
+                'comments_count': Comment.objects.filter(
+                    author=user_id).count(),
+                'followers_count': Follow.objects.filter(
+                    author=user_id).count(),
+                'following_count': Follow.objects.filter(
+                    user=user_id).count(),
+            }
+        )
+        return stats
+
+
+class AuthorStats(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='пользователь'
+    )
+    posts_count = models.IntegerField('постов', default=0)
+    comments_count = models.IntegerField('комментариев', default=0)
+    followers_count = models.IntegerField('подписчиков', default=0)
+    following_count = models.IntegerField('подписок', default=0)
+    pulled = models.BooleanField(
+        'лента читает посты напрямую',
+        default=False,
+        help_text='Посты не раскладываются подписчикам; '
+                  'переключает timeline.update_mode'
+    )
+
+    objects = AuthorStatsManager()
+
+    class Meta:
+        verbose_name = 'статистика автора'
+        verbose_name_plural = 'статистика авторов'
+
+    def __str__(self):
+        return str(self.user_id)
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='подписчик'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='пост'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='автор поста'
+    )
+    pub_date = models.DateTimeField('дата публикации поста')
+
+    class Meta:
+        verbose_name = 'запись ленты подписок'
+        verbose_name_plural = 'записи ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='timeline_user_post'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_pub_date'
+            ),
+            models.Index(
+                fields=['user', 'author'], name='timeline_user_author'
+            ),
+        ]
+
+
+class SearchTerm(models.Model):
+    """Инвертированный индекс поиска для баз без FTS5."""
+    term = models.CharField('основа слова', max_length=64)
+    document = models.BigIntegerField('документ')
+    frequency = models.PositiveIntegerField('число вхождений')
+
+    class Meta:
+        verbose_name = 'терм поиска'
+        verbose_name_plural = 'термы поиска'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['term', 'document'], name='search_term_document'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['document'], name='search_document'),
+        ]
+
+
+class PostRank(models.Model):
+    """Рейтинг поста для ленты «Популярное», считается задачей
+    update_hot_ranks, а не при чтении."""
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='rank',
+        verbose_name='пост'
+    )
+    group = models.ForeignKey(
+        Group,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='+',
+        verbose_name='группа поста'
+    )
+    score = models.FloatField('рейтинг')
+    computed_at = models.DateTimeField(
+        'пересчитан',
+        null=True,
+        blank=True,
+        help_text='Пусто, пока рейтинг не пересчитала задача'
+    )
+
+    class Meta:
+        verbose_name = 'рейтинг поста'
+        verbose_name_plural = 'рейтинги постов'
+        indexes = [
+            models.Index(fields=['-score', '-post'], name='rank_score'),
+            models.Index(
+                fields=['group', '-score', '-post'], name='rank_group_score'
+            ),
+        ]
+
+
+class GroupStatsManager(models.Manager):
+    def for_group(self, group):
+        """Счётчики группы; без строки пересчитывает их один раз."""
+        stats = self.filter(group=group).first()
+        if stats is None:
+            stats = self.recount(group.pk)
+        return stats
+
+    def recount(self, group_id):
+        posts = Post.objects.filter(group=group_id)
+        stats, _ = self.update_or_create(
+            group_id=group_id,
+            defaults={
+                'posts_count': posts.count(),
+                'authors_count': posts.values('author').distinct().count(),
+                'last_post_at': posts.aggregate(
+                    last=Max('pub_date'))['last'],
+            }
+        )
+        return stats
+
+
+class GroupStats(models.Model):
+    group = models.OneToOneField(
+        Group,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='группа'
+    )
+    posts_count = models.IntegerField('постов', default=0)
+    authors_count = models.IntegerField('авторов', default=0)
+    last_post_at = models.DateTimeField(
+        'последний пост', null=True, blank=True
+    )
+
+    objects = GroupStatsManager()
+
+    class Meta:
+        verbose_name = 'статистика группы'
+        verbose_name_plural = 'статистика групп'
+
+    def __str__(self):
+        return str(self.group_id)
+
+
+class ChangeLogQuerySet(models.QuerySet):
+    def since(self, seq, kinds=None):
+        """Изменения с номером больше seq в порядке номеров.
+
+        Номер выдаётся при INSERT, а видна запись становится при
+        коммите, так что параллельные транзакции могут закоммитить
+        номера не по порядку, и читатель, ушедший за больший номер,
+        меньший уже не увидит. В SQLite пишет одна транзакция за раз,
+        и порядок совпадает. На базах с параллельной записью задайте
+        CHANGE_LOG_LAG дольше самой долгой пишущей транзакции: журнал
+        отдаётся только до первой записи моложе этой задержки.
+        """
+        changes = self.filter(pk__gt=seq)
+        if settings.CHANGE_LOG_LAG:
+            cutoff = timezone.now() - timedelta(
+                seconds=settings.CHANGE_LOG_LAG
+            )
+            fresh = changes.filter(changed_at__gt=cutoff).order_by('pk')
+            changes = changes.filter(pk__lt=Coalesce(
+                Subquery(fresh.values('pk')[:1]), Value(LAST_SEQ),
+                output_field=models.BigIntegerField()
+            ))
+        if kinds:
+            changes = changes.filter(kind__in=kinds)
+        return changes.order_by('pk')
+
+
+class ChangeLogManager(models.Manager.from_queryset(ChangeLogQuerySet)):
+    def record(self, kind, object_id, post_id, author_id, group_id,
+               deleted=False):
+        """Записывает изменение объекта под новым номером.
+
+        Поля поста (сам пост или пост комментария) нужны лентам, чтобы
+        выбирать свои изменения по индексу. Прежняя запись об объекте в
+        той же группе удаляется, так что журнал растёт с числом
+        объектов и их групп, а не правок.
+        """
+        with transaction.atomic():
+            self.filter(
+                kind=kind, object_id=object_id, group=group_id
+            ).delete()
+            return self.create(
+                kind=kind,
+                object_id=object_id,
+                post_id=post_id,
+                author_id=author_id,
+                group_id=group_id,
+                deleted=deleted,
+            )
+
+    def record_created(self, kind, rows, batch_size=1000):
+        """Записи о новых объектах после bulk_create, который не шлёт
+        сигналов; rows — (id объекта, пост, автор поста, группа)."""
+        changes = (
+            self.model(
+                kind=kind,
+                object_id=object_id,
+                post_id=post_id,
+                author_id=author_id,
+                group_id=group_id,
+            )
+            for object_id, post_id, author_id, group_id in rows
+        )
+        # Размер пачки INSERT bulk_create подберёт под лимиты базы.
+        for batch in batches(changes, batch_size):
+            self.bulk_create(batch)
+
+    def last_seq(self):
+        return self.aggregate(seq=Max('pk'))['seq'] or 0
+
+
+class ChangeLog(models.Model):
+    """Журнал изменений постов и комментариев для инкрементальной
+    обработки: кеши, поисковый индекс и клиенты синхронизации читают
+    записи после последнего известного им номера (pk). Запись follow
+    (object_id — подписчик) отмечает, что набор его подписок менялся.
+
+    Ссылки на пост, автора и группу без ограничений в БД: записи
+    переживают удаление объектов.
+    """
+    KINDS = (
+        ('post', 'пост'),
+        ('comment', 'комментарий'),
+        ('follow', 'подписки'),
+    )
+
+    kind = models.CharField('тип объекта', max_length=16, choices=KINDS)
+    object_id = models.PositiveIntegerField('id объекта')
+    post = models.ForeignKey(
+        Post,
+        null=True,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name='+',
+        verbose_name='пост'
+    )
+    author = models.ForeignKey(
+        User,
+        null=True,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name='+',
+        verbose_name='автор поста'
+    )
+    group = models.ForeignKey(
+        Group,
+        null=True,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        db_index=False,
+        related_name='+',
+        verbose_name='группа поста'
+    )
+    deleted = models.BooleanField('удалён', default=False)
+    changed_at = models.DateTimeField('изменён', auto_now=True)
+
+    objects = ChangeLogManager()
+
+    class Meta:
+        verbose_name = 'изменение'
+        verbose_name_plural = 'журнал изменений'
+        indexes = [
+            models.Index(
+                fields=['kind', 'object_id'], name='changelog_object'
+            ),
+            models.Index(
+                fields=['author', 'id'], name='changelog_author'
+            ),
+            models.Index(
+                fields=['group', 'id'], name='changelog_group'
+            ),
+        ]
+
+
+class ChangeLogCursorManager(models.Manager):
+    def position(self, name):
+        """Номер, до которого дочитал обработчик name; 0 — с начала."""
+        return self.filter(name=name).values_list(
+            'seq', flat=True
+        ).first() or 0
+
+    def advance(self, name, seq):
+        self.update_or_create(name=name, defaults={'seq': seq})
+
+
+class ChangeLogCursor(models.Model):
+    """Позиция периодического обработчика в журнале ChangeLog.
+
+    Хранится отдельной строкой, а не выводится из обработанных данных:
+    не откатывается, когда удаляют их последнюю запись, и сдвигается,
+    даже если пачка изменений ничего не затронула.
+    """
+    name = models.CharField('обработчик', max_length=64, unique=True)
+    seq = models.PositiveIntegerField('номер журнала', default=0)
+
+    objects = ChangeLogCursorManager()
+
+    class Meta:
+        verbose_name = 'позиция в журнале'
+        verbose_name_plural = 'позиции в журнале'
@@ -0,0 +1,209 @@
+import base64
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+COUNT_CACHE_TIMEOUT = 60
+
+FORWARD = 'next'
+BACKWARD = 'prev'
+
+
+def encode_cursor(direction, values):
+    """Упаковывает направление и значения ключа в непрозрачный токен."""
+    if values is not None:
+        values = [
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in values
+        ]
+    raw = json.dumps([direction, values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Обратная операция к encode_cursor, None для битого токена."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, values = json.loads(raw.decode())
+    except (TypeError, ValueError, UnicodeDecodeError):
+        return None
+    if direction not in (FORWARD, BACKWARD):
+        return None
+    if values is not None and not isinstance(values, list):
+        return None
+    return direction, values
+
+
+class CursorPaginator(Paginator):
+    """Keyset-пагинация по (pub_date, id) без OFFSET и COUNT(*).
+
+    Ссылки вида ?page=N продолжают работать: такая страница один раз
+    выбирается через OFFSET, а дальше навигация идёт по курсорам.
+    Общее количество (count) считается только по запросу и кешируется,
+    поэтому оно приблизительное.
+
+    get_page возвращает обычный Page с атрибутами next_cursor,
+    previous_cursor и last_cursor. Номер страницы без COUNT неизвестен,
+    поэтому number и num_pages считаются относительно текущего окна:
+    первая страница имеет номер 1, следующая за ней существует,
+    только если есть next_cursor.
+
+    С cache_key выбранное окно (объекты и курсоры) кешируется на
+    cache_timeout секунд; ключ должен меняться вместе с данными.
+    """
+
+    def __init__(self, object_list, per_page, keys=('-pub_date', '-pk'),
+                 cache_key=None, cache_timeout=None):
+        super().__init__(object_list, per_page)
+        self.keys = tuple(keys)
+        self.cache_key = cache_key
+        self.cache_timeout = cache_timeout
+        self.number = 1
+        self.next_cursor = None
+        self.previous_cursor = None
+
+    @property
+    def num_pages(self):
+        if self.next_cursor is not None:
+            return self.number + 1
+        return self.number
+
+    @cached_property
+    def count(self):
+        key = 'paginator-count:%s' % hashlib.md5(
+            str(self.object_list.query).encode()
+        ).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = self.object_list.count()
+            cache.set(key, count, COUNT_CACHE_TIMEOUT)
+        return count
+
+    def get_page(self, number=None, cursor=None):
+        if cursor:
+            decoded = decode_cursor(cursor)
+            if decoded is not None:
+                direction, values = decoded
+                try:
+                    values = self.parse_values(values)
+                except (TypeError, ValueError, ValidationError):
+                    pass
+                else:
+                    return self._window_page(direction, values, None)
+        try:
+            number = self.validate_number(number)
+        except (TypeError, ValueError):
+            number = 1
+        return self._window_page(FORWARD, None, number)
+
+    def _window_page(self, direction, values, number):
+        window = None
+        if self.cache_key is not None:
+            window = cache.get(self.cache_key)
+        if window is None:
+            window = self.fetch_window(direction, values, number)
+            if self.cache_key is not None:
+                cache.set(self.cache_key, window, self.cache_timeout)
+        rows, self.next_cursor, self.previous_cursor = window
+        if self.previous_cursor is None:
+            self.number = 1
+        else:
+            self.number = max(number or 2, 2)
+        page = self._get_page(rows, self.number, self)
+        page.next_cursor = self.next_cursor
+        page.previous_cursor = self.previous_cursor
+        page.last_cursor = encode_cursor(BACKWARD, None)
+        return page
+
+    def validate_number(self, number):
+        number = int(number)
+        if number < 1:
+            raise ValueError(number)
+        return number
+
+    def fetch_window(self, direction, values, number):
+        """Возвращает (объекты, курсор вперёд, курсор назад)."""
+        if number is not None:
+            offset = (number - 1) * self.per_page
+            rows = self._fetch(None, FORWARD, self.per_page + 1, offset)
+            if not rows and number > 1:
+                return self.fetch_window(BACKWARD, None, None)
+            has_next = len(rows) > self.per_page
+            has_previous = number > 1
+        elif direction == FORWARD:
+            rows = self._fetch(values, FORWARD, self.per_page + 1)
+            has_next = len(rows) > self.per_page
+            has_previous = values is not None
+        else:
+            rows = self._fetch(values, BACKWARD, self.per_page + 1)
+            has_previous = len(rows) > self.per_page
+            if not has_previous and values is not None:
+                return self.fetch_window(FORWARD, None, 1)
+            rows = rows[:self.per_page][::-1]
+            has_next = values is not None
+        rows = rows[:self.per_page]
+        if not rows:
+            return [], None, None
+        next_cursor = (
+            encode_cursor(FORWARD, self.key_values(rows[-1]))
+            if has_next else None
+        )
+        previous_cursor = (
+            encode_cursor(BACKWARD, self.key_values(rows[0]))
+            if has_previous else None
+        )
+        return rows, next_cursor, previous_cursor
+
+    def parse_values(self, values):
+        if values is None:
+            return None
+        if len(values) != len(self.keys):
+            raise ValueError(values)
+        model = self.object_list.model
+        return [
+            self._field(model, key.lstrip('-')).to_python(value)
+            for key, value in zip(self.keys, values)
+        ]
+
+    def key_values(self, obj):
+        return [getattr(obj, key.lstrip('-')) for key in self.keys]
+
+    def _fetch(self, values, direction, limit, offset=0):
+        queryset = self.ordered(self.object_list, self.keys, values, direction)
+        return list(queryset[offset:offset + limit])
+
+    def ordered(self, queryset, keys, values, direction):
+        """Упорядочивает queryset по keys и отрезает всё до values."""
+        if direction == BACKWARD:
+            keys = tuple(self._flip(key) for key in keys)
+        queryset = queryset.order_by(*keys)
+        if values is not None:
+            queryset = queryset.filter(self._after(keys, values))
+        return queryset
+
+    def _after(self, keys, values):
+        """Условие «строго после values» для лексикографического порядка."""
+        names = [key.lstrip('-') for key in keys]
+        condition = Q()
+        for index, key in enumerate(keys):
+            lookup = '__lt' if key.startswith('-') else '__gt'
+            term = Q(**{names[index] + lookup: values[index]})
+            for name, value in zip(names[:index], values[:index]):
+                term &= Q(**{name: value})
+            condition |= term
+        return condition
+
+    @staticmethod
+    def _field(model, name):
+        if name == 'pk':
+            return model._meta.pk
+        return model._meta.get_field(name)
+
+    @staticmethod
+    def _flip(key):
+        return key[1:] if key.startswith('-') else '-' + key
@@ -0,0 +1,136 @@
+"""Лента «Популярное»: рейтинг постов по вовлечённости с поправкой на
+свежесть.
+
+Как в «hot» у Reddit, к логарифму вовлечённости прибавляется время
+публикации, делённое на HOT_DECAY: пост, набравший в десять раз больше
+комментариев, держится наравне с постом на HOT_DECAY секунд новее.
+Поэтому рейтинг не стареет сам и меняется, только когда у поста
+появляются или удаляются комментарии. update_hot_ranks находит такие
+посты по журналу ChangeLog после своей позиции в ChangeLogCursor и
+пересчитывает их в таблицу PostRank, а лента читается из неё одним
+запросом по индексу.
+"""
+import math
+from datetime import datetime, timezone
+
+from django.db import transaction
+from django.utils import timezone as django_timezone
+
+from .models import (
+    AuthorStats, ChangeLog, ChangeLogCursor, Post, PostQuerySet, PostRank
+)
+from .paginator import CursorPaginator
+
+HOT_EPOCH = datetime(2022, 1, 1, tzinfo=timezone.utc)
+HOT_DECAY = 45000
+FOLLOWERS_WEIGHT = 0.1
+BATCH_SIZE = 1000
+RANKS_CURSOR = 'hot_ranks'
+
+
+def hot_score(pub_date, comments, followers=0):
+    engagement = 1 + comments + FOLLOWERS_WEIGHT * followers
+    age = (pub_date - HOT_EPOCH).total_seconds()
+    return math.log10(engagement) + age / HOT_DECAY
+
+
+def rank_new_post(post):
+    """Сразу ставит новый пост в «Популярное», не дожидаясь задачи."""
+    followers = AuthorStats.objects.filter(
+        user=post.author_id
+    ).values_list('followers_count', flat=True).first()
+    PostRank.objects.create(
+        post=post,
+        group_id=post.group_id,
+        score=hot_score(post.pub_date, post.comment_count, followers or 0),
+    )
+
+
+def update_ranks(full=False, batch_size=BATCH_SIZE):
+    """Пересчитывает рейтинги постов, изменённых после прошлого
+    пересчёта: новых, перенесённых, с новыми и удалёнными
+    комментариями; full пересчитывает все. Возвращает число постов."""
+    started = django_timezone.now()
+    if full:
+        seq = ChangeLog.objects.since(0).order_by('-pk').values_list(
+            'pk', flat=True
+        ).first() or 0
+        updated = 0
+        last_pk = 0
+        while True:
+            post_ids = list(Post.objects.filter(pk__gt=last_pk).order_by(
+                'pk'
+            ).values_list('pk', flat=True)[:batch_size])
+            if not post_ids:
+                ChangeLogCursor.objects.advance(RANKS_CURSOR, seq)
+                return updated
+            last_pk = post_ids[-1]
+            updated += _rank(post_ids, started)
+    seq = ChangeLogCursor.objects.position(RANKS_CURSOR)
+    updated = 0
+    while True:
+        changes = list(ChangeLog.objects.since(seq).values_list(
+            'pk', 'post'
+        )[:batch_size])
+        if not changes:
+            return updated
+        seq = changes[-1][0]
+        with transaction.atomic():
+            updated += _rank(
+                {post_id for _, post_id in changes if post_id}, started
+            )
+            ChangeLogCursor.objects.advance(RANKS_CURSOR, seq)
+
+
+def _rank(post_ids, started):
+    """Пересчитывает рейтинги постов post_ids, которые ещё есть."""
+    rows = Post.objects.filter(pk__in=post_ids).values_list(
+        'pk', 'group', 'pub_date', 'comment_count',
+        'author__stats__followers_count'
+    )
+    ranks = [
+        PostRank(
+            post_id=post_id,
+            group_id=group_id,
+            score=hot_score(pub_date, comments, followers or 0),
+            computed_at=started,
+        )
+        for post_id, group_id, pub_date, comments, followers in rows
+    ]
+    with transaction.atomic():
+        PostRank.objects.filter(
+            post__in=[rank.post_id for rank in ranks]
+        ).delete()
+        PostRank.objects.bulk_create(ranks)
+    return len(ranks)
+
+
+class RankPaginator(CursorPaginator):
+    """Курсорная пагинация по PostRank в порядке убывания рейтинга.
+
+    Страница содержит посты, как у CursorPaginator, а курсор строится
+    по (score, post_id) рейтинга.
+    """
+
+    def __init__(self, ranks, per_page, **kwargs):
+        fields = ['score'] + [
+            'post__' + field for field in PostQuerySet.FEED_FIELDS
+        ]
+        super().__init__(
+            ranks.select_related('post__author', 'post__group').only(
+                *fields
+            ).order_by('-score', '-post_id'),
+            per_page,
+            keys=('-score', '-post_id'),
+            **kwargs
+        )
+
+    def _fetch(self, values, direction, limit, offset=0):
+        posts = []
+        for rank in super()._fetch(values, direction, limit, offset):
+            rank.post.hot_score = rank.score
+            posts.append(rank.post)
+        return posts
+
+    def key_values(self, post):
+        return [post.hot_score, post.pk]
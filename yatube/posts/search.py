@@ -0,0 +1,320 @@
+"""Полнотекстовый поиск по постам, группам и комментариям.
+
+Текст режется на слова, которые лёгкий стеммер для русского языка
+приводит к основам, одинаково при индексации и в запросе. На SQLite с
+FTS5 основы лежат в виртуальной таблице posts_search и ранжируются
+bm25, на других базах — в инвертированном индексе SearchTerm с TF-IDF,
+посчитанным в Python. Индекс обновляют сигналы.
+
+Документ — один объект; его номер кодирует тип и pk (document_id).
+Результаты листаются курсором по (рангу, номеру документа).
+"""
+import math
+import re
+import sqlite3
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+
+from .models import ChangeLog, Comment, Group, Post, SearchTerm
+from .paginator import FORWARD, decode_cursor, encode_cursor
+
+FTS_TABLE = 'posts_search'
+KINDS = ('post', 'group', 'comment')
+MAX_QUERY_TERMS = 10
+MAX_TERM_LENGTH = 64
+MIN_STEM_LENGTH = 3
+BATCH_SIZE = 500
+MAX_CANDIDATES = 5000
+DOCUMENT_COUNT_KEY = 'search:documents'
+DOCUMENT_COUNT_TIMEOUT = 5 * 60
+
+WORD_RE = re.compile(r'\w+')
+CYRILLIC_RE = re.compile(r'[а-я]+')
+REFLEXIVE = ('ся', 'сь')
+ENDINGS = sorted((
+    # прилагательные и причастия
+    'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ая', 'яя', 'ое', 'ее',
+    'ые', 'ие', 'ый', 'ий', 'ой', 'ей', 'ую', 'юю', 'ых', 'их', 'ым', 'им',
+    # существительные
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ям', 'ам', 'ом',
+    'ем', 'ах', 'ях', 'ов', 'ев', 'ия', 'ию', 'ии', 'ь', 'а', 'я', 'о',
+    'е', 'и', 'ы', 'у', 'ю', 'й',
+    # глаголы
+    'ешь', 'ете', 'ует', 'ють', 'ить', 'ать', 'ять', 'еть', 'ыть', 'ть',
+    'ет', 'ют', 'ут', 'ит', 'ат', 'ят', 'ила', 'ило', 'или', 'ала', 'ало',
+    'али', 'ил', 'ал', 'ел', 'ла', 'ло', 'ли',
+), key=len, reverse=True)
+
+
+def stem(word):
+    """Основа слова: нижний регистр, ё как е, без окончания."""
+    word = word.lower().replace('ё', 'е')
+    if not CYRILLIC_RE.fullmatch(word):
+        return word[:MAX_TERM_LENGTH]
+    for suffix in REFLEXIVE:
+        if word.endswith(suffix) and len(word) - 2 > MIN_STEM_LENGTH:
+            word = word[:-2]
+            break
+    for ending in ENDINGS:
+        if word.endswith(ending) and (
+            len(word) - len(ending) >= MIN_STEM_LENGTH
+        ):
+            word = word[:-len(ending)]
+            break
+    return word[:MAX_TERM_LENGTH]
+
+
+def tokenize(text):
+    return [stem(word) for word in WORD_RE.findall(text or '')]
+
+
+def document_id(kind, object_id):
+    return object_id * len(KINDS) + KINDS.index(kind)
+
+
+def split_document(document):
+    object_id, kind = divmod(document, len(KINDS))
+    return KINDS[kind], object_id
+
+
+def document_text(obj):
+    if obj._meta.model_name == 'group':
+        return '%s %s' % (obj.title, obj.description)
+    return obj.text
+
+
+@lru_cache(maxsize=None)
+def fts5_available():
+    try:
+        sqlite3.connect(':memory:').execute(
+            'CREATE VIRTUAL TABLE test USING fts5(body)'
+        )
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+def use_fts5():
+    backend = settings.SEARCH_BACKEND
+    if backend == 'auto':
+        return connection.vendor == 'sqlite' and fts5_available()
+    return backend == 'fts5'
+
+
+class FTS5Index:
+    def replace(self, document, terms):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM %s WHERE rowid = %%s' % FTS_TABLE, [document]
+            )
+            if terms:
+                cursor.execute(
+                    'INSERT INTO %s (rowid, body) VALUES (%%s, %%s)'
+                    % FTS_TABLE,
+                    [document, ' '.join(terms)]
+                )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s' % FTS_TABLE)
+
+    def search(self, terms, after, limit):
+        """[(документ, ранг)], меньший ранг лучше."""
+        # Основы состоят из букв и цифр, кавычки в них не бывает.
+        sql = (
+            'SELECT rowid, score FROM ('
+            'SELECT rowid, bm25({table}) AS score FROM {table} '
+            'WHERE {table} MATCH %s)'
+        ).format(table=FTS_TABLE)
+        params = [' '.join('"%s"' % term for term in terms)]
+        if after is not None:
+            sql += ' WHERE score > %s OR (score = %s AND rowid > %s)'
+            params += [after[1], after[1], after[0]]
+        sql += ' ORDER BY score, rowid LIMIT %s'
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+class InvertedIndex:
+    def __init__(self, model=SearchTerm):
+        self.model = model
+
+    def replace(self, document, terms):
+        self.model.objects.filter(document=document).delete()
+        self.model.objects.bulk_create(
+            [
+                self.model(term=term, document=document, frequency=count)
+                for term, count in Counter(terms).items()
+            ],
+            batch_size=BATCH_SIZE
+        )
+
+    def clear(self):
+        self.model.objects.all().delete()
+
+    def search(self, terms, after, limit):
+        """[(документ, ранг)], меньший ранг лучше.
+
+        Число документов с каждым термом считается по индексу (term,
+        document), постинги читаются только у документов с самым редким
+        термом, не больше MAX_CANDIDATES самых новых.
+        """
+        frequencies = dict(
+            self.model.objects.filter(term__in=terms).values('term')
+            .annotate(count=Count('document')).values_list('term', 'count')
+        )
+        if len(frequencies) < len(terms):
+            return []
+        rarest = min(terms, key=frequencies.get)
+        candidates = self.model.objects.filter(term=rarest).order_by(
+            '-document'
+        ).values('document')[:MAX_CANDIDATES]
+        postings = self.model.objects.filter(
+            term__in=terms, document__in=candidates
+        ).values_list('term', 'document', 'frequency')
+        documents = defaultdict(dict)
+        for term, document, frequency in postings.iterator():
+            documents[document][term] = frequency
+        total = self.document_count()
+        ranked = []
+        for document, found in documents.items():
+            if len(found) < len(terms):
+                continue
+            score = sum(
+                (1 + math.log(count))
+                * math.log(1 + total / frequencies[term])
+                for term, count in found.items()
+            )
+            ranked.append((document, -score))
+        ranked.sort(key=lambda row: (row[1], row[0]))
+        if after is not None:
+            ranked = [
+                (document, rank) for document, rank in ranked
+                if (rank, document) > (after[1], after[0])
+            ]
+        return ranked[:limit]
+
+    def document_count(self):
+        """Число документов в индексе; для IDF хватает приблизительного."""
+        return cache.get_or_set(
+            DOCUMENT_COUNT_KEY,
+            lambda: self.model.objects.values('document').distinct().count(),
+            DOCUMENT_COUNT_TIMEOUT
+        )
+
+
+def get_index(model=SearchTerm):
+    if use_fts5():
+        return FTS5Index()
+    return InvertedIndex(model)
+
+
+def index_object(obj, index=None):
+    index = index or get_index()
+    index.replace(
+        document_id(obj._meta.model_name, obj.pk),
+        tokenize(document_text(obj))
+    )
+
+
+def remove_object(obj):
+    get_index().replace(document_id(obj._meta.model_name, obj.pk), [])
+
+
+def rebuild(index, *querysets):
+    """Заново индексирует все объекты querysets."""
+    index.clear()
+    for queryset in querysets:
+        for obj in queryset.iterator():
+            index_object(obj, index)
+
+
+def sync(seq, batch_size=BATCH_SIZE):
+    """Доиндексирует посты и комментарии, изменённые после номера seq
+    журнала ChangeLog. Возвращает число изменений и последний номер."""
+    index = get_index()
+    models = {'post': Post, 'comment': Comment}
+    processed = 0
+    while True:
+        changes = list(
+            ChangeLog.objects.since(seq, list(models))[:batch_size]
+        )
+        if not changes:
+            return processed, seq
+        objects = {
+            kind: model.objects.in_bulk([
+                change.object_id for change in changes
+                if change.kind == kind and not change.deleted
+            ])
+            for kind, model in models.items()
+        }
+        for change in changes:
+            obj = objects[change.kind].get(change.object_id)
+            if obj is None:
+                index.replace(document_id(change.kind, change.object_id), [])
+            else:
+                index_object(obj, index)
+        processed += len(changes)
+        seq = changes[-1].pk
+
+
+def query_terms(query):
+    return list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+
+
+def _parse_cursor(cursor):
+    decoded = decode_cursor(cursor) if cursor else None
+    if decoded is None or decoded[0] != FORWARD:
+        return None
+    values = decoded[1]
+    if values is None or len(values) != 2:
+        return None
+    document, rank = values
+    if not isinstance(document, int) or not isinstance(rank, (int, float)):
+        return None
+    return document, rank
+
+
+def find(query, cursor=None, limit=20):
+    """Возвращает (результаты, курсор следующей страницы).
+
+    Результат — словарь с типом (kind) и объектом (object); объекты
+    выбираются пачкой по типу, удалённые пропускаются.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return [], None
+    rows = get_index().search(terms, _parse_cursor(cursor), limit + 1)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(FORWARD, list(rows[-1]))
+    ids = defaultdict(list)
+    for document, rank in rows:
+        kind, object_id = split_document(document)
+        ids[kind].append(object_id)
+    querysets = {
+        'post': Post.objects.for_feed(),
+        'group': Group.objects.all(),
+        'comment': Comment.objects.select_related('author').only(
+            'post', 'text', 'created', 'author__username'
+        ),
+    }
+    objects = {
+        kind: querysets[kind].in_bulk(object_ids)
+        for kind, object_ids in ids.items()
+    }
+    results = []
+    for document, rank in rows:
+        kind, object_id = split_document(document)
+        obj = objects[kind].get(object_id)
+        if obj is not None:
+            results.append({'kind': kind, 'object': obj})
+    return results, next_cursor
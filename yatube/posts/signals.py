@@ -0,0 +1,312 @@
+from django.db import transaction
+from django.core.cache import cache
+from django.db.models import Case, F, OuterRef, Subquery, Value, When
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import events, ranking, search, thumbnails, timeline
+from .caching import (
+    GROUPS, INDEX, USERS, author_scope, bump_generation, group_scope,
+    post_scope, post_scopes
+)
+from .models import (
+    AuthorStats, ChangeLog, Comment, Follow, Group, GroupStats, Post,
+    PostRank, User, group_slug_key
+)
+
+USER_NAME_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def bump_stats(user_id, field, delta):
+    """Атомарно сдвигает счётчик автора, при рассинхроне пересчитывает."""
+    with transaction.atomic():
+        stats = AuthorStats.objects.filter(user_id=user_id)
+        if delta < 0:
+            stats = stats.filter(**{field + '__gte': -delta})
+        if not stats.update(**{field: F(field) + delta}):
+            if User.objects.filter(pk=user_id).exists():
+                AuthorStats.objects.recount(user_id)
+
+
+def bump_comments(post_id, delta, created=None):
+    """Атомарно сдвигает счётчик комментариев поста, как bump_stats."""
+    posts = Post.objects.filter(pk=post_id)
+    if delta > 0:
+        changes = {'last_commented_at': created}
+    else:
+        posts = posts.filter(comment_count__gte=-delta)
+        changes = {'last_commented_at': Subquery(
+            Comment.objects.filter(post=OuterRef('pk')).order_by(
+                '-created'
+            ).values('created')[:1]
+        )}
+    with transaction.atomic():
+        if not posts.update(comment_count=F('comment_count') + delta,
+                            **changes):
+            Post.objects.filter(pk=post_id).reconcile_comments()
+
+
+def bump_group_stats(group_id, post, delta):
+    """Сдвигает счётчики группы на пост post, как bump_stats."""
+    if not group_id:
+        return
+    changes = {'posts_count': F('posts_count') + delta}
+    # Автор активен в группе, пока у него там есть хотя бы один пост.
+    if not Post.objects.filter(
+        author=post.author_id, group=group_id
+    ).exclude(pk=post.pk).exists():
+        changes['authors_count'] = F('authors_count') + delta
+    stats = GroupStats.objects.filter(group=group_id)
+    if delta > 0:
+        changes['last_post_at'] = Case(
+            When(last_post_at__gte=post.pub_date, then=F('last_post_at')),
+            default=Value(post.pub_date),
+        )
+    else:
+        stats = stats.filter(posts_count__gte=-delta)
+        if 'authors_count' in changes:
+            stats = stats.filter(authors_count__gte=-delta)
+        changes['last_post_at'] = Subquery(
+            Post.objects.filter(group=OuterRef('group')).order_by(
+                '-pub_date'
+            ).values('pub_date')[:1]
+        )
+    with transaction.atomic():
+        if not stats.update(**changes):
+            if Group.objects.filter(pk=group_id).exists():
+                GroupStats.objects.recount(group_id)
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        AuthorStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Group)
+def create_group_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        GroupStats.objects.get_or_create(group=instance)
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        bump_stats(instance.author_id, 'posts_count', 1)
+        bump_group_stats(instance.group_id, instance, 1)
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Post)
+def announce_new_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        events.announce(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_moved(sender, instance, created, raw=False, **kwargs):
+    previous = getattr(instance, '_previous_group_id', None)
+    if created or raw or previous == instance.group_id:
+        return
+    bump_group_stats(previous, instance, -1)
+    bump_group_stats(instance.group_id, instance, 1)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    bump_stats(instance.author_id, 'posts_count', -1)
+    bump_group_stats(instance.group_id, instance, -1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        bump_stats(instance.author_id, 'comments_count', 1)
+        bump_comments(instance.post_id, 1, instance.created)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    bump_stats(instance.author_id, 'comments_count', -1)
+    bump_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        bump_stats(instance.author_id, 'followers_count', 1)
+        bump_stats(instance.user_id, 'following_count', 1)
+        timeline.update_mode(instance.author_id)
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    bump_stats(instance.author_id, 'followers_count', -1)
+    bump_stats(instance.user_id, 'following_count', -1)
+    timeline.prune(instance.user_id, instance.author_id)
+    timeline.update_mode(instance.author_id)
+
+
+@receiver(pre_save, sender=Group)
+def remember_group_slug(sender, instance, raw=False, **kwargs):
+    instance._previous_slug = None
+    if instance.pk and not raw:
+        instance._previous_slug = Group.objects.filter(
+            pk=instance.pk
+        ).values_list('slug', flat=True).first()
+
+
+@receiver(pre_save, sender=Post)
+def remember_post_state(sender, instance, raw=False, **kwargs):
+    instance._previous_group_id = None
+    instance._image_changed = bool(instance.image)
+    if instance.pk and not raw:
+        previous = Post.objects.filter(
+            pk=instance.pk
+        ).values_list('group_id', 'image').first()
+        if previous is not None:
+            instance._previous_group_id, image = previous
+            instance._image_changed = image != instance.image.name
+    if instance._image_changed:
+        instance.thumbnail = ''
+        if instance.pk and not raw:
+            # Обычное сохранение не пишет thumbnail (Post.DERIVED_FIELDS).
+            Post.objects.filter(pk=instance.pk).update(thumbnail='')
+
+
+@receiver(post_save, sender=Post)
+def update_rank(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        ranking.rank_new_post(instance)
+    elif getattr(instance, '_previous_group_id', None) != instance.group_id:
+        PostRank.objects.filter(post=instance.pk).update(
+            group=instance.group_id
+        )
+
+
+@receiver(post_save, sender=Post)
+def schedule_thumbnail(sender, instance, raw=False, **kwargs):
+    if not raw and getattr(instance, '_image_changed', False):
+        thumbnails.schedule(instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def record_post_change(sender, instance, **kwargs):
+    deleted = kwargs['signal'] is post_delete
+    previous = getattr(instance, '_previous_group_id', None)
+    # Лента прежней группы тоже должна узнать, что пост из неё ушёл.
+    for group_id in {instance.group_id, previous} - {None} or {None}:
+        ChangeLog.objects.record(
+            'post', instance.pk, instance.pk, instance.author_id, group_id,
+            deleted=deleted
+        )
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def record_comment_change(sender, instance, **kwargs):
+    author_id, group_id = Post.objects.filter(
+        pk=instance.post_id
+    ).values_list('author', 'group').first() or (None, None)
+    ChangeLog.objects.record(
+        'comment', instance.pk, instance.post_id, author_id, group_id,
+        deleted=kwargs['signal'] is post_delete
+    )
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def record_follow_change(sender, instance, **kwargs):
+    ChangeLog.objects.record(
+        'follow', instance.user_id, None, None, None,
+        deleted=kwargs['signal'] is post_delete
+    )
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_feeds(sender, instance, **kwargs):
+    bump_generation(*post_scopes(
+        instance, getattr(instance, '_previous_group_id', None)
+    ))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comments(sender, instance, **kwargs):
+    scopes = [post_scope(instance.post_id)]
+    post = Post.objects.filter(pk=instance.post_id).only(
+        'author', 'group'
+    ).first()
+    if post is not None:
+        # Счётчик комментариев виден во всех лентах с этим постом.
+        scopes = post_scopes(post)
+    bump_generation(*scopes, author_scope(instance.author_id))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follows(sender, instance, **kwargs):
+    bump_generation(
+        author_scope(instance.author_id), author_scope(instance.user_id)
+    )
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group_feeds(sender, instance, **kwargs):
+    cache.delete_many([
+        group_slug_key(slug)
+        for slug in {instance.slug, getattr(instance, '_previous_slug', None)}
+        if slug
+    ])
+    bump_generation(INDEX, GROUPS, group_scope(instance.pk))
+
+
+@receiver(pre_save, sender=User)
+def remember_user_names(sender, instance, raw=False, update_fields=None,
+                        **kwargs):
+    instance._previous_names = None
+    if update_fields is not None and not set(update_fields) & set(
+        USER_NAME_FIELDS
+    ):
+        return
+    if instance.pk and not raw:
+        instance._previous_names = User.objects.filter(
+            pk=instance.pk
+        ).values_list(*USER_NAME_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_feeds(sender, instance, created, **kwargs):
+    # Имена видны в карточках всех лент; регистрация, вход и смена
+    # пароля их не меняют и не должны сбрасывать кеш всего сайта.
+    if created:
+        return
+    previous = getattr(instance, '_previous_names', None)
+    current = tuple(getattr(instance, name) for name in USER_NAME_FIELDS)
+    if previous is not None and previous != current:
+        bump_generation(USERS)
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_user(sender, instance, **kwargs):
+    bump_generation(USERS)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Group)
+@receiver(post_save, sender=Comment)
+def update_search_index(sender, instance, **kwargs):
+    search.index_object(instance)
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Comment)
+def remove_from_search_index(sender, instance, **kwargs):
+    search.remove_object(instance)
@@ -0,0 +1,54 @@
+"""Кеш отрисованных карточек постов для лент.
+
+Ключ карточки — id поста и отпечаток всего, что карточка показывает:
+текста, картинки, счётчиков, группы и имени автора. Правка поста,
+переименование группы или смена имени автора дают новый ключ, так что
+сбрасывать старые записи не нужно, они истекают сами. Страница ленты
+читает все карточки одним get_many и рисует только промахи.
+"""
+import hashlib
+
+from django import template
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+# Увеличьте при правке includes/posts.html, чтобы не отдавать старую разметку.
+CARD_VERSION = 1
+CARD_TEMPLATE = 'includes/posts.html'
+CARD_CACHE_TIMEOUT = 24 * 60 * 60
+
+register = template.Library()
+
+
+def card_key(post, show_group):
+    group = post.group if post.group_id else None
+    parts = (
+        CARD_VERSION, show_group, post.text, post.pub_date, post.image.name,
+        post.thumbnail, post.comment_count, post.last_commented_at,
+        post.author.username, post.author.first_name, post.author.last_name,
+        group and group.slug, group and group.title,
+    )
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return 'card:%s:%s' % (post.pk, digest)
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts):
+    """Отрисованные карточки posts по порядку, из кеша где можно."""
+    path = context['request'].path
+    show_group = path == '/' or 'profile' in path or 'group' in path
+    posts = list(posts)
+    keys = [card_key(post, show_group) for post in posts]
+    cards = cache.get_many(keys)
+    missing = {}
+    card_template = get_template(CARD_TEMPLATE)
+    for key, post in zip(keys, posts):
+        if key not in cards:
+            missing[key] = card_template.render(
+                {'post': post, 'show_group': show_group}
+            )
+    if missing:
+        cache.set_many(missing, CARD_CACHE_TIMEOUT)
+        cards.update(missing)
+    return [mark_safe(cards[key]) for key in keys]
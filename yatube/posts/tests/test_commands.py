@@ -0,0 +1,167 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase
+
+from posts.models import (
+    AuthorStats, Follow, Group, Post, TimelineEntry, User
+)
+from posts.ranking import update_ranks
+
+
+class BenchmarkCommandsTest(TestCase):
+    def test_seed_and_benchmark(self):
+        """Данные для замеров создаются, замеры печатают перцентили"""
+        call_command(
+            'seed_benchmark', users=30, posts=200, groups=3, comments=50,
+            follows=3, stdout=StringIO()
+        )
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertTrue(TimelineEntry.objects.exists())
+        author = Post.objects.values_list('author', flat=True).first()
+        self.assertEqual(
+            AuthorStats.objects.get(user=author).posts_count,
+            Post.objects.filter(author=author).count()
+        )
+        self.assertTrue(Follow.objects.exists())
+        self.assertEqual(update_ranks(), 0)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'bench.json')
+            out = StringIO()
+            call_command(
+                'benchmark_views', requests=3, warmup=1, memory_requests=1,
+                json=path, stdout=out
+            )
+            with open(path) as file:
+                results = json.load(file)
+            call_command(
+                'benchmark_views', requests=3, warmup=1, memory_requests=1,
+                baseline=path, tolerance=100, stdout=out
+            )
+        self.assertIn('posts:follow_index', results)
+        self.assertEqual(results['posts:post_detail']['queries_max'], 2)
+        self.assertIn('Регрессий нет', out.getvalue())
+
+
+class ImportExportCommandsTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author')
+        self.reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.group = Group.objects.create(title='Группа', slug='group')
+        Post.objects.create(author=self.author, text='Первый пост',
+                            group=self.group, image='posts/cat.gif')
+        Post.objects.create(author=self.author, text='Второй, "с кавычками"')
+
+    def roundtrip(self, name):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, name)
+            call_command('export_posts', path, stderr=StringIO())
+            exported = list(Post.objects.order_by('pk').values_list(
+                'text', 'pub_date', 'group', 'image'
+            ))
+            Post.objects.all().delete()
+            out = StringIO()
+            call_command('import_posts', path, batch_size=1, stdout=out,
+                         stderr=StringIO())
+        self.assertIn('Загружено постов: 2', out.getvalue())
+        self.assertEqual(
+            list(Post.objects.order_by('pk').values_list(
+                'text', 'pub_date', 'group', 'image'
+            )),
+            exported
+        )
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.author).posts_count, 2
+        )
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 2
+        )
+
+    def test_jsonl_roundtrip(self):
+        """Выгрузка в JSON Lines загружается обратно без потерь"""
+        self.roundtrip('posts.jsonl')
+
+    def test_csv_roundtrip(self):
+        """Выгрузка в CSV загружается обратно без потерь"""
+        self.roundtrip('posts.csv')
+
+    def test_import_skips_bad_rows(self):
+        """Строки с неизвестным автором и битые строки пропускаются"""
+        rows = [
+            {'text': 'Пост', 'author': 'author', 'group': 'group'},
+            {'text': 'Пост', 'author': 'nobody'},
+            {'text': 'Пост', 'author': 'author', 'pub_date': 'вчера'},
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'posts.jsonl')
+            with open(path, 'w', encoding='utf-8') as file:
+                for row in rows:
+                    file.write(json.dumps(row, ensure_ascii=False) + '\n')
+                file.write('{не json\n')
+                file.write('[1, 2]\n')
+                file.write('{"text": "Пост", "author": ["author"]}\n')
+            err = StringIO()
+            call_command('import_posts', path, stdout=StringIO(), stderr=err)
+            self.assertEqual(Post.objects.count(), 3)
+            call_command('import_posts', path, create_missing=True,
+                         stdout=StringIO(), stderr=StringIO())
+        self.assertIn('строка 2', err.getvalue())
+        self.assertIn('строка 4', err.getvalue())
+        self.assertIn('строка 5: не объект JSON', err.getvalue())
+        self.assertIn('строка 6', err.getvalue())
+        self.assertEqual(Post.objects.count(), 5)
+        self.assertTrue(User.objects.filter(username='nobody').exists())
+
+    def test_create_missing_validates_slug(self):
+        """Группа с недопустимым slug не создаётся, её строки —
+        ошибки"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'posts.jsonl')
+            with open(path, 'w', encoding='utf-8') as file:
+                for group in ('new-group', 'Не slug/../x'):
+                    file.write(json.dumps(
+                        {'text': 'Пост', 'author': 'author', 'group': group},
+                        ensure_ascii=False
+                    ) + '\n')
+            err = StringIO()
+            call_command('import_posts', path, create_missing=True,
+                         stdout=StringIO(), stderr=err)
+        self.assertTrue(Group.objects.filter(slug='new-group').exists())
+        self.assertFalse(Group.objects.filter(slug='Не slug/../x').exists())
+        self.assertIn('строка 2: нет группы', err.getvalue())
+        self.assertEqual(Post.objects.filter(group__isnull=False).count(), 2)
+
+    def test_failed_import_refreshes_committed_batches(self):
+        """Оборванная загрузка обновляет счётчики и ленты для записанного"""
+        bulk_create = Post.objects.bulk_create
+
+        def fail_second_batch(posts):
+            if Post.objects.count() > 2:
+                raise DatabaseError('диск переполнен')
+            return bulk_create(posts)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'posts.jsonl')
+            with open(path, 'w', encoding='utf-8') as file:
+                for number in range(2):
+                    file.write(json.dumps(
+                        {'text': f'Пост {number}', 'author': 'author'}
+                    ) + '\n')
+            with mock.patch.object(
+                Post.objects, 'bulk_create', fail_second_batch
+            ):
+                with self.assertRaises(DatabaseError):
+                    call_command('import_posts', path, batch_size=1,
+                                 stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.author).posts_count, 3
+        )
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 3
+        )
@@ -0,0 +1,106 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from posts.events import INDEX, broker, group_channel, stream
+from posts.models import Group, Post
+
+User = get_user_model()
+
+
+class BrokerTest(TestCase):
+    def test_publish_wakes_only_channel_subscribers(self):
+        index = broker.subscribe([INDEX])
+        group = broker.subscribe([group_channel(1)])
+        try:
+            broker.publish([INDEX])
+            self.assertTrue(index.wait(0))
+            self.assertFalse(group.wait(0))
+            self.assertFalse(index.wait(0))
+        finally:
+            broker.unsubscribe(index)
+            broker.unsubscribe(group)
+        self.assertEqual(dict(broker.channels), {})
+
+
+class StreamTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.post = Post.objects.create(author=cls.user, text='Старый')
+
+    def test_poll_finds_posts_from_other_processes(self):
+        """Без публикации поток замечает пост по номеру журнала."""
+        events = stream(
+            Post.objects.all(), [INDEX], self.post.pk,
+            poll_interval=0.01, lifetime=5
+        )
+        self.assertEqual(next(events), 'retry: 5000\n\n')
+        self.assertEqual(next(events), ': ping\n\n')
+        Post.objects.create(author=self.user, text='Новый')
+        self.assertEqual(next(events), 'event: new\ndata: {"count": 1}\n\n')
+        events.close()
+        self.assertEqual(dict(broker.channels), {})
+
+    def test_publish_wakes_stream(self):
+        events = stream(
+            Post.objects.all(), [INDEX], self.post.pk,
+            poll_interval=60, lifetime=120
+        )
+        next(events)
+        Post.objects.create(author=self.user, text='Первый')
+        self.assertIn('"count": 1', next(events))
+        Post.objects.create(author=self.user, text='Второй')
+        broker.publish([INDEX])
+        started = time.monotonic()
+        self.assertIn('"count": 2', next(events))
+        self.assertLess(time.monotonic() - started, 5)
+        events.close()
+
+    @override_settings(POST_EVENTS=True, POST_EVENTS_LIFETIME=0.05,
+                       POST_EVENTS_POLL_INTERVAL=0.01)
+    def test_feed_views(self):
+        urls = (
+            reverse('posts:index_events'),
+            reverse('posts:group_events', kwargs={'slug': 'group'}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(
+                    response['Content-Type'], 'text/event-stream'
+                )
+                chunks = [
+                    chunk.decode() for chunk in response.streaming_content
+                ]
+                self.assertEqual(chunks[0], 'retry: 5000\n\n')
+                self.assertNotIn('event: new', ''.join(chunks))
+        response = self.client.get(reverse('posts:index_events'), {
+            'after': 0
+        })
+        self.assertIn(
+            'data: {"count": 1}',
+            b''.join(response.streaming_content).decode()
+        )
+        response = self.client.get(reverse('posts:follow_events'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_disabled_by_default(self):
+        """Без POST_EVENTS нет ни потока, ни подписки на странице"""
+        response = self.client.get(reverse('posts:index_events'))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'data-events')
+
+    @override_settings(POST_EVENTS=True)
+    def test_feed_page_subscribes(self):
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(
+            response,
+            'data-events="%s?after=%s"' % (
+                reverse('posts:index_events'), self.post.pk
+            )
+        )
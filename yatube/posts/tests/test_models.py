@@ -1,7 +1,21 @@
+from datetime import timedelta
+from unittest import mock, skipUnless
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
 
-from ..models import Group, Post, Comment, Follow
+from ..models import (
+    GROUP_CACHE_TIMEOUT, AuthorStats, ChangeLog, Group, GroupStats, Post,
+    PostRank, Comment, Follow, TimelineEntry
+)
+from ..paginator import FORWARD, CursorPaginator
 
 User = get_user_model()
 
@@ -121,3 +135,314 @@ class PostModelTest(TestCase):
             with self.subTest(field_name=field_name):
                 verbose = follow._meta.get_field(field_name).help_text
                 self.assertEqual(verbose, text)
+
+
+class AuthorStatsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def get_stats(self, user):
+        return AuthorStats.objects.get(user=user)
+
+    def test_counters_follow_changes(self):
+        """Счётчики автора меняются вместе с постами, комментариями и
+        подписками."""
+        post = Post.objects.create(author=self.user, text='Пост')
+        Post.objects.create(author=self.user, text='Ещё пост')
+        Comment.objects.create(post=post, author=self.reader, text='Ок')
+        follow = Follow.objects.create(user=self.reader, author=self.user)
+        stats = self.get_stats(self.user)
+        self.assertEqual(stats.posts_count, 2)
+        self.assertEqual(stats.followers_count, 1)
+        reader_stats = self.get_stats(self.reader)
+        self.assertEqual(reader_stats.comments_count, 1)
+        self.assertEqual(reader_stats.following_count, 1)
+
+        post.delete()
+        follow.delete()
+        stats = self.get_stats(self.user)
+        self.assertEqual(stats.posts_count, 1)
+        self.assertEqual(stats.followers_count, 0)
+        reader_stats = self.get_stats(self.reader)
+        self.assertEqual(reader_stats.comments_count, 0)
+        self.assertEqual(reader_stats.following_count, 0)
+
+    def test_missing_row_is_recounted(self):
+        """Без строки статистики счётчики пересчитываются из таблиц."""
+        Post.objects.create(author=self.user, text='Пост')
+        AuthorStats.objects.filter(user=self.user).delete()
+        Post.objects.create(author=self.user, text='Ещё пост')
+        self.assertEqual(self.get_stats(self.user).posts_count, 2)
+        AuthorStats.objects.filter(user=self.user).delete()
+        user = User.objects.get(pk=self.user.pk)
+        self.assertEqual(
+            AuthorStats.objects.for_user(user).posts_count, 2)
+
+
+class GroupStatsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.other = User.objects.create_user(username='other')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.second = Group.objects.create(title='Вторая', slug='second')
+
+    def get_stats(self, group):
+        return GroupStats.objects.get(group=group)
+
+    def test_counters_follow_posts(self):
+        """Счётчики группы меняются при создании, переносе и удалении
+        постов."""
+        first = Post.objects.create(
+            author=self.user, group=self.group, text='Пост')
+        second = Post.objects.create(
+            author=self.user, group=self.group, text='Ещё пост')
+        third = Post.objects.create(
+            author=self.other, group=self.group, text='Чужой пост')
+        stats = self.get_stats(self.group)
+        self.assertEqual(stats.posts_count, 3)
+        self.assertEqual(stats.authors_count, 2)
+        self.assertEqual(stats.last_post_at, third.pub_date)
+
+        third.group = self.second
+        third.save()
+        first.delete()
+        stats = self.get_stats(self.group)
+        self.assertEqual(stats.posts_count, 1)
+        self.assertEqual(stats.authors_count, 1)
+        self.assertEqual(stats.last_post_at, second.pub_date)
+        stats = self.get_stats(self.second)
+        self.assertEqual(stats.posts_count, 1)
+        self.assertEqual(stats.authors_count, 1)
+
+        second.delete()
+        stats = self.get_stats(self.group)
+        self.assertEqual(stats.authors_count, 0)
+        self.assertIsNone(stats.last_post_at)
+
+    def test_missing_row_is_recounted(self):
+        """Без строки статистики счётчики группы пересчитываются."""
+        Post.objects.create(author=self.user, group=self.group, text='Пост')
+        GroupStats.objects.filter(group=self.group).delete()
+        Post.objects.create(author=self.user, group=self.group, text='Ещё')
+        self.assertEqual(self.get_stats(self.group).posts_count, 2)
+        GroupStats.objects.filter(group=self.group).delete()
+        self.assertEqual(
+            GroupStats.objects.for_group(self.group).authors_count, 1)
+
+
+class GroupSlugCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.group = Group.objects.create(title='Группа', slug='group')
+
+    def test_slug_lookup_is_cached_and_invalidated(self):
+        """Группа по slug берётся из кеша, пока её не изменят."""
+        Group.objects.by_slug('group')
+        with self.assertNumQueries(0):
+            self.assertEqual(Group.objects.by_slug('group'), self.group)
+        self.group.title = 'Новое название'
+        self.group.slug = 'renamed'
+        self.group.save()
+        self.assertEqual(
+            Group.objects.by_slug('renamed').title, 'Новое название')
+        with self.assertRaises(Group.DoesNotExist):
+            Group.objects.by_slug('group')
+        self.group.delete()
+        with self.assertRaises(Group.DoesNotExist):
+            Group.objects.by_slug('renamed')
+
+    def test_short_timeout_without_shared_cache(self):
+        """Без общего кеша группа кешируется на FEED_CACHE_TIMEOUT"""
+        for shared, timeout in ((False, 20), (True, GROUP_CACHE_TIMEOUT)):
+            with self.subTest(shared=shared):
+                cache.clear()
+                with override_settings(
+                    CACHE_SHARED=shared, FEED_CACHE_TIMEOUT=20
+                ), mock.patch.object(cache, 'set') as cache_set:
+                    Group.objects.by_slug('group')
+                self.assertEqual(cache_set.call_args[0][2], timeout)
+
+
+class CommentCountTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+
+    def get_post(self):
+        return Post.objects.get(pk=self.post.pk)
+
+    def test_counters_follow_comments(self):
+        """comment_count и last_commented_at меняются вместе с
+        комментариями."""
+        first = Comment.objects.create(
+            post=self.post, author=self.user, text='Первый'
+        )
+        second = Comment.objects.create(
+            post=self.post, author=self.user, text='Второй'
+        )
+        post = self.get_post()
+        self.assertEqual(post.comment_count, 2)
+        self.assertEqual(post.last_commented_at, second.created)
+        second.delete()
+        post = self.get_post()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(post.last_commented_at, first.created)
+        first.delete()
+        post = self.get_post()
+        self.assertEqual(post.comment_count, 0)
+        self.assertIsNone(post.last_commented_at)
+
+    def test_edit_keeps_concurrent_counters(self):
+        """Правка устаревшего экземпляра не затирает счётчики и
+        миниатюру, записанные после его чтения."""
+        stale = self.get_post()
+        comment = Comment.objects.create(
+            post=self.post, author=self.user, text='Комментарий'
+        )
+        Post.objects.filter(pk=self.post.pk).update(thumbnail='thumb.jpg')
+        stale.text = 'Правка'
+        stale.save()
+        post = self.get_post()
+        self.assertEqual(post.text, 'Правка')
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(post.last_commented_at, comment.created)
+        self.assertEqual(post.thumbnail, 'thumb.jpg')
+
+    def test_reconcile_fixes_drift(self):
+        """Команда сверки исправляет рассинхрон счётчиков."""
+        comment = Comment.objects.create(
+            post=self.post, author=self.user, text='Комментарий'
+        )
+        Post.objects.update(comment_count=5, last_commented_at=None)
+        out = StringIO()
+        call_command('reconcile_comment_counts', stdout=out)
+        self.assertIn('Исправлено постов: 1', out.getvalue())
+        post = self.get_post()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(post.last_commented_at, comment.created)
+
+    def test_feed_shows_count_without_queries(self):
+        """Лента показывает число комментариев без запроса на пост."""
+        for number in range(3):
+            post = Post.objects.create(author=self.user, text='Пост')
+            Comment.objects.create(post=post, author=self.user, text='Ок')
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Комментариев: 1', count=3)
+
+
+class ChangeLogTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+
+    def changes(self, seq=0):
+        return list(ChangeLog.objects.since(seq).values_list(
+            'kind', 'object_id', 'deleted'
+        ))
+
+    def test_changes_since(self):
+        """Журнал отдаёт изменения после номера, по записи на объект."""
+        post = Post.objects.create(author=self.user, text='Пост')
+        seq = ChangeLog.objects.last_seq()
+        comment = Comment.objects.create(
+            post=post, author=self.user, text='Комментарий'
+        )
+        self.assertEqual(self.changes(seq), [('comment', comment.pk, False)])
+        updated_at = post.updated_at
+        post.text = 'Правка'
+        post.save()
+        self.assertGreater(post.updated_at, updated_at)
+        self.assertEqual(self.changes(), [
+            ('comment', comment.pk, False), ('post', post.pk, False)
+        ])
+        post_pk = post.pk
+        post.delete()
+        self.assertEqual(self.changes(seq), [
+            ('comment', comment.pk, True), ('post', post_pk, True)
+        ])
+        self.assertEqual(
+            list(ChangeLog.objects.since(0, ['post']).values_list(
+                'object_id', flat=True
+            )),
+            [post_pk]
+        )
+
+    @override_settings(CHANGE_LOG_LAG=60)
+    def test_lag_holds_back_fresh_changes(self):
+        """С CHANGE_LOG_LAG свежие записи отдаются после задержки."""
+        post = Post.objects.create(author=self.user, text='Пост')
+        other = Post.objects.create(author=self.user, text='Второй пост')
+        self.assertEqual(self.changes(), [])
+        # Более поздний номер не отдаётся раньше ещё свежего меньшего.
+        ChangeLog.objects.filter(object_id=other.pk).update(
+            changed_at=timezone.now() - timedelta(minutes=2)
+        )
+        self.assertEqual(self.changes(), [])
+        ChangeLog.objects.update(
+            changed_at=timezone.now() - timedelta(minutes=2)
+        )
+        self.assertEqual(self.changes(), [
+            ('post', post.pk, False), ('post', other.pk, False)
+        ])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN из SQLite')
+class QueryPlanTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.post = Post.objects.create(
+            author=cls.user, group=cls.group, text='Пост')
+        cls.paginator = CursorPaginator(Post.objects.for_feed(), 10)
+
+    def get_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return ' | '.join(row[-1] for row in cursor.fetchall())
+
+    def keyset_page(self, queryset, keys=('-pub_date', '-pk')):
+        values = [self.post.pub_date, self.post.pk]
+        if keys[0] == '-score':
+            values[0] = self.post.rank.score
+        return self.paginator.ordered(
+            queryset, keys, values, FORWARD)[:11]
+
+    def test_feed_queries_use_indexes(self):
+        """Каждая лента читается по своему индексу без сортировки."""
+        feeds = {
+            'post_pub_date_id': self.keyset_page(Post.objects.for_feed()),
+            'post_author_pub_date': self.keyset_page(
+                self.user.posts.for_feed()),
+            'post_group_pub_date': self.keyset_page(
+                self.group.group_posts.for_feed()),
+            'timeline_user_pub_date': self.keyset_page(
+                TimelineEntry.objects.filter(user=self.user),
+                ('-pub_date', '-post_id')),
+            'rank_score': self.keyset_page(
+                PostRank.objects.all(), ('-score', '-post_id')),
+            'rank_group_score': self.keyset_page(
+                PostRank.objects.filter(group=self.group),
+                ('-score', '-post_id')),
+            'comment_post_created': self.post.comments.order_by(
+                '-created', '-id')[:11],
+            'follow_author_user': Follow.objects.filter(
+                author=self.user).values('user_id'),
+            'changelog_group': ChangeLog.objects.filter(
+                group=self.group).since(0)[:101],
+            'changelog_author': ChangeLog.objects.filter(
+                author=self.user).since(0)[:101],
+        }
+        for index, queryset in feeds.items():
+            with self.subTest(index=index):
+                plan = self.get_plan(queryset)
+                self.assertIn(index, plan)
+                self.assertNotIn('TEMP B-TREE', plan)
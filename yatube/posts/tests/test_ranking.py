@@ -0,0 +1,121 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.models import (
+    ChangeLog, ChangeLogCursor, Comment, Group, Post, PostRank, User
+)
+from posts.ranking import HOT_DECAY, RANKS_CURSOR, hot_score, update_ranks
+from posts.views import POSTS_PER_PAGE
+
+
+class HotScoreTest(TestCase):
+    def test_score_grows_with_comments_and_freshness(self):
+        now = timezone.now()
+        self.assertGreater(hot_score(now, 10), hot_score(now, 1))
+        self.assertGreater(
+            hot_score(now, 0), hot_score(now - timedelta(hours=1), 0)
+        )
+        # Десятикратная вовлечённость стоит HOT_DECAY секунд свежести.
+        self.assertAlmostEqual(
+            hot_score(now - timedelta(seconds=HOT_DECAY), 9),
+            hot_score(now, 0)
+        )
+
+
+class PostRankTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_new_post_is_ranked(self):
+        """Новый пост сразу попадает в рейтинг, смена группы — тоже"""
+        post = Post.objects.create(author=self.user, text='Пост')
+        rank = PostRank.objects.get(post=post)
+        self.assertIsNone(rank.group_id)
+        self.assertIsNone(rank.computed_at)
+        post.group = self.group
+        post.save()
+        self.assertEqual(PostRank.objects.get(post=post).group, self.group)
+
+    def test_update_is_incremental(self):
+        """Задача пересчитывает только посты с новыми и удалёнными
+        комментариями"""
+        quiet = Post.objects.create(author=self.user, text='Тихий пост')
+        busy = Post.objects.create(author=self.user, text='Обсуждаемый')
+        self.assertEqual(update_ranks(), 2)
+        self.assertEqual(update_ranks(), 0)
+        comment = Comment.objects.create(
+            post=busy, author=self.user, text='Ок'
+        )
+        score = PostRank.objects.get(post=busy).score
+        self.assertEqual(update_ranks(), 1)
+        self.assertGreater(PostRank.objects.get(post=busy).score, score)
+        self.assertGreater(
+            PostRank.objects.get(post=busy).score,
+            PostRank.objects.get(post=quiet).score
+        )
+        comment.delete()
+        out = StringIO()
+        call_command('update_hot_ranks', stdout=out)
+        self.assertIn('Пересчитано рейтингов: 1', out.getvalue())
+        self.assertAlmostEqual(PostRank.objects.get(post=busy).score, score)
+        PostRank.objects.filter(post=quiet).delete()
+        self.assertEqual(update_ranks(), 0)
+        self.assertEqual(update_ranks(full=True), 2)
+        self.assertEqual(update_ranks(), 0)
+
+    def test_deleted_posts_do_not_rewind_position(self):
+        """Удаление постов не откатывает позицию пересчёта назад"""
+        first = Post.objects.create(author=self.user, text='Первый')
+        last = Post.objects.create(author=self.user, text='Последний')
+        self.assertEqual(update_ranks(), 2)
+        last.delete()
+        self.assertEqual(update_ranks(), 0)
+        self.assertEqual(update_ranks(), 0)
+        Comment.objects.create(post=first, author=self.user, text='Ок')
+        first.delete()
+        self.assertEqual(update_ranks(), 0)
+        self.assertEqual(
+            ChangeLogCursor.objects.position(RANKS_CURSOR),
+            ChangeLog.objects.last_seq()
+        )
+
+    def test_hot_feed(self):
+        """?order=hot упорядочивает по рейтингу одним запросом"""
+        posts = [
+            Post.objects.create(
+                author=self.user, group=self.group, text=f'Пост {number}'
+            )
+            for number in range(POSTS_PER_PAGE + 2)
+        ]
+        hot = posts[0]
+        for _ in range(50):
+            Comment.objects.create(post=hot, author=self.user, text='Ок')
+        Post.objects.create(author=self.user, text='Без группы')
+        update_ranks()
+        url = reverse('posts:index') + '?order=hot'
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        page = response.context['page_obj']
+        self.assertEqual(page[0], hot)
+        self.assertContains(response, '?order=hot&amp;cursor=')
+        response = self.client.get(url + '&cursor=' + page.next_cursor)
+        self.assertEqual(len(response.context['page_obj']), 3)
+
+        response = self.client.get(
+            reverse('posts:group_posts', kwargs={'slug': 'group'})
+            + '?order=hot'
+        )
+        page = response.context['page_obj']
+        self.assertEqual(page[0], hot)
+        self.assertTrue(all(post.group_id == self.group.pk for post in page))
@@ -0,0 +1,143 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import ChangeLog, Comment, Group, Post, SearchTerm
+from posts.search import find, get_index, rebuild, tokenize
+
+User = get_user_model()
+
+
+class TokenizeTest(TestCase):
+    def test_russian_forms_share_stem(self):
+        """Падежные формы и ё сводятся к одной основе"""
+        self.assertEqual(
+            tokenize('Котами КОТЫ кот'), ['кот', 'кот', 'кот']
+        )
+        self.assertEqual(tokenize('ёжики ежиками'), ['ежик', 'ежик'])
+        self.assertEqual(tokenize('Django, 2022!'), ['django', '2022'])
+
+
+class SearchMixin:
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.group = Group.objects.create(
+            title='Коты', slug='cats', description='Всё о котах'
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, text='Мой кот любит рыбу'
+        )
+        cls.other = Post.objects.create(
+            author=cls.user, text='Собаки и кот, кот и собаки'
+        )
+        cls.comment = Comment.objects.create(
+            post=cls.other, author=cls.user, text='Какие милые коты'
+        )
+
+    def found(self, query, **kwargs):
+        results, next_cursor = find(query, **kwargs)
+        return [
+            (result['kind'], result['object'].pk) for result in results
+        ], next_cursor
+
+    def test_finds_all_kinds(self):
+        results, _ = self.found('котов')
+        self.assertCountEqual(results, [
+            ('group', self.group.pk),
+            ('post', self.post.pk),
+            ('post', self.other.pk),
+            ('comment', self.comment.pk),
+        ])
+        results, _ = self.found('кот рыба')
+        self.assertEqual(results, [('post', self.post.pk)])
+        self.assertEqual(self.found('')[0], [])
+
+    def test_ranking(self):
+        """Пост с двумя упоминаниями выше поста с одним"""
+        results, _ = self.found('собаки кот')
+        self.assertEqual(results, [('post', self.other.pk)])
+        results, _ = self.found('кот')
+        posts = [pk for kind, pk in results if kind == 'post']
+        self.assertEqual(posts, [self.other.pk, self.post.pk])
+
+    def test_index_follows_changes(self):
+        self.post.text = 'Теперь про попугаев'
+        self.post.save()
+        self.assertEqual(
+            self.found('попугай')[0], [('post', self.post.pk)]
+        )
+        self.assertEqual(self.found('рыбу')[0], [])
+        self.comment.delete()
+        self.assertNotIn(
+            ('comment', self.comment.pk), self.found('коты')[0]
+        )
+
+    def test_sync_since(self):
+        """--since доиндексирует только изменения из журнала"""
+        seq = ChangeLog.objects.last_seq()
+        # Правка в обход сигналов, как прямым UPDATE.
+        Post.objects.filter(pk=self.post.pk).update(text='Мой кот любит мясо')
+        ChangeLog.objects.record(
+            'post', self.post.pk, self.post.pk, self.user.pk, None
+        )
+        out = StringIO()
+        call_command('rebuild_search_index', since=seq, stdout=out)
+        self.assertIn('Обработано изменений: 1', out.getvalue())
+        self.assertEqual(self.found('мяса')[0], [('post', self.post.pk)])
+        self.assertEqual(self.found('рыба')[0], [])
+
+    def test_cursor_pages(self):
+        seen = []
+        cursor = None
+        while True:
+            results, cursor = self.found('кот', cursor=cursor, limit=1)
+            seen.extend(results)
+            if cursor is None:
+                break
+        self.assertEqual(seen, self.found('кот')[0])
+        self.assertEqual(len(seen), 4)
+
+
+class FTS5SearchTest(SearchMixin, TestCase):
+    pass
+
+
+@override_settings(SEARCH_BACKEND='index')
+class InvertedIndexSearchTest(SearchMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        with override_settings(SEARCH_BACKEND='index'):
+            super().setUpTestData()
+
+    def test_terms_stored(self):
+        self.assertTrue(SearchTerm.objects.filter(term='рыб').exists())
+        rebuild(get_index(), Post.objects.none())
+        self.assertFalse(SearchTerm.objects.exists())
+
+    def test_candidates_capped(self):
+        """Постинги читаются только у самых новых документов с редким
+        термом"""
+        index = get_index()
+        index.replace(3, ['кот', 'рыб'])
+        index.replace(6, ['кот', 'рыб'])
+        index.replace(9, ['кот'])
+        with mock.patch('posts.search.MAX_CANDIDATES', 1):
+            rows = index.search(['кот', 'рыб'], None, 10)
+        self.assertEqual([document for document, _ in rows], [6])
+        self.assertEqual(index.search(['кот', 'слон'], None, 10), [])
+
+
+class SearchViewTest(TestCase):
+    def test_search_page(self):
+        user = User.objects.create_user(username='auth')
+        Post.objects.create(author=user, text='Длинный пост о котах')
+        response = self.client.get(reverse('posts:search'), {'q': 'коты'})
+        self.assertTemplateUsed(response, 'posts/search.html')
+        self.assertContains(response, 'Длинный пост о котах')
+        response = self.client.get(reverse('posts:search'), {'q': 'слон'})
+        self.assertContains(response, 'Ничего не нашлось')
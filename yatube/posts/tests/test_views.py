@@ -1,16 +1,31 @@
+import io
+import json
 import shutil
 import tempfile
+import time
+import zipfile
+from unittest import mock
 
 from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
-from django.urls import reverse
+from django.test import (
+    Client, TestCase, TransactionTestCase, override_settings
+)
+from django.urls import get_resolver, reverse
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
 
 from django import forms
+from PIL import Image
 
-from posts.models import Post, Group
+from posts import thumbnails, timeline
+from posts.caching import INDEX, USERS, bump_generation, get_generation
+
+from posts.models import Comment, Follow, Post, Group, TimelineEntry
 from posts.forms import PostForm
 
 User = get_user_model()
@@ -176,10 +191,123 @@ class PaginatorViewsTest(TestCase):
                 response = self.authorized_client.get(reverse_name)
                 self.assertEqual(len(response.context[obj]), 3)
 
+    def test_cursor_pages(self):
+        """Курсоры ведут на соседние страницы без повторов и пропусков."""
+        url = reverse('posts:index')
+        first = self.authorized_client.get(url).context['page_obj']
+        self.assertFalse(first.has_previous())
+        second = self.authorized_client.get(
+            url, {'cursor': first.next_cursor}).context['page_obj']
+        self.assertEqual(len(second), 3)
+        self.assertFalse(second.has_next())
+        seen = [post.pk for post in first] + [post.pk for post in second]
+        self.assertEqual(len(set(seen)), 13)
+        back = self.authorized_client.get(
+            url, {'cursor': second.previous_cursor}).context['page_obj']
+        self.assertEqual([post.pk for post in back],
+                         [post.pk for post in first])
+        last = self.authorized_client.get(
+            url, {'cursor': first.last_cursor}).context['page_obj']
+        self.assertFalse(last.has_next())
+        self.assertEqual(len(last), 10)
+        self.assertEqual(last[len(last) - 1].pk, second[2].pk)
+
+    def test_cursor_page_without_count(self):
+        """Страница по курсору не делает COUNT и OFFSET."""
+        url = reverse('posts:index')
+        first = self.authorized_client.get(url).context['page_obj']
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_client.get(url, {'cursor': first.next_cursor})
+        sql = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('COUNT(', sql)
+        self.assertNotIn('OFFSET', sql)
+
+    def test_broken_cursor(self):
+        """Битый курсор открывает первую страницу."""
+        response = self.authorized_client.get(
+            reverse('posts:index'), {'cursor': 'garbage'})
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+
+class FeedQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.guest_client = Client()
+        cls.follower = User.objects.create_user(username='follower')
+        cls.authorized_client = Client()
+        cls.authorized_client.force_login(cls.follower)
+        cls.author = User.objects.create_user(
+            username='author', first_name='Лев', last_name='Толстой')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='slug-slug',
+            description='Тестовое описание',
+        )
+        for i in range(12):
+            user = User.objects.create_user(username=f'user{i}')
+            group = Group.objects.create(title=f'Группа {i}', slug=f'g{i}')
+            Post.objects.create(author=user, group=group, text=f'Пост {i}')
+            Post.objects.create(
+                author=cls.author, group=cls.group, text=f'Текст {i}')
+        Follow.objects.create(user=cls.follower, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_feed_queries_do_not_depend_on_page_size(self):
+        """Страница ленты строится одним запросом к постам."""
+        feeds = {
+            reverse('posts:index'): 1,
+            # Группа, её счётчики и посты.
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}): 3,
+        }
+        for url, expected in feeds.items():
+            with self.subTest(url=url):
+                with self.assertNumQueries(expected):
+                    response = self.guest_client.get(url)
+                self.assertEqual(len(response.context['page_obj']), 10)
+
+    def test_profile_counts_without_loading_posts(self):
+        """Профиль и пост показывают счётчики, не загружая все посты."""
+        url = reverse('posts:profile', kwargs={'username': 'author'})
+        with self.assertNumQueries(3):
+            response = self.guest_client.get(url)
+        self.assertEqual(response.context['stats'].posts_count, 12)
+        self.assertContains(response, 'Всего постов: 12')
+        post = self.author.posts.first()
+        with self.assertNumQueries(2):
+            response = self.guest_client.get(
+                reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        self.assertContains(response, 'Всего постов автора: 12')
+
+    def test_follow_feed_queries(self):
+        """Лента подписок не делает запрос на каждого автора и группу."""
+        self.authorized_client.get(reverse('posts:follow_index'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.get(
+                reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 10)
+        self.assertContains(response, 'Лев Толстой')
+        self.assertLessEqual(len(queries), 4)
+
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
+def get_uploaded_gif(name='small.gif'):
+    small_gif = (
+        b'\x47\x49\x46\x38\x39\x61\x02\x00'
+        b'\x01\x00\x80\x00\x00\x00\x00\x00'
+        b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+        b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+        b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+        b'\x0A\x00\x3B'
+    )
+    return SimpleUploadedFile(
+        name=name, content=small_gif, content_type='image/gif')
+
+
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class ImageTests(TestCase):
     @classmethod
@@ -240,6 +368,31 @@ class ImageTests(TestCase):
             ).exists()
         )
 
+    @override_settings(POST_THUMBNAIL_WORKERS=0)
+    def test_thumbnail_is_precomputed(self):
+        """Миниатюра готовится при сохранении и выводится по готовому URL"""
+        post = Post.objects.create(
+            text='С картинкой', author=self.user,
+            image=get_uploaded_gif('thumb.gif'))
+        post.refresh_from_db()
+        self.assertTrue(post.thumbnail)
+        with Image.open(default_storage.path(post.thumbnail)) as image:
+            self.assertEqual(image.size, thumbnails.THUMBNAIL_SIZE)
+        response = self.authorized_client.get(reverse(
+            'posts:post_detail', kwargs={'post_id': post.pk}))
+        self.assertContains(response, post.thumbnail_url)
+
+    def test_thumbnail_placeholder(self):
+        """Пока миниатюры нет, вместо нее выводится заглушка"""
+        post = Post.objects.create(
+            text='С картинкой', author=self.user,
+            image=get_uploaded_gif('wait.gif'))
+        post.refresh_from_db()
+        self.assertEqual(post.thumbnail, '')
+        response = self.authorized_client.get(reverse(
+            'posts:post_detail', kwargs={'post_id': post.pk}))
+        self.assertContains(response, 'Изображение обрабатывается')
+
     def test_img_index(self):
         """Картинки отображаются на главной странице"""
         response_index = self.authorized_client.get(reverse('posts:index'))
@@ -268,6 +421,25 @@ class ImageTests(TestCase):
             'post').image, self.post.image)
 
 
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, POST_THUMBNAIL_WORKERS=1)
+class ThumbnailWorkerTest(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_thumbnail_worker_process(self):
+        """Миниатюра считается в пуле процессов после коммита"""
+        user = User.objects.create_user(username='auth')
+        post = Post.objects.create(
+            text='С картинкой', author=user,
+            image=get_uploaded_gif('pool.gif'))
+        thumbnails.wait()
+        post.refresh_from_db()
+        self.assertEqual(post.thumbnail, thumbnails.thumbnail_name(post))
+        self.assertTrue(default_storage.exists(post.thumbnail))
+
+
 class FollowingCaseTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -320,6 +492,80 @@ class FollowingCaseTest(TestCase):
         self.assertEqual(response.status_code, 302)
 
 
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.authorized_client = Client()
+        cls.authorized_client.force_login(cls.user)
+        cls.author = User.objects.create_user(username='dmitry')
+        cls.star = User.objects.create_user(username='star')
+        cls.old_post = Post.objects.create(
+            text='Старый пост', author=cls.author)
+
+    def get_feed(self, **params):
+        response = self.authorized_client.get(
+            reverse('posts:follow_index'), params)
+        return response.context['page_obj']
+
+    def test_fan_out_backfill_and_prune(self):
+        """Подписка заполняет входящие, новый пост раскладывается,
+        отписка их чистит."""
+        Follow.objects.create(user=self.user, author=self.author)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user, post=self.old_post).exists())
+        new_post = Post.objects.create(text='Новый пост', author=self.author)
+        self.assertEqual(
+            [post.pk for post in self.get_feed()],
+            [new_post.pk, self.old_post.pk]
+        )
+        Follow.objects.filter(user=self.user, author=self.author).delete()
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.user).exists())
+        self.assertEqual(len(self.get_feed()), 0)
+
+    def test_pulled_author(self):
+        """Посты популярного автора читаются напрямую и не дублируются."""
+        Follow.objects.create(user=self.user, author=self.author)
+        Follow.objects.create(user=self.user, author=self.star)
+        shared = Post.objects.create(text='До популярности', author=self.star)
+        with mock.patch('posts.timeline.FANOUT_FOLLOWERS_LIMIT', 0):
+            timeline.update_mode(self.star.pk)
+            posts = [
+                Post.objects.create(text=f'Звезда {i}', author=self.star)
+                for i in range(12)
+            ]
+            self.assertFalse(TimelineEntry.objects.filter(
+                post__in=posts).exists())
+            first = self.get_feed()
+            second = self.get_feed(cursor=first.next_cursor)
+        seen = [post.pk for post in first] + [post.pk for post in second]
+        expected = [post.pk for post in reversed(posts)]
+        expected += [shared.pk, self.old_post.pk]
+        self.assertEqual(seen, expected)
+
+    def test_posts_survive_mode_switch(self):
+        """Посты, написанные в режиме pulled, остаются в ленте после
+        возврата автора к раскладке."""
+        readers = [
+            User.objects.create_user(username=f'reader{number}')
+            for number in range(2)
+        ]
+        with mock.patch('posts.timeline.FANOUT_FOLLOWERS_LIMIT', 2):
+            for user in [self.user, *readers]:
+                Follow.objects.create(user=user, author=self.star)
+            self.assertTrue(timeline.is_pulled(self.star.pk))
+            post = Post.objects.create(text='Звезда', author=self.star)
+            # Обратно автор переходит только ниже половины порога.
+            Follow.objects.filter(user=readers[0]).delete()
+            self.assertTrue(timeline.is_pulled(self.star.pk))
+            Follow.objects.filter(user=readers[1]).delete()
+            self.assertFalse(timeline.is_pulled(self.star.pk))
+            self.assertEqual([entry.pk for entry in self.get_feed()],
+                             [post.pk])
+
+
 class CacheCaseTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -329,16 +575,318 @@ class CacheCaseTest(TestCase):
         cls.authorized_client.force_login(cls.user)
 
     def test_cache_index(self):
-        """Пост остается в кэше до очистки кэша"""
+        """Удаленный пост сразу пропадает из кэша главной страницы"""
         cache.clear()
         self.post = Post.objects.create(text='Тестовый пост', author=self.user)
         self.authorized_client.get(reverse('posts:index'))
         self.post.delete()
         response = self.authorized_client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'Тестовый пост')
+
+    def test_cached_page_skips_database(self):
+        """Повторный запрос страницы не обращается к базе"""
+        Post.objects.create(text='Тестовый пост', author=self.user)
+        guest_client = Client()
+        guest_client.get(reverse('posts:index'))
+        with self.assertNumQueries(0):
+            response = guest_client.get(reverse('posts:index'))
         self.assertContains(response, 'Тестовый пост')
+
+    def test_cache_varies_by_page(self):
+        """Разные страницы ленты кэшируются отдельно"""
+        Post.objects.bulk_create(
+            Post(text=f'Пост номер {i}', author=self.user) for i in range(11)
+        )
+        Post.objects.create(text='Свежий пост', author=self.user)
+        first = self.authorized_client.get(reverse('posts:index'))
+        second = self.authorized_client.get(reverse('posts:index') + '?page=2')
+        self.assertContains(first, 'Свежий пост')
+        self.assertNotContains(second, 'Свежий пост')
+
+    def test_cache_follows_edits(self):
+        """Правка автора и группы сразу видна в кэшированной ленте"""
+        group = Group.objects.create(title='Старое название', slug='cached')
+        author = User.objects.create_user(username='writer')
+        Post.objects.create(text='Пост', author=author, group=group)
+        url = reverse('posts:group_posts', kwargs={'slug': group.slug})
+        self.authorized_client.get(url)
+        self.authorized_client.get(reverse('posts:index'))
+        group.title = 'Новое название'
+        group.save()
+        author.first_name = 'Фёдор'
+        author.save()
+        for address in (url, reverse('posts:index')):
+            with self.subTest(address=address):
+                response = self.authorized_client.get(address)
+                self.assertContains(response, 'Новое название')
+                self.assertContains(response, 'Фёдор')
+
+
+class CacheCommitTest(TransactionTestCase):
+    def test_page_cached_before_commit_is_dropped(self):
+        """Страница, собранная до коммита записи, не переживает коммит"""
         cache.clear()
-        response = self.authorized_client.get(reverse('posts:index'))
-        self.assertNotContains(response, 'Тестовый пост')
+        user = User.objects.create_user(username='auth')
+        with transaction.atomic():
+            Post.objects.create(text='Пост', author=user)
+            # Так ключ видит параллельный запрос, читающий старые строки.
+            generation = get_generation(INDEX)
+        self.assertNotEqual(get_generation(INDEX), generation)
+
+
+@override_settings(CACHE_SHARED=True)
+class ConditionalResponseTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.author = User.objects.create_user(username='writer')
+        cls.group = Group.objects.create(title='Группа', slug='conditional')
+        cls.post = Post.objects.create(
+            text='Пост', author=cls.author, group=cls.group
+        )
+        cls.authorized_client = Client()
+        cls.authorized_client.force_login(cls.user)
+        cls.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_posts', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile', kwargs={'username': 'writer'}),
+            reverse('posts:post_detail', kwargs={'post_id': cls.post.pk}),
+        )
+
+    def test_not_modified(self):
+        """Повтор с If-None-Match получает 304 с теми же заголовками"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIn('Last-Modified', response)
+                repeat = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag']
+                )
+                self.assertEqual(repeat.status_code, 304)
+                self.assertIn('Cookie', repeat['Vary'])
+                self.assertIn('public', repeat['Cache-Control'])
+                repeat = self.client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+                )
+                self.assertEqual(repeat.status_code, 304)
+
+    def test_not_modified_skips_database(self):
+        """304 для главной отдаётся без запросов к базе"""
+        etag = self.client.get(self.urls[0])['ETag']
+        with self.assertNumQueries(0):
+            self.client.get(self.urls[0], HTTP_IF_NONE_MATCH=etag)
+
+    def test_private_for_users(self):
+        """Страница пользователя своя: другой ETag и private"""
+        for url in self.urls:
+            with self.subTest(url=url):
+                anonymous = self.client.get(url)
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=anonymous['ETag']
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('private', response['Cache-Control'])
+                self.assertNotIn('Last-Modified', response)
+
+    @override_settings(CACHE_SHARED=False)
+    def test_local_cache_window(self):
+        """Без общего кеша ETag и Last-Modified сдвигаются с окном"""
+        url = self.urls[0]
+        with mock.patch('posts.caching.local_window', return_value=0):
+            response = self.client.get(url)
+            repeat = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(repeat.status_code, 304)
+        later = int(time.time()) + 60
+        headers = (
+            {'HTTP_IF_NONE_MATCH': response['ETag']},
+            {'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']},
+        )
+        with mock.patch('posts.caching.local_window', return_value=later):
+            for header in headers:
+                with self.subTest(header=header):
+                    repeat = self.client.get(url, **header)
+                    self.assertEqual(repeat.status_code, 200)
+
+    def test_new_csrf_secret_changes_etag(self):
+        """Новый CSRF-секрет после входа не даёт 304 со старыми формами"""
+        client = Client()
+        client.force_login(self.user)
+        for url in self.urls:
+            with self.subTest(url=url):
+                client.cookies[settings.CSRF_COOKIE_NAME] = 'a' * 64
+                etag = client.get(url)['ETag']
+                client.cookies[settings.CSRF_COOKIE_NAME] = 'b' * 64
+                response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_changes_update_etag(self):
+        """Комментарий, подписка и правка группы меняют ETag"""
+        detail, profile = self.urls[3], self.urls[2]
+        changes = (
+            (detail, lambda: Comment.objects.create(
+                post=self.post, author=self.user, text='Комментарий'
+            )),
+            (profile, lambda: Follow.objects.create(
+                user=self.user, author=self.author
+            )),
+            (detail, lambda: Group.objects.filter(pk=self.group.pk).first(
+            ).save()),
+        )
+        for url, change in changes:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                change()
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='auth', first_name='Лев', last_name='Толстой'
+        )
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        for number in range(3):
+            Post.objects.create(
+                author=cls.user, group=cls.group, text=f'Пост {number}'
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def get_index(self):
+        # Новое поколение главной: страница рисуется заново, но
+        # карточки остаются в кеше.
+        bump_generation(INDEX)
+        return self.client.get(reverse('posts:index'))
+
+    def test_cards_are_reused(self):
+        """Карточки берутся из кеша, шаблон карточки не рисуется"""
+        with self.assertTemplateUsed('includes/posts.html'):
+            self.get_index()
+        with self.assertTemplateNotUsed('includes/posts.html'):
+            response = self.get_index()
+        self.assertContains(response, 'Пост 2')
+        self.assertContains(response, 'все записи группы Группа', count=3)
+
+    def test_cards_follow_changes(self):
+        """Правка поста, группы или имени автора меняет карточку"""
+        self.get_index()
+        post = Post.objects.latest('pk')
+        post.text = 'Исправленный пост'
+        post.save()
+        self.group.title = 'Новая группа'
+        self.group.save()
+        self.user.first_name = 'Лёва'
+        self.user.save()
+        response = self.get_index()
+        self.assertContains(response, 'Исправленный пост')
+        self.assertContains(response, 'все записи группы Новая группа',
+                            count=3)
+        self.assertContains(response, 'Лёва Толстой', count=3)
+
+    def test_only_name_changes_reset_users(self):
+        """Регистрация, вход и смена пароля не сбрасывают ленты"""
+        generation = get_generation(USERS)
+        reader = User.objects.create_user(username='reader')
+        reader.set_password('secret')
+        reader.save()
+        self.client.force_login(reader)
+        self.assertEqual(get_generation(USERS), generation)
+        reader.last_name = 'Читатель'
+        reader.save()
+        self.assertNotEqual(get_generation(USERS), generation)
+
+    def test_group_link_depends_on_page(self):
+        """Карточки главной и ленты подписок кешируются раздельно"""
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=reader, author=self.user)
+        self.get_index()
+        self.client.force_login(reader)
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertContains(response, 'Пост 2')
+        self.assertNotContains(response, 'все записи группы')
+
+
+class GroupIndexTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        for number in range(3):
+            group = Group.objects.create(
+                title=f'Группа {number}', slug=f'group{number}'
+            )
+            for _ in range(number):
+                Post.objects.create(author=cls.user, group=group, text='Пост')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_directory_lists_groups_with_stats(self):
+        """Каталог показывает группы и их счётчики одним запросом"""
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('posts:group_index'))
+        self.assertEqual(
+            [group.slug for group in response.context['page_obj']],
+            ['group0', 'group1', 'group2']
+        )
+        self.assertContains(response, 'Постов: 2, авторов: 1')
+        with self.assertNumQueries(0):
+            self.client.get(reverse('posts:group_index'))
+
+    def test_directory_follows_new_posts(self):
+        self.client.get(reverse('posts:group_index'))
+        group = Group.objects.get(slug='group0')
+        Post.objects.create(author=self.user, group=group, text='Пост')
+        response = self.client.get(reverse('posts:group_index'))
+        self.assertContains(response, 'Постов: 1, авторов: 1', count=2)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ExportDataTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.other = User.objects.create_user(username='other')
+        Follow.objects.create(user=cls.user, author=cls.other)
+        Follow.objects.create(user=cls.other, author=cls.user)
+        cls.post = Post.objects.create(author=cls.user, text='Мой пост')
+        Post.objects.create(author=cls.other, text='Чужой пост')
+        Comment.objects.create(post=cls.post, author=cls.user,
+                               text='Мой комментарий')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_guest_redirected(self):
+        response = Client().get(reverse('posts:export_data'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_archive_streams_user_data(self):
+        """Архив содержит только данные пользователя и отдаётся кусками"""
+        image = bytes(range(256)) * 4096
+        self.post.image.save('big.gif', ContentFile(image))
+        client = Client()
+        client.force_login(self.user)
+        response = client.get(reverse('posts:export_data'))
+        self.assertTrue(response.streaming)
+        chunks = list(response.streaming_content)
+        self.assertLess(max(map(len, chunks)), len(image))
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+        posts = [
+            json.loads(line)
+            for line in archive.read('posts.jsonl').decode().splitlines()
+        ]
+        self.assertEqual([post['text'] for post in posts], ['Мой пост'])
+        self.assertIn('Мой комментарий',
+                      archive.read('comments.jsonl').decode())
+        self.assertIn('other', archive.read('following.jsonl').decode())
+        self.assertIn('other', archive.read('followers.jsonl').decode())
+        self.assertEqual(archive.read(self.post.image.name), image)
 
 
 class CommentCaseTests(TestCase):
@@ -369,3 +917,138 @@ class CommentCaseTests(TestCase):
         response = self.guest_client.get(reverse(
             'posts:post_detail', kwargs={'post_id': self.post.pk}))
         self.assertNotContains(response, 'Тестовый комментарий')
+
+
+class CommentPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(
+            text='Популярный пост', author=cls.author
+        )
+        readers = [
+            User.objects.create_user(username=f'reader{i}') for i in range(25)
+        ]
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=readers[i % 25], text=f'Ответ {i}')
+            for i in range(50)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_detail_shows_first_page(self):
+        """Пост загружает одну страницу комментариев с авторами сразу"""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        comments = response.context['comments']
+        self.assertEqual(len(comments), 20)
+        self.assertEqual(response.content.decode().count('Ответ '), 20)
+        self.assertLess(len(response.content), 20000)
+        self.assertContains(response, 'Показать ещё комментарии')
+
+    def test_fragments_load_the_rest(self):
+        """Фрагменты отдают остальные комментарии без повторов"""
+        page = self.client.get(reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk}
+        )).context['comments']
+        seen = [comment.pk for comment in page]
+        while page.more_url:
+            with self.assertNumQueries(2):
+                response = self.client.get(page.more_url)
+            self.assertTemplateUsed(response, 'includes/comment_list.html')
+            page = response.context['comments']
+            seen.extend(comment.pk for comment in page)
+        self.assertEqual(
+            seen,
+            list(self.post.comments.order_by(
+                '-created', '-pk'
+            ).values_list('pk', flat=True))
+        )
+
+    def test_fragment_for_missing_post(self):
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': 0})
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(QUERY_BUDGET_STRICT=True)
+class QueryBudgetRoutesTest(TestCase):
+    """Сверх бюджета маршрута запрос падает при любом раннере."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader')
+        for i in range(15):
+            author = User.objects.create_user(username=f'author{i}')
+            group = Group.objects.create(title=f'Группа {i}', slug=f'g{i}')
+            post = Post.objects.create(
+                author=author, group=group, text=f'Пост про котов {i}'
+            )
+            Comment.objects.create(
+                post=post, author=author, text=f'Комментарий {i}'
+            )
+            Follow.objects.create(user=cls.reader, author=author)
+        cls.post = post
+
+    def test_routes_within_budget_with_many_authors(self):
+        client = Client()
+        client.force_login(self.reader)
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:index') + '?order=hot',
+            reverse('posts:group_posts', kwargs={'slug': 'g0'}),
+            reverse('posts:group_posts', kwargs={'slug': 'g0'}) + '?order=hot',
+            reverse('posts:group_index'),
+            reverse('posts:profile', kwargs={'username': 'author0'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            reverse('posts:follow_index'),
+            reverse('posts:search') + '?q=коты',
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                cache.clear()
+                self.assertEqual(client.get(url).status_code, 200)
+
+    def test_write_routes_within_budget(self):
+        client = Client()
+        client.force_login(self.reader)
+        post_id = self.post.pk
+        requests = (
+            (reverse('posts:post_create'), {'text': 'Новый пост'}),
+            (reverse('posts:add_comment', kwargs={'post_id': post_id}),
+             {'text': 'Комментарий'}),
+            (reverse('posts:profile_unfollow',
+                     kwargs={'username': 'author0'}), None),
+            (reverse('posts:profile_follow',
+                     kwargs={'username': 'author0'}), None),
+        )
+        for url, data in requests:
+            with self.subTest(url=url):
+                if data is None:
+                    response = client.get(url)
+                else:
+                    response = client.post(url, data)
+                self.assertEqual(response.status_code, 302)
+        own = Post.objects.filter(author=self.reader).get()
+        response = client.post(
+            reverse('posts:post_edit', kwargs={'post_id': own.pk}),
+            {'text': 'Исправленный пост'},
+        )
+        self.assertEqual(response.status_code, 302)
+
+    def test_every_route_has_budget(self):
+        for app in ('posts', 'api'):
+            resolver = get_resolver(app + '.urls')
+            for name in resolver.reverse_dict:
+                if not isinstance(name, str):
+                    continue
+                view_name = '%s:%s' % (app, name)
+                with self.subTest(view_name=view_name):
+                    self.assertTrue(
+                        view_name in settings.QUERY_BUDGETS
+                        or view_name in settings.QUERY_BUDGET_EXEMPT
+                    )
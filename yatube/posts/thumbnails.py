@@ -0,0 +1,121 @@
+"""Миниатюры картинок постов, которые готовятся заранее.
+
+После сохранения поста с новой картинкой миниатюра считается в пуле
+процессов (POST_THUMBNAIL_WORKERS), а её имя записывается в
+Post.thumbnail. Шаблоны только читают готовый URL, а пока миниатюры нет,
+показывают заглушку. При POST_THUMBNAIL_WORKERS = 0 миниатюра считается
+сразу, в том же процессе.
+"""
+import hashlib
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from core import perf
+from .caching import bump_generation, post_scopes
+from .models import ChangeLog, Post
+
+THUMBNAIL_SIZE = (960, 339)
+THUMBNAIL_DIR = 'thumbnails/posts'
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_pid = None
+
+
+def thumbnail_name(post):
+    digest = hashlib.md5(post.image.name.encode()).hexdigest()[:12]
+    return '%s/%s_%sx%s.jpg' % (THUMBNAIL_DIR, digest, *THUMBNAIL_SIZE)
+
+
+def render_thumbnail(source, target, size):
+    """Обрезает по центру и масштабирует картинку; выполняется в воркере."""
+    with Image.open(source) as image:
+        image = ImageOps.fit(image.convert('RGB'), size, Image.LANCZOS)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    image.save(target, 'JPEG', quality=85, optimize=True)
+    return target
+
+
+def get_executor():
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ProcessPoolExecutor(settings.POST_THUMBNAIL_WORKERS)
+        _executor_pid = os.getpid()
+    return _executor
+
+
+def wait():
+    """Дожидается всех миниатюр, поставленных в очередь этим процессом."""
+    global _executor
+    if _executor is not None and _executor_pid == os.getpid():
+        _executor.shutdown(wait=True)
+    _executor = None
+
+
+def store_thumbnail(post_id, image, name, scopes):
+    updated = Post.objects.filter(pk=post_id, image=image).update(
+        thumbnail=name, updated_at=timezone.now()
+    )
+    if updated:
+        author_id, group_id = Post.objects.filter(
+            pk=post_id
+        ).values_list('author', 'group').first() or (None, None)
+        ChangeLog.objects.record(
+            'post', post_id, post_id, author_id, group_id
+        )
+        bump_generation(*scopes)
+
+
+def _thumbnail_ready(post_id, image, name, scopes, future):
+    try:
+        future.result()
+        store_thumbnail(post_id, image, name, scopes)
+    except Exception:
+        logger.exception('Не удалось подготовить миниатюру поста %s', post_id)
+    finally:
+        # Колбэк выполняется в служебном потоке пула со своим соединением.
+        connection.close()
+
+
+def schedule(post):
+    """Ставит расчёт миниатюры в очередь после коммита транзакции."""
+    if not post.image:
+        return
+    name = thumbnail_name(post)
+    args = (post.pk, post.image.name, name, post_scopes(post))
+    try:
+        source = post.image.path
+        target = default_storage.path(name)
+    except (SuspiciousFileOperation, NotImplementedError):
+        logger.warning('Картинка поста %s вне MEDIA_ROOT', post.pk)
+        return
+    if not settings.POST_THUMBNAIL_WORKERS:
+        try:
+            with perf.timed('thumbnail'):
+                render_thumbnail(source, target, THUMBNAIL_SIZE)
+        except OSError:
+            logger.exception(
+                'Не удалось подготовить миниатюру поста %s', post.pk
+            )
+        else:
+            store_thumbnail(*args)
+            post.thumbnail = name
+        return
+
+    def submit():
+        future = get_executor().submit(
+            render_thumbnail, source, target, THUMBNAIL_SIZE
+        )
+        future.add_done_callback(partial(_thumbnail_ready, *args))
+
+    transaction.on_commit(submit)
@@ -0,0 +1,153 @@
+"""Лента подписок, материализованная при записи (fan-out on write).
+
+Новый пост раскладывается в TimelineEntry каждому подписчику автора.
+Автор, у которого подписчиков стало больше FANOUT_FOLLOWERS_LIMIT,
+переводится в режим pulled: его посты не раскладываются, лента читает
+их напрямую и сливает с входящими. Режим записан в AuthorStats и
+меняется только в update_mode. Обратно автор переходит, когда
+подписчиков становится вдвое меньше порога, и тогда входящие всех его
+подписчиков дозаполняются.
+
+Во входящие при подписке и при возврате в раскладку попадают только
+BACKFILL_POSTS последних постов автора; более старые посты в ленте
+подписок не видны.
+"""
+from django.utils.functional import cached_property
+
+from .bulk import batches
+from .models import AuthorStats, Follow, Post, TimelineEntry
+from .paginator import FORWARD, CursorPaginator
+
+FANOUT_FOLLOWERS_LIMIT = 1000
+BACKFILL_POSTS = 200
+BATCH_SIZE = 500
+
+
+def is_pulled(author_id):
+    return AuthorStats.objects.filter(user=author_id, pulled=True).exists()
+
+
+def update_mode(author_id):
+    """Переключает режим автора после смены числа подписчиков."""
+    stats = AuthorStats.objects.filter(user=author_id).values_list(
+        'followers_count', 'pulled'
+    ).first()
+    if stats is None:
+        return
+    followers, pulled = stats
+    if not pulled and followers > FANOUT_FOLLOWERS_LIMIT:
+        AuthorStats.objects.filter(user=author_id).update(pulled=True)
+    elif pulled and followers <= FANOUT_FOLLOWERS_LIMIT // 2:
+        AuthorStats.objects.filter(user=author_id).update(pulled=False)
+        # Посты, написанные в режиме pulled, не раскладывались никому.
+        fill(
+            Follow.objects.filter(author=author_id).values_list(
+                'user_id', flat=True
+            ).iterator(),
+            author_id
+        )
+
+
+def fan_out(post):
+    """Кладёт новый пост во входящие подписчиков автора."""
+    if is_pulled(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author=post.author_id
+    ).values_list('user_id', flat=True)
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(
+                user_id=user_id,
+                post_id=post.pk,
+                author_id=post.author_id,
+                pub_date=post.pub_date
+            )
+            for user_id in followers.iterator()
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def fill(user_ids, author_id):
+    """Кладёт последние посты автора во входящие user_ids."""
+    posts = list(Post.objects.filter(
+        author=author_id
+    ).order_by('-pub_date', '-pk').values_list(
+        'pk', 'pub_date'
+    )[:BACKFILL_POSTS])
+    if not posts:
+        return
+    entries = (
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post_id,
+            author_id=author_id,
+            pub_date=pub_date
+        )
+        for user_id in user_ids
+        for post_id, pub_date in posts
+    )
+    for batch in batches(entries, BATCH_SIZE):
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def backfill(user_id, author_id):
+    """После подписки добавляет во входящие последние посты автора."""
+    if is_pulled(author_id):
+        return
+    fill([user_id], author_id)
+
+
+def prune(user_id, author_id):
+    """После отписки убирает посты автора из входящих."""
+    TimelineEntry.objects.filter(user=user_id, author=author_id).delete()
+
+
+class TimelinePaginator(CursorPaginator):
+    """Курсорная пагинация ленты подписок поверх входящих и pull-авторов."""
+
+    def __init__(self, user, per_page):
+        super().__init__(Post.objects.for_feed(), per_page)
+        self.user = user
+
+    @cached_property
+    def pulled_authors(self):
+        return list(
+            Follow.objects.filter(
+                user=self.user, author__stats__pulled=True
+            ).values_list('author_id', flat=True)
+        )
+
+    def _sources(self):
+        inbox = TimelineEntry.objects.filter(user=self.user)
+        yield inbox, ('-pub_date', '-post_id')
+        if self.pulled_authors:
+            pulled = self.object_list.filter(author__in=self.pulled_authors)
+            yield pulled, self.keys
+
+    def _fetch(self, values, direction, limit, offset=0):
+        posts = {}
+        for queryset, keys in self._sources():
+            queryset = self.ordered(queryset, keys, values, direction)
+            if queryset.model is TimelineEntry:
+                ids = queryset.values('post_id')[:offset + limit]
+                queryset = self.object_list.filter(pk__in=ids)
+            for post in queryset[:offset + limit]:
+                posts[post.pk] = post
+        rows = sorted(
+            posts.values(),
+            key=lambda post: (post.pub_date, post.pk),
+            reverse=direction == FORWARD
+        )
+        return rows[offset:offset + limit]
+
+    @property
+    def count(self):
+        count = TimelineEntry.objects.filter(user=self.user).count()
+        if self.pulled_authors:
+            count += Post.objects.filter(
+                author__in=self.pulled_authors
+            ).count()
+        return count
@@ -6,14 +6,23 @@ app_name = 'posts'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('events/', views.index_events, name='index_events'),
     path('create/', views.post_create, name='post_create'),
+    path('group/', views.group_index, name='group_index'),
     path('group/<slug:slug>/', views.group_posts, name='group_posts'),
+    path('group/<slug:slug>/events/',
+         views.group_events, name='group_events'),
     path('profile/<str:username>/', views.profile, name='profile'),
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path('posts/<int:post_id>/comment/',
          views.add_comment, name='add_comment'),
+    path('posts/<int:post_id>/comments/',
+         views.post_comments, name='post_comments'),
     path('follow/', views.follow_index, name='follow_index'),
+    path('follow/events/', views.follow_events, name='follow_events'),
+    path('search/', views.search, name='search'),
+    path('export/', views.export_data, name='export_data'),
     path('profile/<str:username>/follow/',
          views.profile_follow,
          name='profile_follow'
@@ -1,73 +1,253 @@
+from django.conf import settings
+from django.http import (
+    Http404, HttpResponseBadRequest, StreamingHttpResponse
+)
+from django.utils.functional import SimpleLazyObject
 from django.shortcuts import get_object_or_404, redirect, render
-from django.core.paginator import Paginator
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
 
+from core.concurrency import gather
+from . import archive, events
+from .caching import (
+    FEED_CACHE_TIMEOUT, GROUPS, HOT, INDEX, author_scope, conditional,
+    feed_cache_key, group_scope, post_scope, request_memo
+)
 from .forms import PostForm, CommentForm
-from .models import Group, Post, User, Follow
+from .models import (
+    AuthorStats, Comment, Group, GroupStats, Post, PostRank, User, Follow
+)
+from .paginator import CursorPaginator
+from .ranking import RankPaginator
+from .search import find
+from .timeline import TimelinePaginator
 
 
 POSTS_PER_PAGE = 10
+COMMENTS_PER_PAGE = 20
+SEARCH_RESULTS_PER_PAGE = 20
+GROUPS_PER_PAGE = 20
+HOT_ORDER = 'hot'
 
 
+def get_page_obj(request, paginator):
+    return paginator.get_page(
+        request.GET.get('page'), request.GET.get('cursor')
+    )
+
+
+def get_comments_page(post_id, cursor=None):
+    """Страница комментариев поста со ссылкой на следующую (more_url)."""
+    comments = Comment.objects.filter(post_id=post_id).select_related(
+        'author'
+    ).only('post', 'text', 'created', 'author__username')
+    paginator = CursorPaginator(
+        comments, COMMENTS_PER_PAGE, keys=('-created', '-pk')
+    )
+    page = paginator.get_page(cursor=cursor)
+    page.more_url = None
+    if page.next_cursor is not None:
+        page.more_url = '%s?cursor=%s' % (
+            reverse('posts:post_comments', args=(post_id,)),
+            page.next_cursor
+        )
+    return page
+
+
+def get_group(request, slug):
+    def find():
+        try:
+            return Group.objects.by_slug(slug)
+        except Group.DoesNotExist:
+            raise Http404
+    return request_memo(request, 'group', find)
+
+
+def get_author(request, username):
+    return request_memo(request, 'author', lambda: get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    ))
+
+
+def get_post(request, post_id):
+    return request_memo(request, 'post', lambda: get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), pk=post_id
+    ))
+
+
+def is_hot(request):
+    return request.GET.get('order') == HOT_ORDER
+
+
+def feed_scopes(request, *scopes):
+    """Области ленты; популярная зависит ещё и от пересчёта рейтинга."""
+    if is_hot(request):
+        return [*scopes, HOT]
+    return list(scopes)
+
+
+def feed_paginator(request, posts, ranks, scopes):
+    """Хронологическая лента или, с ?order=hot, по рейтингу."""
+    cache_key = feed_cache_key(request, *scopes)
+    if is_hot(request):
+        paginator = RankPaginator(
+            ranks, POSTS_PER_PAGE,
+            cache_key=cache_key, cache_timeout=FEED_CACHE_TIMEOUT
+        )
+    else:
+        paginator = CursorPaginator(
+            posts, POSTS_PER_PAGE,
+            cache_key=cache_key, cache_timeout=FEED_CACHE_TIMEOUT
+        )
+    return paginator, cache_key
+
+
+@conditional(lambda request: feed_scopes(request, INDEX), per_user=True)
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator, cache_key = feed_paginator(
+        request,
+        Post.objects.for_feed(),
+        PostRank.objects.all(),
+        feed_scopes(request, INDEX)
+    )
+    page_obj = get_page_obj(request, paginator)
     context = {
         'page_obj': page_obj,
+        'order': request.GET.get('order', ''),
+        'feed_cache_key': cache_key,
+        'feed_cache_timeout': FEED_CACHE_TIMEOUT,
+        'events_enabled': settings.POST_EVENTS,
     }
     return render(request, 'posts/index.html', context)
 
 
+@conditional(
+    lambda request, slug: feed_scopes(
+        request, group_scope(get_group(request, slug).pk)
+    ),
+    per_user=True
+)
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    posts = group.group_posts.all()
-    paginator = Paginator(posts, POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    group = get_group(request, slug)
+    paginator, cache_key = feed_paginator(
+        request,
+        group.group_posts.for_feed(),
+        PostRank.objects.filter(group=group),
+        feed_scopes(request, group_scope(group.pk))
+    )
+    page_obj = get_page_obj(request, paginator)
     context = {
         'group': group,
+        # Читается только при промахе кеша фрагмента ленты.
+        'stats': SimpleLazyObject(
+            lambda: GroupStats.objects.for_group(group)
+        ),
         'page_obj': page_obj,
+        'order': request.GET.get('order', ''),
+        'feed_cache_key': cache_key,
+        'feed_cache_timeout': FEED_CACHE_TIMEOUT,
+        'events_enabled': settings.POST_EVENTS,
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@conditional(lambda request: [INDEX, GROUPS], per_user=True)
+def group_index(request):
+    """Каталог групп со статистикой, страницы кешируются как ленты."""
+    cache_key = feed_cache_key(request, INDEX, GROUPS)
+    paginator = CursorPaginator(
+        Group.objects.select_related('stats').order_by('title', 'pk'),
+        GROUPS_PER_PAGE,
+        keys=('title', 'pk'),
+        cache_key=cache_key,
+        cache_timeout=FEED_CACHE_TIMEOUT
+    )
+    context = {
+        'page_obj': get_page_obj(request, paginator),
+        'feed_cache_key': cache_key,
+        'feed_cache_timeout': FEED_CACHE_TIMEOUT,
+    }
+    return render(request, 'posts/groups.html', context)
+
+
+@conditional(
+    lambda request, username: [
+        GROUPS, author_scope(get_author(request, username).pk)
+    ],
+    per_user=True
+)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()
-    paginator = Paginator(posts, POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    following = Follow.objects.filter(user=request.user.id, author=author)
+    author = get_author(request, username)
+    paginator = CursorPaginator(author.posts.for_feed(), POSTS_PER_PAGE)
+    user_id = request.user.id
+    # Страница и подписка не зависят друг от друга; счётчики автора
+    # уже пришли вместе с ним.
+    page_obj, following = gather(
+        lambda: get_page_obj(request, paginator),
+        lambda: Follow.objects.filter(
+            user=user_id, author=author
+        ).exists()
+    )
     context = {
         'author': author,
         'page_obj': page_obj,
-        'page_number': posts,
+        'stats': AuthorStats.objects.for_user(author),
         'following': following
     }
     return render(request, 'posts/profile.html', context)
 
 
+@conditional(
+    lambda request, post_id: [
+        GROUPS,
+        post_scope(post_id),
+        author_scope(get_post(request, post_id).author_id)
+    ],
+    per_user=True
+)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_post(request, post_id)
     author = post.author
-    posts = author.posts.all()
     pub_date = post.pub_date
     form = CommentForm(request.POST or None)
-    comments = post.comments.all()
+    comments = get_comments_page(post.pk)
     context = {
         'post': post,
         'author': author,
         'pub_date': pub_date,
-        'posts': posts,
+        'stats': AuthorStats.objects.for_user(author),
         'form': form,
         'comments': comments
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+@conditional(lambda request, post_id: [post_scope(post_id)])
+def post_comments(request, post_id):
+    if not Post.objects.filter(pk=post_id).exists():
+        raise Http404
+    comments = get_comments_page(post_id, request.GET.get('cursor'))
+    return render(
+        request, 'includes/comment_list.html', {'comments': comments}
+    )
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    results, next_cursor = find(
+        query, request.GET.get('cursor'), SEARCH_RESULTS_PER_PAGE
+    )
+    context = {
+        'query': query,
+        'results': results,
+        'next_cursor': next_cursor,
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
+@transaction.atomic
 def post_create(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
     if form.is_valid():
@@ -101,6 +281,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
@@ -114,18 +295,17 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(posts, POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = TimelinePaginator(request.user, POSTS_PER_PAGE)
+    page_obj = get_page_obj(request, paginator)
     context = {
         'page_obj': page_obj,
-        'page_number': paginator
+        'events_enabled': settings.POST_EVENTS,
     }
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     flag = Follow.objects.filter(user=request.user, author=author).exists()
@@ -135,9 +315,67 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     flag = Follow.objects.filter(user=request.user, author=author)
     if flag.exists():
         flag.delete()
     return redirect('posts:profile', username=username)
+
+
+@login_required
+def export_data(request):
+    response = StreamingHttpResponse(
+        archive.stream(request.user), content_type='application/zip'
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{request.user.username}.zip"'
+    )
+    return response
+
+
+def events_response(request, posts, channels):
+    """Поток событий о постах posts новее ?after (pk первого поста на
+    странице) или, без него, новее самого свежего сейчас. Без
+    POST_EVENTS потоков нет."""
+    if not settings.POST_EVENTS:
+        raise Http404
+    after = request.GET.get('after')
+    if after is None:
+        after = posts.order_by('-pk').values_list('pk', flat=True).first()
+    try:
+        after = int(after or 0)
+    except ValueError:
+        return HttpResponseBadRequest('after должен быть числом')
+    response = StreamingHttpResponse(
+        events.stream(posts, channels, after),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Иначе nginx копит поток в буфере.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def index_events(request):
+    return events_response(request, Post.objects.all(), [events.INDEX])
+
+
+def group_events(request, slug):
+    group = get_group(request, slug)
+    return events_response(
+        request, group.group_posts.all(), [events.group_channel(group.pk)]
+    )
+
+
+@login_required
+def follow_events(request):
+    authors = list(Follow.objects.filter(
+        user=request.user
+    ).values_list('author', flat=True))
+    return events_response(
+        request,
+        Post.objects.filter(author__in=authors),
+        [events.author_channel(author_id) for author_id in authors]
+    )
@@ -24,10 +24,13 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'users.apps.UsersConfig',
     'about.apps.AboutConfig',
+    'api.apps.ApiConfig',
     'sorl.thumbnail',
 ]
 
 MIDDLEWARE = [
+    'core.perf.PerfMiddleware',
+    'core.querybudget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -107,8 +110,137 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Процессов для фоновой подготовки миниатюр; 0 — считать сразу.
+POST_THUMBNAIL_WORKERS = int(os.getenv('YATUBE_THUMBNAIL_WORKERS', 2))
+
+# Потоков для параллельных частей view (core.concurrency); 0 — по очереди.
+VIEW_WORKERS = int(os.getenv('YATUBE_VIEW_WORKERS', 0))
+
+# Сколько секунд читатели журнала изменений ждут свежие записи: на
+# PostgreSQL и MySQL номера могут коммититься не по порядку. SQLite
+# пишет по одной транзакции, ему ждать не нужно.
+CHANGE_LOG_LAG = float(os.getenv('YATUBE_CHANGE_LOG_LAG', 0))
+
+# Уведомления о новых постах (SSE). Поток держит поток сервера и
+# соединение с БД, поэтому включайте только с потоковыми воркерами.
+# Как часто поток проверяет журнал изменений (посты из других
+# процессов) и сколько живёт соединение.
+POST_EVENTS = os.getenv('YATUBE_EVENTS', '') == '1'
+POST_EVENTS_POLL_INTERVAL = int(os.getenv('YATUBE_EVENTS_POLL', 15))
+POST_EVENTS_LIFETIME = int(os.getenv('YATUBE_EVENTS_LIFETIME', 300))
+
+# Доля запросов, для которых PerfMiddleware собирает замеры; 0 — выключено.
+PERF_SAMPLE_RATE = float(os.getenv('YATUBE_PERF_SAMPLE_RATE', 0))
+
+# Сколько SQL-запросов может сделать маршрут, включая сессию и
+# пользователя. Превышение пишется в лог yatube.queries, а в строгом
+# режиме (его включает тестовый раннер) роняет запрос.
+QUERY_BUDGETS = {
+    'posts:index': 4,
+    'posts:group_index': 3,
+    'posts:group_posts': 5,
+    'posts:profile': 6,
+    'posts:post_detail': 4,
+    'posts:post_comments': 5,
+    'posts:follow_index': 7,
+    'posts:search': 7,
+    'posts:post_create': 30,
+    'posts:post_edit': 19,
+    'posts:add_comment': 22,
+    'posts:profile_follow': 22,
+    'posts:profile_unfollow': 22,
+    'api:post_list': 5,
+    'api:group_posts': 6,
+    'api:profile_posts': 6,
+    'api:post_detail': 3,
+    'api:post_comments': 6,
+    'api:post_changes': 2,
+    'api:group_changes': 3,
+    'api:profile_changes': 3,
+    'api:follow_changes': 5,
+}
+# Потоковые ответы делают запросы уже после middleware, бюджет к ним
+# неприменим.
+QUERY_BUDGET_EXEMPT = {
+    'posts:export_data',
+    'posts:index_events',
+    'posts:group_events',
+    'posts:follow_events',
+}
+QUERY_BUDGET_STRICT = False
+TEST_RUNNER = 'core.querybudget.StrictQueryBudgetRunner'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'yatube.queries': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'yatube.perf': {
+            'handlers': ['console'],
+            'level': os.getenv('YATUBE_PERF_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# Поиск: fts5 (SQLite FTS5), index (таблица SearchTerm) или auto.
+SEARCH_BACKEND = os.getenv('YATUBE_SEARCH', 'auto')
+
+# locmem — свой кеш у каждого процесса; file и sqlite — общий кеш
+# для всех воркеров на машине. Счётчики поколений лент атомарно
+# увеличивает только sqlite.
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'sqlite': 'core.cache.SQLiteCache',
+}
+CACHE_LOCATIONS = {
+    'locmem': 'yatube',
+    'file': os.path.join(BASE_DIR, 'cache'),
+    'sqlite': os.path.join(BASE_DIR, 'cache.sqlite3'),
+}
+CACHE_BACKEND = os.getenv('YATUBE_CACHE', 'locmem')
+
+# С locmem счётчики поколений свои у каждого процесса: изменение в
+# одном воркере не сбрасывает ленты и ETag другого, поэтому там ленты
+# живут недолго, а ETag и Last-Modified сдвигаются раз в
+# FEED_CACHE_TIMEOUT. Общий кеш сбрасывается поколениями, TTL можно
+# держать длинным.
+CACHE_SHARED = CACHE_BACKEND != 'locmem'
+FEED_CACHE_TIMEOUT = int(os.getenv(
+    'YATUBE_FEED_CACHE_TIMEOUT', 60 * 60 if CACHE_SHARED else 20
+))
+
+PERF_CACHE_LOCATIONS = {
+    'locmem': 'yatube-perf',
+    'file': os.path.join(BASE_DIR, 'cache-perf'),
+    'sqlite': os.path.join(BASE_DIR, 'perf.sqlite3'),
+}
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.getenv(
+            'YATUBE_CACHE_LOCATION', CACHE_LOCATIONS[CACHE_BACKEND]
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('YATUBE_CACHE_MAX_ENTRIES', 10000)),
+        },
+    },
+    # Гистограммы PerfMiddleware отдельно от лент: вытеснение записей
+    # лент не стирает счётчики. Собрать их со всех процессов может
+    # только общий кеш (YATUBE_CACHE=sqlite).
+    'perf': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.getenv(
+            'YATUBE_PERF_CACHE_LOCATION', PERF_CACHE_LOCATIONS[CACHE_BACKEND]
+        ),
+    },
 }